@@ -1,35 +1,58 @@
 from typing import Annotated, Optional, Literal, List
 from typing_extensions import TypedDict
+from pydantic import BaseModel, Field
 
 # Core LangGraph imports
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 
 # Core LangChain imports
-from langchain.schema.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain.schema.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
 from langchain_openai import ChatOpenAI
-from openai import RateLimitError
 
 # Import modules from the project
 # import sys
 # import os
 import traceback
+import asyncio
+import uuid
 import time
+import contextvars
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
 # target_dir = os.path.abspath('D:/Github/Purwadhika-AI-Engineering-Bootcamp/Capstone Project/Module 3/CinephileGPT/')
 # sys.path.append(target_dir)
 
 # Imports from db
-from db.qdrant_database import qdrant_tools
+from db.qdrant_database import qdrant_tools, bootstrap, get_embeddings, on_catalog_change
 from db.hybrid_search import hybrid_tools
 from db.sql_database import mysql_tools
+from db.result_projection import result_lookup, compact_tool_result, resolve_result
 
 # API Key
 from utils.api_keys import OPENAI_API_KEY
 from utils.logger import log
+from utils.tracing import span, start_turn, traced, record_llm_usage, current_span, exclude_from_span
+from utils.rate_limiter import llm_limiter, estimate_tokens, turn_deadline, extend_deadline
+from agents.task_classifier import classify_task, classify_by_rules
+from agents.memory import BoundedMemorySaver, compact_history
+from agents.response_cache import SemanticResponseCache, is_error_result
+from agents.tool_plan import ToolPlan, PlanError, MAX_PLAN_STEPS, plan_levels, references, resolve_args, describe_tools
 
-model = ChatOpenAI(model="gpt-4o", temperature=0, api_key=OPENAI_API_KEY)
+# Retries are left to the shared rate limiter, see traced_invoke
+model = ChatOpenAI(model="gpt-4o", temperature=0, api_key=OPENAI_API_KEY, max_retries=0)
+
+# "combined" routes each turn with one structured LLM call (router_node),
+# "legacy" keeps the separate intern_node -> classify_node calls
+ROUTER_MODE = "combined"
+
+# "react" calls the model after every round of tool results (tool_node),
+# "plan" asks for all tool calls up front, runs them and calls the model once more to answer (plan_node)
+TOOL_MODE = "react"
+
+# Serve near-duplicate context-free prompts from the semantic response cache
+USE_RESPONSE_CACHE = True
 
 # State definition for the intern agent --------------------------------------
 
@@ -41,86 +64,47 @@ class State(TypedDict):
     task_classification: Literal["Numeric", "Semantic", "Hybrid", "Unknown"]
     tool_intent        : Optional[bool]
     allowed_tools      : Optional[list]
+    router_fallback    : Optional[bool] # The router's output could not be parsed this turn
 
 
 # Tools dictionary for the intern agent --------------------------------------
 
 TOOLS = {
-    "Semantic": qdrant_tools,
-    "Numeric" : mysql_tools,
-    "Hybrid"  : hybrid_tools + mysql_tools + qdrant_tools,
+    "Semantic": qdrant_tools + [result_lookup],
+    "Numeric" : mysql_tools + [result_lookup],
+    "Hybrid"  : hybrid_tools + mysql_tools + qdrant_tools + [result_lookup],
 }
 
 
 # Classifer node and function for the intern agent --------------------------------------
 
+@traced("classify_node")
 def classify_response(state: State):
     log("Classifying response...")
 
     # Access the current task from the state
     current_task = state.get("current_task", "No tasks provided.")
 
-    # Task is classified as Numeric, Semantic, or Hybrid
-    # is_numeric = is_numeric_task(current_task)
-    # is_semantic = is_semantic_task(current_task)
-
-    # if is_numeric and not is_semantic:
-    #     task_class = "Numeric"
-    # elif is_semantic and not is_numeric:
-    #     task_class = "Semantic"
-    # elif is_numeric and is_semantic:
-    #     task_class = "Hybrid"
-    # else:
-    task_class = classify_with_llm(current_task)
+    # Task is classified by cache, keyword rules, or the LLM as a last resort
+    task_class = classify_task(current_task, classify_with_llm)
 
     if task_class == "Unknown":
-        system_prompt = SystemMessage(
-            content="""
-            Task classification has failed. Please ask for more clarity regarding the query and do not invoke any tool calls. Also ignore the following system message.
-            """
-        )
-        return {"messages": [system_prompt], "task_classification": "Hybrid"} # Default to hybrid so code doesn't break
+        return unknown_classification_update()
 
 
     return {"task_classification": task_class}
 
 
-# Helper functions for task classification --------------------------------------
+def unknown_classification_update() -> dict:
+    system_prompt = SystemMessage(
+        content="""
+        Task classification has failed. Please ask for more clarity regarding the query and do not invoke any tool calls. Also ignore the following system message.
+        """
+    )
+    return {"messages": [system_prompt], "task_classification": "Hybrid"} # Default to hybrid so code doesn't break
 
-def is_numeric_task(task: str) -> bool:
-    numeric_keywords = [
-        "how many", "count", "total", "number of",
-        "top", "highest", "lowest", "rank",
-        "average", "avg", "mean", "median",
-        "sum", "total gross", "box office",
-        "max", "maximum", "min", "minimum",
-        "greater than", "less than", "over", "under",
-        "rating above", "rating below",
-        "filter by", "sort by",
-        ]
-    log("Checking for numeric keywords...")
-    for keyword in numeric_keywords:
-        if keyword in task.lower():
-            return True
-    return False
-
-def is_semantic_task(task: str) -> bool:
-    semantic_keywords = [
-        "similar to", "like this movie", "movies like", 
-        "same vibe", "feel like", "feels like",
-        "similar vibe", "vibes of", "same style as",
-        "if i liked", "recommend based on", 
-        "similar story to", "like", 
-        "emotionally similar", "thematic",
-        "plot like", "about", "story of", "feeling of",
-        "movies with similar", 
-        "semantic", "meaning", "contextual", "vibe", "feeling"
-    ]
-    log("Checking for semantic keywords...")
-    for keyword in semantic_keywords:
-        if keyword in task.lower():
-            return True
-    return False
+
+# Helper functions for task classification --------------------------------------
 
 def check_intent(state: State) -> str:
     intent = state.get("tool_intent")
@@ -128,6 +112,11 @@ def check_intent(state: State) -> str:
         return "classify_node"
     return "intern_node"
 
+def check_route(state: State) -> str:
+    if state.get("tool_intent"):
+        return "tool_node"
+    return "router_node"
+
 def classify_with_llm(task: str) -> Literal["Numeric", "Semantic", "Hybrid"]:
     message = f"""
     You are a ChatBot tasked with classifying the following prompts into one of four categories: "Numeric", "Semantic", "Hybrid", or "Unknown". The prompt will most likely be related to movie information retrieval.
@@ -143,7 +132,7 @@ def classify_with_llm(task: str) -> Literal["Numeric", "Semantic", "Hybrid"]:
     """
 
     log("Classifying task with LLM...")
-    response = model.invoke([HumanMessage(content=message)])
+    response = traced_invoke(model, [HumanMessage(content=message)], "llm.classify")
     classification = response.content.strip().strip('"')
     if classification in ["Numeric", "Semantic", "Hybrid"]:
         log(f"User prompt has been classified as: {classification}")
@@ -155,6 +144,7 @@ def classify_with_llm(task: str) -> Literal["Numeric", "Semantic", "Hybrid"]:
 # Nodes for the intern agent graph --------------------------------------
 
 
+@traced("intern_node")
 def intern_node(state: State):
     log("Using intern node...")
     system_prompt =  SystemMessage(
@@ -170,7 +160,7 @@ def intern_node(state: State):
         Do not mix JSON and text in the same response.
 
         """)
-    response = model.invoke(state["messages"] + [system_prompt])
+    response = traced_invoke(model, compact_history(state["messages"]) + [system_prompt], "llm.intent")
     content = response.content.strip()
 
     try:
@@ -185,75 +175,405 @@ def intern_node(state: State):
         return {"messages": [response], "tool_intent": False}
 
 
+TOOL_SYSTEM_PROMPT = SystemMessage(
+    content="""
+    Given the previous prompt, please use the appropriate tools to answer it. Include your reasoning steps for using the tools.
+    You can use tools sequentally. If you no longer need tools, just provide a reply without attaching a tool call.
+    Limit yourself to 4 total tool calls to answer a single user query.
+
+    For context here are all available columns from the databases:
+    movie_id, Poster_Link, Series_Title, Released_Year, Certificate, Runtime, Genre, IMDB_Rating, Overview, Meta_score, Director, Star1, Star2, Star3, Star4, No_of_Votes, Gross
+    """)
+
+PLAN_SYSTEM_PROMPT = """
+    Given the previous prompt, plan every tool call needed to answer it before any of them runs. Steps run as soon as
+    the steps they reference have finished, and independent steps run in parallel, so don't wait for results you can plan around.
+    Write each step's arguments as a JSON object string in args_json. To pass an earlier step's output as an argument, use a reference string instead of a value:
+    - "$s1" is the whole result of step s1, e.g. for sql_json / qdrant_json of hybrid_intersection_top_movies
+    - "$s1.movie_id" is the list of movie ids in the rows of s1 ("id" works too), "$s1.Series_Title" the titles, and so on
+    - "$s1.movie_id[0]" is the first of those values
+    Use at most {max_steps} steps. If the query needs no tools, return an empty plan.
+
+    For context here are all available columns from the databases:
+    movie_id, Poster_Link, Series_Title, Released_Year, Certificate, Runtime, Genre, IMDB_Rating, Overview, Meta_score, Director, Star1, Star2, Star3, Star4, No_of_Votes, Gross
+
+    Available tools:
+    {tools}
+    """
+
+PLAN_ANSWER_SYSTEM_PROMPT = SystemMessage(
+    content="""
+    The tool results above were gathered for the previous user query. Answer it now using these results,
+    without calling any more tools. If a step failed, work with what the other steps returned.
+    """)
+
+# Limits for the async tool node
+TOOL_TIMEOUT = 30         # Seconds allowed per tool call
+MAX_TOOL_CONCURRENCY = 4  # Tool calls running at the same time
+
+
+class RouterDecision(BaseModel):
+    """Routing decision for the latest user query."""
+    tool_intent: bool = Field(description="True if answering requires a movie database lookup or any other tool.")
+    task_classification: Literal["Numeric", "Semantic", "Hybrid", "Unknown"] = Field(
+        description="Numeric, Semantic or Hybrid when tool_intent is true, otherwise Unknown."
+    )
+    reply: str = Field(description="Conversational reply to the user when tool_intent is false, otherwise an empty string.")
+    allowed_tools: List[str] = Field(
+        default_factory=list,
+        description="Names of the tools the query needs, from the tools listed for its classification. Empty allows all of them."
+    )
+
+
+ROUTER_SYSTEM_PROMPT = SystemMessage(
+    content="""
+    For the previous user query, decide in one step how to handle it.
+
+    - If the query does NOT require tool use, set tool_intent to false, task_classification to "Unknown" and write your conversational reply in reply.
+    - If the query clearly requires an external tool (such as database lookup, API call, math operation, etc.), set tool_intent to true, leave reply empty and classify it:
+        - "Numeric" tasks involve retrieving numerical data or statistics from structured databases (e.g., counts, rankings, averages) and are related to the columns: IMDB Rating, Meta Score, No_of_votes, Gross, and Certificate (A, U, UA, PG-13).
+        - "Semantic" tasks involve finding semantically relevant information using vector databases, such as recommendations based on movie content, genres, directors, or actors.
+        - "Hybrid" tasks require a combination of both numeric and semantic approaches to provide a comprehensive response.
+        - "Unknown" if the request is too unclear to classify.
+
+    The following are the relevant column names available in the movie database: Series_Title,Released_Year,Certificate,Genre,IMDB_Rating,Overview,Meta_score,Director,Star1,Star2,Star3,Star4,No_of_Votes,Gross
+
+    When you are sure which tools the query needs, list their names in allowed_tools, otherwise leave it empty.
+    Tools per classification:
+    """ + "\n".join(f"    - {task_class}: {', '.join(tool.name for tool in tools)}" for task_class, tools in TOOLS.items()))
+
+ROUTER_FALLBACK_REPLY = "Sorry, I couldn't work out how to handle that request. Could you rephrase it or add a bit more detail?"
+
+
+@traced("router_node")
+def router_node(state: State):
+    log("Using router node...")
+    output = structured_invoke(RouterDecision, compact_history(state["messages"]) + [ROUTER_SYSTEM_PROMPT], "llm.router")
+
+    decision = output["parsed"]
+    if decision is None:
+        log(f"Router output could not be parsed: {output['parsing_error']}")
+        return {**router_fallback_update(state), "router_fallback": True}
+
+    if not decision.tool_intent:
+        log("Intent not detected.")
+        return {"messages": [AIMessage(content=decision.reply)], "tool_intent": False, "router_fallback": False}
+
+    log("Intent detected.")
+    task_class = decision.task_classification
+    if task_class == "Unknown":
+        # Confident keyword rules can still rescue the classification
+        task_class = classify_by_rules(state.get("current_task", ""))
+    if task_class == "Unknown":
+        return {**unknown_classification_update(), "tool_intent": True, "allowed_tools": None, "router_fallback": False}
+
+    log(f"User prompt has been classified as: {task_class}")
+    return {
+        "tool_intent"        : True,
+        "task_classification": task_class,
+        "allowed_tools"      : narrowed_tools(task_class, decision.allowed_tools),
+        "router_fallback"    : False,
+    }
+
+
+def router_fallback_update(state: State) -> dict:
+    # Without a parsed decision, confident keyword rules route the turn; otherwise ask the user to rephrase
+    task_class = classify_by_rules(state.get("current_task", ""))
+    if task_class == "Unknown":
+        return {"messages": [AIMessage(content=ROUTER_FALLBACK_REPLY)], "tool_intent": False}
+
+    log(f"User prompt has been classified as: {task_class}")
+    return {"tool_intent": True, "task_classification": task_class, "allowed_tools": None}
+
+
+def narrowed_tools(task_class: str, names: list):
+    # Only names from the classification's tool set count; None allows the whole set
+    available = {tool.name for tool in TOOLS[task_class]}
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        log(f"Router named tools outside {task_class}: {unknown}")
+
+    kept = [name for name in names if name in available]
+    if not kept:
+        return None
+    # Compacted results stay readable through result_lookup
+    return kept + [result_lookup.name] if result_lookup.name not in kept else kept
+
+
+@traced("tool_node")
 def tool_node(state: State):
     log("Using tool node...")
-    task_classification = state["task_classification"]
-    allowed_tools = TOOLS[task_classification]
+    allowed_tools = resolve_allowed_tools(state)
     model_with_tools = model.bind_tools(allowed_tools)
-    
-    system_prompt = SystemMessage(
-        content="""
-        Given the previous prompt, please use the appropriate tools to answer it. Include your reasoning steps for using the tools.
-        You can use tools sequentally. If you no longer need tools, just provide a reply without attaching a tool call.
-        Limit yourself to 4 total tool calls to answer a single user query.
 
-        For context here are all available columns from the databases:
-        movie_id, Poster_Link, Series_Title, Released_Year, Certificate, Runtime, Genre, IMDB_Rating, Overview, Meta_score, Director, Star1, Star2, Star3, Star4, No_of_Votes, Gross
-        """)
-    
-    response = safe_invoke(model_with_tools, state["messages"] + [system_prompt])
+    response = safe_invoke(model_with_tools, compact_history(state["messages"]) + [TOOL_SYSTEM_PROMPT])
 
     if not getattr(response, "tool_calls", None):
         return {"messages": [response]}
-    
+
+    results = []
+    for call, tool in plan_tool_calls(response, allowed_tools):
+        results.append((call, tool, run_tool_call(tool, call, state)))
+
+    return merge_tool_results(state, response, results)
+
+
+@traced("tool_node")
+async def atool_node(state: State):
+    log("Using async tool node...")
+    allowed_tools = resolve_allowed_tools(state)
+    model_with_tools = model.bind_tools(allowed_tools)
+
+    response = await asafe_invoke(model_with_tools, compact_history(state["messages"]) + [TOOL_SYSTEM_PROMPT])
+
+    if not getattr(response, "tool_calls", None):
+        return {"messages": [response]}
+
+    # Independent tool calls fan out concurrently, results are merged in call order
+    semaphore = asyncio.Semaphore(MAX_TOOL_CONCURRENCY)
+    planned = plan_tool_calls(response, allowed_tools)
+    outputs = await asyncio.gather(*[arun_tool_call(tool, call, state, semaphore) for call, tool in planned])
+
+    results = [(call, tool, result) for (call, tool), result in zip(planned, outputs)]
+    return merge_tool_results(state, response, results)
+
+
+@traced("tool_node")
+def plan_node(state: State):
+    log("Using plan node...")
+    allowed_tools = resolve_allowed_tools(state)
+    history = compact_history(state["messages"])
+
+    output = structured_invoke(ToolPlan, plan_messages(history, allowed_tools), "llm.plan")
+    levels = checked_levels(output, allowed_tools)
+    if levels is None:
+        return tool_node.__wrapped__(state) # Same node span, no need for another
+
+    results = execute_plan(levels, allowed_tools, state)
+    update = plan_update(state, results)
+
+    messages = compact_history(state["messages"] + update["messages"]) + [PLAN_ANSWER_SYSTEM_PROMPT]
+    answer = traced_invoke(model, messages, "llm.answer")
+    return {**update, "messages": update["messages"] + [answer]}
+
+
+@traced("tool_node")
+async def aplan_node(state: State):
+    log("Using async plan node...")
+    allowed_tools = resolve_allowed_tools(state)
+    history = compact_history(state["messages"])
+
+    output = await astructured_invoke(ToolPlan, plan_messages(history, allowed_tools), "llm.plan")
+    levels = checked_levels(output, allowed_tools)
+    if levels is None:
+        return await atool_node.__wrapped__(state)
+
+    results = await aexecute_plan(levels, allowed_tools, state)
+    update = plan_update(state, results)
+
+    messages = compact_history(state["messages"] + update["messages"]) + [PLAN_ANSWER_SYSTEM_PROMPT]
+    answer = await atraced_invoke(model, messages, "llm.answer")
+    return {**update, "messages": update["messages"] + [answer]}
+
+
+# Helper functions for tool execution --------------------------------------
+
+def resolve_allowed_tools(state: State) -> list:
+    # The router may narrow the classification's tool set by name
+    tools = TOOLS[state["task_classification"]]
+    names = state.get("allowed_tools")
+    if names:
+        tools = [tool for tool in tools if tool.name in names] or tools
+    return tools
+
+
+def plan_tool_calls(response, allowed_tools) -> list:
+    # Pairs each tool call with the allowed tool of the same name
+    planned = []
+    for call in response.tool_calls:
+        for tool in allowed_tools:
+            if tool.name == call["name"]:
+                log(f"Using tool: {call['name']}")
+                log(f"Planned arguments: {call['args']}")
+                planned.append((call, tool))
+    return planned
+
+
+def run_tool_call(tool, call, state: State):
+    with span("tool", tool=tool.name) as record:
+        result = _run_tool_call(tool, call, state)
+        record["attributes"]["result_chars"] = len(str(result))
+        return result
+
+
+def _run_tool_call(tool, call, state: State):
+    # Special case for hybrid tool calling
+    if tool.name == "hybrid_intersection_top_movies":
+        # Arguments a plan resolved from step references are used, otherwise the latest results in state.
+        # State keeps result handles, the hybrid tool needs the full JSON behind them
+        args, resolved = call["args"], call.get("resolved") or ()
+        sql_json = args["sql_json"] if "sql_json" in resolved else (resolve_result(state["last_sql_result"][-1]) if state.get("last_sql_result") else None)
+        qdrant_json = args["qdrant_json"] if "qdrant_json" in resolved else (resolve_result(state["last_qdrant_result"][-1]) if state.get("last_qdrant_result") else None)
+
+        if not sql_json or not qdrant_json:
+            return "Error: Cannot run hybrid search without previous SQL and Qdrant tool outputs."
+
+        return tool.invoke({
+            "sql_json": sql_json,
+            "qdrant_json": qdrant_json
+        })
+
+    try:
+        return tool.invoke(call["args"])
+    except Exception as e:
+        return f"Tool execution error: {e}"
+
+
+async def arun_tool_call(tool, call, state: State, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(run_tool_call, tool, call, state), TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            log(f"Tool {tool.name} timed out.")
+            return f"Tool execution error: {tool.name} timed out after {TOOL_TIMEOUT} seconds."
+        except Exception as e:
+            return f"Tool execution error: {e}"
+
+
+def result_key(tool):
+    # Detect if tool comes from SQL or Qdrant
+    if tool.name == "hybrid_intersection_top_movies":
+        return None
+    if "sql_" in tool.name.lower():
+        return "last_sql_result"
+    if "qdrant_" in tool.name.lower():
+        return "last_qdrant_result"
+    return None
+
+
+def merge_tool_results(state: State, response, results: list):
     tool_messages = []
     new_state_updates = {}
 
-    for call in response.tool_calls:
-        tool_name = call["name"]
-        tool_args = call["args"]
+    for call, tool, result in results:
+        # The model sees a compact projection, the full result stays in the side store.
+        # Tools can name columns the projection must keep in their metadata
+        content, stored = compact_tool_result(result, (tool.metadata or {}).get("keep_columns"))
 
-        # Find tool that was called
-        for tool in allowed_tools:
+        key = result_key(tool)
+        if key:
+            existing = new_state_updates.get(key, state.get(key) or [])
+            new_state_updates[key] = existing + [stored]
 
-            if tool.name == tool_name:
-                log(f"Using tool: {tool_name}")
-                log(f"Planned arguments: {tool_args}")
-                # Special case for hybrid tool calling
-                if tool.name == "hybrid_intersection_top_movies":
-                    sql_json = state.get("last_sql_result", [])[-1] if state.get("last_sql_result") else None
-                    qdrant_json = state.get("last_qdrant_result", [])[-1] if state.get("last_qdrant_result") else None
-
-                    if not sql_json or not qdrant_json:
-                        result = "Error: Cannot run hybrid search without previous SQL and Qdrant tool outputs."
-                    else:
-                        result = tool.invoke({
-                            "sql_json": sql_json,
-                            "qdrant_json": qdrant_json
-                        })
-
-                else:
-                    try:
-                        result = tool.invoke(tool_args)
-                    except Exception as e:
-                        result = f"Tool execution error: {e}"
-
-                    # Detect if tool comes from SQL or Qdrant
-                    if "sql_" in tool_name.lower():
-                        existing = state.get("last_sql_result", [])
-                        new_state_updates["last_sql_result"] = existing + [result]
-
-                    elif "qdrant_" in tool_name.lower():
-                        existing = state.get("last_qdrant_result", [])
-                        new_state_updates["last_qdrant_result"] = existing + [result]
-
-                tool_messages.append(
-                    ToolMessage(content=str(result), tool_call_id=call["id"])
-                )
+        tool_messages.append(
+            ToolMessage(content=content, tool_call_id=call["id"])
+        )
 
     return {"messages": [response] + tool_messages, **new_state_updates}
 
 
+# Helper functions for plan execution --------------------------------------
+
+def plan_messages(history: list, allowed_tools: list) -> list:
+    prompt = PLAN_SYSTEM_PROMPT.format(max_steps=MAX_PLAN_STEPS, tools=describe_tools(allowed_tools))
+    return history + [SystemMessage(content=prompt)]
+
+
+def checked_levels(output: dict, allowed_tools: list):
+    # Levels of a valid plan, or None to fall back to step-by-step tool calls
+    plan = output["parsed"]
+    if plan is None:
+        log(f"Plan could not be parsed: {output['parsing_error']}")
+        return None
+    try:
+        levels = plan_levels(plan, {tool.name for tool in allowed_tools})
+    except PlanError as e:
+        log(f"Plan rejected: {e}")
+        return None
+
+    log(f"Planned {len(plan.steps)} tool calls in {len(levels)} levels.")
+    for step in plan.steps:
+        log(f"Step {step.id}: {step.tool} {step.args}")
+    return levels
+
+
+def planned_call(step, outputs: dict) -> tuple:
+    # Returns (call, error); the call carries the arguments with references resolved,
+    # and "resolved" names the arguments that came from earlier steps
+    call = {"name": step.tool, "args": step.args, "id": f"call_{uuid.uuid4().hex[:24]}"}
+    try:
+        call["args"] = resolve_args(step.args, outputs)
+        call["resolved"] = [key for key, value in step.args.items() if references(value)]
+        return call, None
+    except PlanError as e:
+        return call, f"Tool execution error: {e}"
+
+
+def _run_planned(tool, call, state: State):
+    try:
+        return run_tool_call(tool, call, state)
+    except Exception as e:
+        return f"Tool execution error: {e}"
+
+
+def _record_level(planned: list, results: list, tools: dict, outputs: dict, executed: list, running: dict):
+    for (step, call, _), result in zip(planned, results):
+        tool = tools[step.tool]
+        outputs[step.id] = result
+        # History keeps the planned arguments, references stay short where resolved values can be whole results
+        executed.append(({"name": call["name"], "args": step.args, "id": call["id"]}, tool, result))
+        # Later levels see earlier results in state, e.g. the hybrid tool without arguments
+        key = result_key(tool)
+        if key:
+            running[key] = (running.get(key) or []) + [result]
+
+
+def execute_plan(levels: list, allowed_tools: list, state: State) -> list:
+    """Runs the plan level by level, steps within a level in parallel. Returns (call, tool, result) in plan order."""
+    tools = {tool.name: tool for tool in allowed_tools}
+    outputs, executed, running = {}, [], dict(state)
+
+    for level in levels:
+        planned = [(step, *planned_call(step, outputs)) for step in level]
+        with span("plan.level", steps=len(level)):
+            jobs = [(tools[step.tool], call) for step, call, error in planned if error is None]
+            if len(jobs) > 1:
+                with ThreadPoolExecutor(max_workers=min(len(jobs), MAX_TOOL_CONCURRENCY)) as executor:
+                    # Each job runs in a copy of this context so its spans join the turn
+                    futures = [executor.submit(contextvars.copy_context().run, _run_planned, tool, call, running) for tool, call in jobs]
+                    finished = iter([future.result() for future in futures])
+            else:
+                finished = iter([_run_planned(tool, call, running) for tool, call in jobs])
+            results = [error if error is not None else next(finished) for _, _, error in planned]
+        _record_level(planned, results, tools, outputs, executed, running)
+
+    return executed
+
+
+async def aexecute_plan(levels: list, allowed_tools: list, state: State) -> list:
+    tools = {tool.name: tool for tool in allowed_tools}
+    outputs, executed, running = {}, [], dict(state)
+    semaphore = asyncio.Semaphore(MAX_TOOL_CONCURRENCY)
+
+    for level in levels:
+        planned = [(step, *planned_call(step, outputs)) for step in level]
+        with span("plan.level", steps=len(level)):
+            jobs = [arun_tool_call(tools[step.tool], call, running, semaphore) for step, call, error in planned if error is None]
+            finished = iter(await asyncio.gather(*jobs))
+            results = [error if error is not None else next(finished) for _, _, error in planned]
+        _record_level(planned, results, tools, outputs, executed, running)
+
+    return executed
+
+
+def plan_update(state: State, executed: list) -> dict:
+    # One AI message with every planned call followed by the results, as if the model had called them itself
+    if not executed:
+        return {"messages": []}
+    response = AIMessage(content="", tool_calls=[call for call, _, _ in executed])
+    return merge_tool_results(state, response, executed)
+
+
 # Checks if the ReAct agent should loop  --------------------------------------
 
 def should_continue(state: State) -> bool:
@@ -270,16 +590,70 @@ def initial_check(state: State):
     return "intern_node"
 
 
-# Safe invoke in case of rate limits
+# Model invocation wrapped in a span with token usage. Every call goes through the
+# shared rate limiter, which retries rate limits and transient errors with backoff.
+
+COMPLETION_TOKEN_ESTIMATE = 500 # Budgeted per call until the real usage is known
+
+
+def settle_usage(estimated: int, response):
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        llm_limiter.settle(estimated, usage["total_tokens"])
+
+
+def traced_invoke(model, messages, name: str = "llm"):
+    estimated = estimate_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+    with span(name) as record:
+        response = llm_limiter.call(lambda: model.invoke(messages), estimated)
+        record_llm_usage(record, messages, response)
+        settle_usage(estimated, response)
+        return response
+
+
+async def atraced_invoke(model, messages, name: str = "llm"):
+    estimated = estimate_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+    with span(name) as record:
+        response = await llm_limiter.acall(lambda: model.ainvoke(messages), estimated)
+        record_llm_usage(record, messages, response)
+        settle_usage(estimated, response)
+        return response
+
+
+# Structured outputs (router decisions, tool plans) are JSON, not answer text: the "nostream"
+# tag keeps LangGraph from streaming their tokens, even when they run inside tool_node
+STRUCTURED_OUTPUT_TAGS = ["nostream"]
+
+
+def structured_invoke(schema, messages, name: str) -> dict:
+    # Returns {"raw", "parsed", "parsing_error"}
+    structured = model.with_structured_output(schema, include_raw=True).with_config(tags=STRUCTURED_OUTPUT_TAGS)
+    estimated = estimate_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+    with span(name) as record:
+        output = llm_limiter.call(lambda: structured.invoke(messages), estimated)
+        record_llm_usage(record, messages, output["raw"])
+        settle_usage(estimated, output["raw"])
+        return output
+
+
+async def astructured_invoke(schema, messages, name: str) -> dict:
+    structured = model.with_structured_output(schema, include_raw=True).with_config(tags=STRUCTURED_OUTPUT_TAGS)
+    estimated = estimate_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+    with span(name) as record:
+        output = await llm_limiter.acall(lambda: structured.ainvoke(messages), estimated)
+        record_llm_usage(record, messages, output["raw"])
+        settle_usage(estimated, output["raw"])
+        return output
+
+
+# Tool-calling invoke
 
 def safe_invoke(model, messages):
-    while True:
-        try:
-            return model.invoke(messages)
-        except RateLimitError as e:
-            wait = 5
-            log(f"Rate limit hit, retrying in {wait} seconds...")
-            time.sleep(wait)
+    return traced_invoke(model, messages, "llm.tools")
+
+
+async def asafe_invoke(model, messages):
+    return await atraced_invoke(model, messages, "llm.tools")
 
 
 # Initialize the intern agent graph --------------------------------------
@@ -306,38 +680,128 @@ system_prompt = SystemMessage(content="""
 """)
 
 
-intern_agent = StateGraph(State)
-intern_agent.add_node("intern_node", intern_node)
-intern_agent.add_node("classify_node", classify_response)
-intern_agent.add_node("tool_node", tool_node)
+def build_graph(tool_node_fn=tool_node, router_mode: str = ROUTER_MODE) -> StateGraph:
+    intern_agent = StateGraph(State)
+    intern_agent.add_node("tool_node", tool_node_fn)
+
+    if router_mode == "combined":
+        intern_agent.add_node("router_node", router_node)
+
+        intern_agent.add_conditional_edges(START, initial_check, {"Next": END, "intern_node": "router_node"})
+        intern_agent.add_conditional_edges("router_node", check_route, {
+            "tool_node": "tool_node",
+            "router_node": END
+        })
+
+    else:
+        intern_agent.add_node("intern_node", intern_node)
+        intern_agent.add_node("classify_node", classify_response)
+
+        intern_agent.add_conditional_edges(START, initial_check, {"Next": END, "intern_node": "intern_node"})
+        intern_agent.add_conditional_edges("intern_node", check_intent, {
+            "classify_node": "classify_node",
+            "intern_node": END
+        })
+        intern_agent.add_edge("classify_node", "tool_node")
 
+    intern_agent.add_conditional_edges("tool_node", should_continue, {
+        True: "tool_node",
+        False: END
+    })
 
-intern_agent.add_conditional_edges(START, initial_check, {"Next": END, "intern_node": "intern_node"})
-intern_agent.add_conditional_edges("intern_node", check_intent, {
-    "classify_node": "classify_node",
-    "intern_node": END
-})
-intern_agent.add_edge("classify_node", "tool_node")
-intern_agent.add_conditional_edges("tool_node", should_continue, {
-    True: "tool_node",
-    False: END
-})
+    return intern_agent
 
 
+intern_agent = build_graph(plan_node if TOOL_MODE == "plan" else tool_node)
+async_intern_agent = build_graph(aplan_node if TOOL_MODE == "plan" else atool_node) # Runs independent tool calls concurrently
 
-checkpoint = MemorySaver()
+# Per-thread memory bounded by LRU, TTL and total size
+checkpoint = BoundedMemorySaver(max_threads=200, ttl=3600, max_bytes=64 * 1024 * 1024)
 
 app = intern_agent.compile(checkpointer=checkpoint)
+async_app = async_intern_agent.compile(checkpointer=checkpoint)
+
+
+DEFAULT_THREAD_ID = "cinephile_cli"
+
+
+# Initial invoke to append system prompt, for new or evicted threads
+def ensure_thread(thread_id: str) -> dict:
+    config = {"configurable": {"thread_id": thread_id}}
+    if not app.get_state(config).values.get("messages"):
+        app.invoke({"messages": [system_prompt]}, config=config)
+    return config
+
+ensure_thread(DEFAULT_THREAD_ID)
+
+
+# Whole-answer cache, dropped whenever bootstrap() re-ingests changed movies
+response_cache = SemanticResponseCache(lambda prompt: get_embeddings().embed_query(prompt))
+on_catalog_change(response_cache.invalidate)
+
+
+def thread_values(config: dict) -> dict:
+    return app.get_state(config).values or {}
+
 
+# Cached answer for the prompt, recorded in the thread as a normal turn, or None.
+# Only a thread's first turn is served: later prompts are read in light of the conversation
+def cached_answer(user_input: str, config: dict):
+    if not USE_RESPONSE_CACHE:
+        return None
+    if any(isinstance(m, HumanMessage) for m in thread_values(config).get("messages") or []):
+        return None
+    try:
+        with span("response_cache.lookup") as record:
+            answer, similarity = response_cache.lookup(user_input)
+            record["attributes"].update(hit=answer is not None, similarity=round(similarity, 4))
+    except Exception as e:
+        log(f"Response cache unavailable: {e}")
+        return None
+
+    if answer is not None:
+        log(f"Answer served from the response cache (similarity {similarity:.3f})")
+        app.update_state(config, {
+            "messages": [HumanMessage(content=user_input), AIMessage(content=answer)],
+            "current_task": user_input,
+            "tool_intent": False
+        }, as_node="tool_node")
+    return answer
+
+
+# Stores the answer of a thread's first turn, unless the router fell back or a tool call failed
+def remember_answer(user_input: str, config: dict):
+    if not USE_RESPONSE_CACHE:
+        return
+    values = thread_values(config)
+    messages = values.get("messages") or []
+    humans = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if len(humans) != 1 or values.get("router_fallback"):
+        return
+    if any(isinstance(m, ToolMessage) and is_error_result(m.content) for m in messages[humans[0] + 1:]):
+        log("Answer not cached, a tool call failed during the turn.")
+        return
+
+    answer = messages[-1].content
+    if not isinstance(answer, str):
+        return
+    try:
+        response_cache.put(user_input, answer)
+    except Exception as e:
+        log(f"Response cache unavailable: {e}")
 
-# Initial invoke to append system prompt.
-app.invoke({"messages": [system_prompt]}, config={"configurable": {"thread_id": "cinephile_cli"}})
 
 # Interaction channel between AI and Streamlit
-def interact(user_input: str) -> str:
+def interact(user_input: str, turn_id: str = None, thread_id: str = DEFAULT_THREAD_ID) -> str:
     try:
-        response = app.invoke({"messages": [HumanMessage(content=user_input)], "current_task": user_input}, config={"configurable": {"thread_id": "cinephile_cli"}}) 
+        with start_turn(turn_id, prompt_chars=len(user_input)), turn_deadline():
+            config = ensure_thread(thread_id)
+            answer = cached_answer(user_input, config)
+            if answer is not None:
+                return answer
+            response = app.invoke({"messages": [HumanMessage(content=user_input)], "current_task": user_input}, config=config) 
         # log("CinephileGPT: ", response["messages"][-1].content)
+        remember_answer(user_input, config)
         return response["messages"][-1].content
            
     except Exception as e:
@@ -345,7 +809,103 @@ def interact(user_input: str) -> str:
         log(f"Exception detected: {e}")
         return traceback.print_exc()
 
+
+# Async interaction channel, tool calls within a turn run in parallel
+async def ainteract(user_input: str, turn_id: str = None, thread_id: str = DEFAULT_THREAD_ID) -> str:
+    try:
+        with start_turn(turn_id, prompt_chars=len(user_input)), turn_deadline():
+            config = ensure_thread(thread_id)
+            answer = cached_answer(user_input, config)
+            if answer is not None:
+                return answer
+            response = await async_app.ainvoke({"messages": [HumanMessage(content=user_input)], "current_task": user_input}, config=config)
+        remember_answer(user_input, config)
+        return response["messages"][-1].content
+
+    except Exception as e:
+        # Fallback error handling
+        log(f"Exception detected: {e}")
+        return traceback.print_exc()
+
+
+# Streaming interaction channel, yields events as the graph runs:
+#   {"type": "node",  "node": ...}            a node finished
+#   {"type": "tool",  "name": ..., "args": ...} the model called a tool
+#   {"type": "token", "content": ...}         answer text as it is generated
+#   {"type": "reset"}                         streamed text was tool-call reasoning, not the answer
+#   {"type": "final", "content": ...}         the final answer
+def turn_events(user_input: str, config: dict):
+    answer = cached_answer(user_input, config)
+    if answer is not None:
+        yield {"type": "node", "node": "response_cache"}
+        yield {"type": "final", "content": answer}
+        return
+
+    for mode, chunk in app.stream(
+        {"messages": [HumanMessage(content=user_input)], "current_task": user_input},
+        config=config,
+        stream_mode=["updates", "messages"]
+    ):
+        if mode == "messages":
+            message_chunk, metadata = chunk
+            # Router / intent outputs are JSON and tool results are not answer text,
+            # only the model inside tool_node writes the answer
+            is_model_output = message_chunk.type in ("ai", "AIMessageChunk")
+            if metadata.get("langgraph_node") == "tool_node" and is_model_output and message_chunk.content:
+                yield {"type": "token", "content": message_chunk.content}
+            continue
+
+        for node, update in chunk.items():
+            yield {"type": "node", "node": node}
+            messages = (update or {}).get("messages") or []
+            # Plan mode answers in the same update as its tool calls, keep that text
+            answered = bool(messages) and isinstance(messages[-1], AIMessage) and not messages[-1].tool_calls
+            for message in messages:
+                tool_calls = getattr(message, "tool_calls", None) or []
+                if tool_calls and not answered:
+                    yield {"type": "reset"}
+                for call in tool_calls:
+                    yield {"type": "tool", "name": call["name"], "args": call["args"]}
+
+    answer = app.get_state(config).values["messages"][-1].content
+    remember_answer(user_input, config)
+    yield {"type": "final", "content": answer}
+
+
+def interact_stream(user_input: str, turn_id: str = None, thread_id: str = DEFAULT_THREAD_ID):
+    # The turn span and deadline live in a context of their own that is only entered while the agent works,
+    # so they don't leak into the caller and the time the caller spends on each event isn't counted
+    turn_context = contextvars.copy_context()
+    scope = ExitStack()
+    events = None
+    try:
+        config = ensure_thread(thread_id)
+        turn_context.run(scope.enter_context, start_turn(turn_id, prompt_chars=len(user_input)))
+        turn_context.run(scope.enter_context, turn_deadline())
+        turn_span = turn_context.run(current_span)
+
+        events = turn_events(user_input, config)
+        while (event := turn_context.run(next, events, None)) is not None:
+            paused_at = time.monotonic()
+            yield event
+            paused = time.monotonic() - paused_at
+            turn_context.run(extend_deadline, paused)
+            exclude_from_span(turn_span, paused)
+
+    except Exception as e:
+        # Fallback error handling
+        turn_context.run(scope.__exit__, type(e), e, e.__traceback__)
+        log(f"Exception detected: {e}")
+        traceback.print_exc()
+        yield {"type": "final", "content": f"Something went wrong while answering: {e}"}
+
+    finally:
+        if events is not None:
+            turn_context.run(events.close)
+        turn_context.run(scope.close)
+
 if __name__ == "__main__": 
+    bootstrap()
     messages_list = []
     log("\n \n-------------------------------------------- \n \n")
     log("CinephileGPT Intern Agent is ready to assist you with movie-related tasks. Enter your task for the intern agent (or type 'exit' to quit).")
@@ -361,7 +921,7 @@ if __name__ == "__main__":
                 log(messages_list)
 
             else:
-                response = app.invoke({"messages": [HumanMessage(content=user_input)], "current_task": user_input}, config={"configurable": {"thread_id": "cinephile_cli"}}) 
+                response = app.invoke({"messages": [HumanMessage(content=user_input)], "current_task": user_input}, config=ensure_thread(DEFAULT_THREAD_ID)) 
                 log("CinephileGPT: ", response["messages"][-1].content)
                 messages_list = response["messages"]
 
@@ -0,0 +1,153 @@
+import time
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain.schema.messages import HumanMessage, SystemMessage, ToolMessage
+
+
+# Bounded checkpoint memory --------------------------------------
+#
+# MemorySaver keeps every checkpoint of every thread forever. This subclass keeps
+# only the last few checkpoints per thread (pruning the blobs they no longer
+# reference) and evicts whole threads by LRU, TTL and total size.
+
+
+class BoundedMemorySaver(MemorySaver):
+    def __init__(
+        self,
+        max_threads: int = 200,
+        ttl: float = 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_checkpoints_per_thread: int = 4
+    ):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+
+        self._last_access = OrderedDict() # thread_id -> monotonic time, least recent first
+        self._sizes = {}                  # thread_id -> approximate serialized bytes
+        self._bound_lock = threading.RLock()
+        self.evictions = 0
+
+
+    # Saver interface --------------------------------------
+
+    def get_tuple(self, config):
+        with self._bound_lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._bound_lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id)
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+            self._evict(keep=thread_id)
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._bound_lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._bound_lock:
+            super().delete_thread(thread_id)
+            self._last_access.pop(thread_id, None)
+            self._sizes.pop(thread_id, None)
+
+
+    # Bounds --------------------------------------
+
+    def _touch(self, thread_id):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _prune(self, thread_id, checkpoint_ns):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+
+        # Checkpoint ids sort chronologically, drop all but the newest few
+        for checkpoint_id in sorted(checkpoints)[:-self.max_checkpoints_per_thread]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        referenced = set()
+        for saved_checkpoint, _, _ in checkpoints.values():
+            for channel, version in self.serde.loads_typed(saved_checkpoint)["channel_versions"].items():
+                referenced.add((thread_id, checkpoint_ns, channel, version))
+
+        size = 0
+        for key in [k for k in self.blobs if k[0] == thread_id]:
+            if key[1] == checkpoint_ns and key not in referenced:
+                del self.blobs[key]
+            else:
+                size += len(self.blobs[key][1])
+
+        for namespace in self.storage[thread_id].values():
+            for saved_checkpoint, saved_metadata, _ in namespace.values():
+                size += len(saved_checkpoint[1]) + len(saved_metadata[1])
+
+        self._sizes[thread_id] = size
+
+    def _evict(self, keep):
+        now = time.monotonic()
+        while self._last_access:
+            thread_id, last_access = next(iter(self._last_access.items()))
+            if thread_id == keep:
+                break
+
+            over_threads = len(self._last_access) > self.max_threads
+            over_bytes = sum(self._sizes.values()) > self.max_bytes
+            expired = now - last_access > self.ttl
+            if not (over_threads or over_bytes or expired):
+                break
+
+            self.delete_thread(thread_id)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._bound_lock:
+            return {
+                "threads"  : len(self._last_access),
+                "bytes"    : sum(self._sizes.values()),
+                "evictions": self.evictions,
+            }
+
+
+# History compaction --------------------------------------
+#
+# Applied to the messages sent to the model, not to the stored state: only the
+# last few user turns are kept and tool results from earlier turns are truncated.
+
+HISTORY_MAX_TURNS = 6
+OLD_TOOL_RESULT_CHARS = 400
+
+
+def compact_history(messages: list) -> list:
+    first_human = next((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), len(messages))
+    preamble = [m for m in messages[:first_human] if isinstance(m, SystemMessage)]
+
+    # Split the conversation into turns, each starting at a user message
+    turns = []
+    for message in messages[first_human:]:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+
+    turns = turns[-HISTORY_MAX_TURNS:]
+
+    compacted = list(preamble)
+    for index, turn in enumerate(turns):
+        is_current_turn = index == len(turns) - 1
+        for message in turn:
+            content = str(message.content)
+            if not is_current_turn and isinstance(message, ToolMessage) and len(content) > OLD_TOOL_RESULT_CHARS:
+                message = message.model_copy(update={"content": content[:OLD_TOOL_RESULT_CHARS] + " ... [truncated]"})
+            compacted.append(message)
+
+    return compacted
@@ -0,0 +1,155 @@
+import re
+import time
+import threading
+
+import numpy as np
+
+
+# Semantic response cache --------------------------------------
+#
+# Whole answers keyed by the embedding of the prompt. A new prompt whose cosine
+# similarity to a cached one is above the threshold gets the cached answer
+# without running the graph. Only context-free prompts are served or stored:
+# follow-ups like "what about the second one?" depend on the conversation.
+# Prompts must also mention the same numbers, so "top 5" never answers "top 10".
+# The agent also limits the cache to the first turn of a thread, and never stores
+# answers written around failed tool calls (see is_error_result).
+#
+# Entries expire after a TTL, the least recently used go first when the cache is
+# full, and everything is dropped when the catalog is re-ingested.
+
+
+SIMILARITY_THRESHOLD = 0.95
+RESPONSE_CACHE_TTL = 3600 # Seconds
+RESPONSE_CACHE_SIZE = 256
+
+# Words that point back at earlier turns
+CONTEXT_PATTERN = re.compile(
+    r"\b(it|its|those|these|them|they|this one|that one|the first one|the second one|the last one|"
+    r"above|previous|earlier|again|another|instead|the same|what about|how about)\b"
+)
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+# Tool results reporting a failure instead of data
+TOOL_ERROR_MARKERS = ("tool execution error", "invalid tool arguments", "error executing query", "failed to connect to the database", "error: cannot run", '{"error":')
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(re.sub(r"[^\w\s.]", " ", str(prompt).lower()).split())
+
+
+def is_context_free(prompt: str) -> bool:
+    return CONTEXT_PATTERN.search(normalize_prompt(prompt)) is None
+
+
+def is_error_result(content) -> bool:
+    text = str(content).lstrip().lower()
+    return any(text.startswith(marker) for marker in TOOL_ERROR_MARKERS)
+
+
+def prompt_numbers(prompt: str) -> tuple:
+    return tuple(sorted(NUMBER_PATTERN.findall(normalize_prompt(prompt))))
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        embed,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_items: int = RESPONSE_CACHE_SIZE
+    ):
+        self.embed = embed # Callable returning the embedding of a prompt
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._entries = [] # dicts with prompt, numbers, answer, created, last_used
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _vector(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embed(normalize_prompt(prompt)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, positions: list):
+        keep = np.ones(len(self._entries), dtype=bool)
+        keep[positions] = False
+        self._vectors = self._vectors[keep]
+        self._entries = [entry for entry, kept in zip(self._entries, keep) if kept]
+
+    def _expire(self, now: float):
+        expired = [i for i, entry in enumerate(self._entries) if now - entry["created"] > self.ttl]
+        if expired:
+            self._drop(expired)
+
+    def lookup(self, prompt: str):
+        """Returns (answer, similarity) for a near-duplicate cached prompt, or (None, best similarity)."""
+        if not is_context_free(prompt):
+            return None, 0.0
+
+        vector = self._vector(prompt)
+        numbers = prompt_numbers(prompt)
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+            if not self._entries or self._vectors.shape[1] != len(vector):
+                self.misses += 1
+                return None, 0.0
+
+            similarities = self._vectors @ vector
+            for position in np.argsort(-similarities).tolist():
+                if similarities[position] < self.threshold:
+                    break
+                entry = self._entries[position]
+                if entry["numbers"] == numbers:
+                    entry["last_used"] = now
+                    self.hits += 1
+                    return entry["answer"], float(similarities[position])
+
+            self.misses += 1
+            return None, float(similarities.max())
+
+    def put(self, prompt: str, answer: str):
+        if not answer or not is_context_free(prompt):
+            return
+
+        vector = self._vector(prompt)
+        now = time.monotonic()
+        entry = {"prompt": prompt, "numbers": prompt_numbers(prompt), "answer": answer, "created": now, "last_used": now}
+
+        with self._lock:
+            if len(self._entries) and self._vectors.shape[1] != len(vector):
+                self._vectors, self._entries = np.zeros((0, len(vector)), dtype=np.float32), []
+
+            self._vectors = np.vstack([self._vectors.reshape(-1, len(vector)), vector])
+            self._entries.append(entry)
+
+            self._expire(now)
+            if len(self._entries) > self.max_items:
+                by_use = sorted(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._drop(by_use[:len(self._entries) - self.max_items])
+
+    def invalidate(self, *args):
+        # Accepts and ignores a change report so it can be registered as a catalog listener
+        with self._lock:
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._entries = []
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries"      : len(self._entries),
+                "hits"         : self.hits,
+                "misses"       : self.misses,
+                "hit_rate"     : self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,166 @@
+import re
+import threading
+from collections import OrderedDict
+
+from utils.logger import log
+
+
+# Tiered task classifier --------------------------------------
+#
+# 1. A cache of normalized prompts to labels
+# 2. A single compiled regex over the numeric and semantic keywords
+# 3. The LLM classifier, only consulted when the keyword scores are ambiguous
+
+
+# Keyword tiers --------------------------------------
+# Weak keywords also show up in ordinary phrasing ("I'd like", "over the weekend")
+# and only count for half a point.
+
+NUMERIC_KEYWORDS = [
+    "how many", "count", "total", "number of",
+    "top", "highest", "lowest", "rank",
+    "average", "avg", "mean", "median",
+    "sum", "total gross", "box office",
+    "max", "maximum", "min", "minimum",
+    "greater than", "less than", "over", "under",
+    "rating above", "rating below",
+    "filter by", "sort by",
+    ]
+
+SEMANTIC_KEYWORDS = [
+    "similar to", "like this movie", "movies like",
+    "same vibe", "feel like", "feels like",
+    "similar vibe", "vibes of", "same style as",
+    "if i liked", "recommend based on",
+    "similar story to", "like",
+    "emotionally similar", "thematic",
+    "plot like", "about", "story of", "feeling of",
+    "movies with similar",
+    "semantic", "meaning", "contextual", "vibe", "feeling"
+]
+
+WEAK_KEYWORDS = {"top", "over", "under", "mean", "rank", "like", "about", "meaning", "feeling"}
+
+# Patterns that are numeric regardless of the surrounding words, e.g. "top 5"
+NUMERIC_PATTERNS = [r"top\s+\d+", r"\d+\s+(?:best|worst|highest|lowest)"]
+
+CONFIDENCE_THRESHOLD = 1.0
+MAX_CACHE_ITEMS = 1024
+
+
+def _build_matcher():
+    keywords = sorted(set(NUMERIC_KEYWORDS) | set(SEMANTIC_KEYWORDS), key=len, reverse=True)
+    alternatives = [f"(?P<numeric_pattern_{i}>{p})" for i, p in enumerate(NUMERIC_PATTERNS)]
+    alternatives.append("(?P<keyword>" + "|".join(re.escape(k) for k in keywords) + ")")
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+_MATCHER = _build_matcher()
+_NUMERIC = set(NUMERIC_KEYWORDS)
+_SEMANTIC = set(SEMANTIC_KEYWORDS)
+
+
+def normalize_prompt(task: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", str(task).lower()).split())
+
+
+def score_task(task: str) -> tuple:
+    """Returns the (numeric, semantic) keyword scores of a prompt."""
+    numeric, semantic = 0.0, 0.0
+    for match in _MATCHER.finditer(normalize_prompt(task)):
+        keyword = match.group("keyword")
+        if keyword is None:
+            numeric += 1.0
+            continue
+        weight = 0.5 if keyword in WEAK_KEYWORDS else 1.0
+        if keyword in _NUMERIC:
+            numeric += weight
+        if keyword in _SEMANTIC:
+            semantic += weight
+    return numeric, semantic
+
+
+def is_numeric_task(task: str) -> bool:
+    return score_task(task)[0] > 0
+
+
+def is_semantic_task(task: str) -> bool:
+    return score_task(task)[1] > 0
+
+
+def classify_locally(task: str):
+    """Returns (label, confidence), with label None when the keywords are ambiguous."""
+    numeric, semantic = score_task(task)
+
+    if numeric >= CONFIDENCE_THRESHOLD and semantic >= CONFIDENCE_THRESHOLD:
+        return "Hybrid", min(numeric, semantic)
+    if numeric >= CONFIDENCE_THRESHOLD and semantic == 0:
+        return "Numeric", numeric
+    if semantic >= CONFIDENCE_THRESHOLD and numeric == 0:
+        return "Semantic", semantic
+    return None, max(numeric, semantic)
+
+
+# Tiered classification --------------------------------------
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_metrics = {"cache": 0, "rules": 0, "llm": 0}
+
+
+def _classify_without_llm(task: str, key: str):
+    """Cache, then keyword rules; returns (label, source) or (None, None) when neither is confident."""
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _metrics["cache"] += 1
+            log(f"User prompt classification cached: {_cache[key]}")
+            return _cache[key], "cache"
+
+    label, confidence = classify_locally(task)
+    if label is None:
+        return None, None
+    log(f"User prompt has been classified by rules as: {label} (confidence {confidence})")
+    return label, "rules"
+
+
+def _remember(key: str, label: str, source: str):
+    with _lock:
+        _metrics[source] += 1
+        if label != "Unknown":
+            _cache[key] = label
+            while len(_cache) > MAX_CACHE_ITEMS:
+                _cache.popitem(last=False)
+
+
+def classify_task(task: str, llm_classify) -> str:
+    key = normalize_prompt(task)
+    label, source = _classify_without_llm(task, key)
+    if source == "cache":
+        return label
+
+    if label is None:
+        label, source = llm_classify(task), "llm"
+    _remember(key, label, source)
+    return label
+
+
+def classify_by_rules(task: str) -> str:
+    """Cache and keyword rules only, "Unknown" when they are not confident. Never counts as an LLM call."""
+    key = normalize_prompt(task)
+    label, source = _classify_without_llm(task, key)
+    if label is None:
+        return "Unknown"
+    if source == "rules":
+        _remember(key, label, source)
+    return label
+
+
+def classifier_metrics() -> dict:
+    with _lock:
+        total = sum(_metrics.values())
+        local = _metrics["cache"] + _metrics["rules"]
+        return {
+            **_metrics,
+            "confidence_threshold": CONFIDENCE_THRESHOLD,
+            "local_fraction"      : local / total if total else 0.0,
+        }
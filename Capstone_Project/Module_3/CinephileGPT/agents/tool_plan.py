@@ -0,0 +1,153 @@
+import re
+import json
+from typing import List
+
+from pydantic import BaseModel, Field, model_validator
+
+from db.result_projection import parse_rows
+
+
+# Tool plans --------------------------------------
+#
+# In plan mode the model answers a tool-using turn with one plan instead of one
+# tool call per round trip. A plan is a list of steps, and an argument may refer
+# to the output of an earlier step:
+#
+#   "$s1"              the whole result of step s1
+#   "$s1.movie_id"     the movie_id of every row in that result ("id" works too)
+#   "$s1.movie_id[0]"  the first of those values
+#
+# Steps are grouped into levels by these references. Every step in a level only
+# depends on earlier levels, so the steps of a level can run at the same time.
+
+
+MAX_PLAN_STEPS = 8
+REFERENCE_PATTERN = re.compile(r"^\$([A-Za-z]\w*)(?:\.(\w+))?(?:\[(-?\d+)\])?$")
+ID_FIELDS = ("movie_id", "id") # SQL rows use movie_id, Qdrant points use id
+
+
+class PlanStep(BaseModel):
+    id: str = Field(description='Short unique step id such as "s1".')
+    tool: str = Field(description="Name of the tool to call.")
+    # A JSON string rather than a dict: OpenAI's strict structured outputs reject free-form objects
+    args_json: str = Field(
+        description='Tool arguments as a JSON object, e.g. {"movie_id": "$s1.id[0]", "limit": 5}. '
+                    'A value may reference an earlier step: "$s1", "$s1.movie_id" or "$s1.movie_id[0]".'
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def _args_to_json(cls, data):
+        # Plans built in code may pass the arguments as a dict
+        if isinstance(data, dict) and "args" in data and "args_json" not in data:
+            data = {**{key: value for key, value in data.items() if key != "args"}, "args_json": json.dumps(data["args"] or {}, ensure_ascii=False)}
+        return data
+
+    @property
+    def args(self) -> dict:
+        try:
+            args = json.loads(self.args_json) if self.args_json.strip() else {}
+        except ValueError as e:
+            raise PlanError(f"Step {self.id} has invalid JSON arguments: {e}")
+        if not isinstance(args, dict):
+            raise PlanError(f"Step {self.id} arguments must be a JSON object, got {self.args_json[:200]}")
+        return args
+
+
+class ToolPlan(BaseModel):
+    """Every tool call needed to answer the latest user query, with references between steps."""
+    steps: List[PlanStep] = Field(description="Steps to run, empty if the query needs no tools.")
+
+
+class PlanError(ValueError):
+    """Raised when a plan names an unknown tool or step, or a reference cannot be resolved."""
+
+
+# Levels --------------------------------------
+
+def references(value) -> set:
+    """Step ids referenced anywhere inside an argument value."""
+    if isinstance(value, str):
+        match = REFERENCE_PATTERN.match(value.strip())
+        return {match.group(1)} if match else set()
+    if isinstance(value, dict):
+        return set().union(*[references(v) for v in value.values()])
+    if isinstance(value, (list, tuple)):
+        return set().union(*[references(v) for v in value])
+    return set()
+
+
+def plan_levels(plan: ToolPlan, tool_names) -> list:
+    """Checks the plan and returns its steps grouped into levels that can run in parallel."""
+    steps = plan.steps
+    if len(steps) > MAX_PLAN_STEPS:
+        raise PlanError(f"Plan has {len(steps)} steps, at most {MAX_PLAN_STEPS} are allowed")
+
+    ids = [step.id for step in steps]
+    if len(set(ids)) != len(ids):
+        raise PlanError(f"Step ids must be unique, got {ids}")
+
+    depends = {}
+    for step in steps:
+        if step.tool not in tool_names:
+            raise PlanError(f"Step {step.id} uses unknown tool '{step.tool}'")
+        depends[step.id] = references(step.args)
+        unknown = depends[step.id] - set(ids)
+        if unknown or step.id in depends[step.id]:
+            raise PlanError(f"Step {step.id} references unknown steps {sorted(unknown or {step.id})}")
+
+    levels, done = [], set()
+    while len(done) < len(steps):
+        level = [step for step in steps if step.id not in done and depends[step.id] <= done]
+        if not level:
+            raise PlanError("Plan references form a cycle")
+        levels.append(level)
+        done.update(step.id for step in level)
+    return levels
+
+
+# References --------------------------------------
+
+def _field(row: dict, name: str):
+    if name in ID_FIELDS:
+        return next((row[key] for key in ID_FIELDS if row.get(key) is not None), None)
+    return row.get(name)
+
+
+def resolve_reference(reference: str, results: dict):
+    step_id, name, index = REFERENCE_PATTERN.match(reference.strip()).groups()
+    result = results[step_id]
+    if name is None:
+        return result
+
+    rows = parse_rows(result)
+    if rows is None:
+        raise PlanError(f"Step {step_id} did not return rows, cannot read '{name}': {str(result)[:200]}")
+
+    values = [value for value in (_field(row, name) for row in rows) if value is not None]
+    if index is None:
+        return values
+    try:
+        return values[int(index)]
+    except IndexError:
+        raise PlanError(f"Step {step_id} returned {len(values)} values for '{name}', there is no [{index}]")
+
+
+def resolve_args(value, results: dict):
+    """Replaces step references inside the arguments with values from the finished steps."""
+    if isinstance(value, str):
+        return resolve_reference(value, results) if REFERENCE_PATTERN.match(value.strip()) else value
+    if isinstance(value, dict):
+        return {key: resolve_args(v, results) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [resolve_args(v, results) for v in value]
+    return value
+
+
+def describe_tools(tools: list) -> str:
+    """One line per tool with its arguments, for prompts that don't bind the tools."""
+    lines = []
+    for tool in tools:
+        args = ", ".join(f"{name}: {spec.get('type', 'any')}" for name, spec in tool.args.items())
+        lines.append(f"- {tool.name}({args}): {' '.join(tool.description.split())}")
+    return "\n".join(lines)
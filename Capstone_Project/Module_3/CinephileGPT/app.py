@@ -3,7 +3,10 @@ import markdown_it as md
 from utils.api_keys import update_keys, update_path
 import base64
 import os
+import uuid
 from utils.logger import log
+from utils.tracing import get_turn_spans, format_waterfall
+from utils.rate_limiter import limiter_metrics
 
 # --- PAGE SETUP ---
 st.set_page_config(page_title="Chatbot UI", layout="centered")
@@ -15,6 +18,10 @@ st.title("🎥 CinephileGPT")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Each browser session gets its own agent memory thread
+if "thread_id" not in st.session_state:
+    st.session_state.thread_id = uuid.uuid4().hex
+
 
 # --- UPDATE API KEYS ---
 AVN_PASSWORD = st.secrets["AVN_PASSWORD"]
@@ -37,7 +44,17 @@ update_path(CA_CERT_PATH)
 
 
 # SECRETS HAVE BEEN UPDATED
-from agents.intern_agent import interact
+from agents.intern_agent import interact_stream
+from db.qdrant_database import bootstrap
+
+
+# --- QDRANT COLLECTION BOOTSTRAP ---
+# Runs once per server process instead of on every import of the tools
+@st.cache_resource
+def bootstrap_collection():
+    return bootstrap()
+
+bootstrap_collection()
 
 
 # --- CONSOLE SIDEBAR ---
@@ -115,6 +132,14 @@ console_area.markdown(
     "### Console Output\n```\n" + "\n".join(st.session_state.console) + "\n```"
 )
 
+# --- LAST TURN LATENCY WATERFALL ---
+if st.session_state.get("last_turn_id"):
+    st.sidebar.markdown(
+        "### Last Turn Waterfall\n```\n" + format_waterfall(get_turn_spans(st.session_state.last_turn_id)) + "\n```"
+    )
+    st.sidebar.markdown("### Rate Limiter")
+    st.sidebar.json(limiter_metrics())
+
 
 # --- USER INPUT ---
 if prompt := st.chat_input("Type your message..."):
@@ -131,8 +156,40 @@ if st.session_state.get("show_spinner", False):
 
     console_area = st.sidebar.empty()
 
-    with st.spinner("🎬 CinephileGPT is thinking..."):
-        ai_reply = interact(st.session_state.pending_prompt)
+    st.session_state.last_turn_id = uuid.uuid4().hex
+
+    # Stream node transitions, tool calls and answer tokens as they arrive
+    status = st.status("🎬 CinephileGPT is thinking...", expanded=False)
+    answer_area = st.empty()
+    streamed_text = ""
+    ai_reply = ""
+
+    for event in interact_stream(
+        st.session_state.pending_prompt,
+        turn_id=st.session_state.last_turn_id,
+        thread_id=st.session_state.thread_id
+    ):
+        if event["type"] == "node":
+            status.update(label=f"🎬 CinephileGPT is thinking... ({event['node']})")
+
+        elif event["type"] == "tool":
+            status.write(f"Calling `{event['name']}`")
+
+        elif event["type"] == "token":
+            streamed_text += event["content"]
+            answer_area.markdown(f"<div class='ai-msg'>{streamed_text}</div>", unsafe_allow_html=True)
+
+        elif event["type"] == "reset":
+            # Streamed text was reasoning before a tool call
+            if streamed_text:
+                status.write(streamed_text)
+            streamed_text = ""
+            answer_area.empty()
+
+        elif event["type"] == "final":
+            ai_reply = event["content"]
+
+    status.update(label="🎬 CinephileGPT is done.", state="complete")
 
 
     st.session_state.messages.append({"role": "assistant", "content": ai_reply})
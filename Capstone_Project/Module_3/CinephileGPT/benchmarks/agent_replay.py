@@ -0,0 +1,560 @@
+import os
+import re
+import io
+import csv
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+import logging
+import argparse
+import tempfile
+import warnings
+from contextlib import redirect_stdout, nullcontext
+
+import numpy as np
+
+# The agent module creates its ChatOpenAI client on import; nothing is sent offline
+os.environ.setdefault("OPENAI_API_KEY", "offline-replay")
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+from langchain.schema.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
+
+import db.qdrant_database as qdrant_database
+import db.sql_database as sql_database
+import db.local_engine as local_engine
+import db.vector_index as vector_index
+import db.neighbor_table as neighbor_table
+import utils.tracing as tracing
+import utils.rate_limiter as rate_limiter
+import agents.intern_agent as intern_agent
+from db.connection_pool import ConnectionPool
+from db.embedding_cache import CachedEmbeddings
+from db.local_engine import COLUMNS, NUMERIC_COLUMNS, _to_number
+from agents.tool_plan import ToolPlan
+from agents.response_cache import is_error_result
+
+
+# Offline replay benchmark for the agent graph --------------------------------------
+#
+# Replays a corpus of recorded Numeric / Semantic / Hybrid prompts through the real
+# graph, tools and tracing with local stand-ins for every remote service:
+#
+#   - a scripted chat model that returns the recorded router decision, tool calls
+#     and final answer for each prompt, with estimated token usage
+#   - a deterministic hashing embedder instead of OpenAI embeddings
+#   - Qdrant in :memory: mode, ingested from imdb_top_1000.csv by bootstrap()
+#   - SQLite behind the connection pool instead of the Aiven MySQL database
+#
+# Plan mode replays the entry's recorded plan instead of its steps.
+#
+# Reports p50 / p95 latency per span (router_node, tool_node, tool, llm.*, ...),
+# LLM calls, tool calls and prompt tokens per turn, so a change to the agent can
+# be measured before and after. Model and network latency can be simulated.
+#
+#   python -m benchmarks.agent_replay --repeat 5
+#   python -m benchmarks.agent_replay --async --llm-latency 800 --json replay.json
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(CURRENT_DIR, "replay_corpus.json")
+EMBEDDING_DIM = 256
+SQLITE_URI = "file:cinephile_replay?mode=memory&cache=shared"
+
+LLM_SPAN_PREFIX = "llm"
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list:
+    """
+    Each entry has prompt, classification, steps (lists of parallel tool calls) and answer,
+    and optionally the plan to return in plan mode.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Scripted chat model --------------------------------------
+#
+# Stateless: the prompt is the last HumanMessage and the step is the number of
+# tool-calling AI messages after it, so the same script works for sync, async
+# and streaming runs, and for the combined and legacy routers.
+
+def _usage(messages, output: str) -> dict:
+    input_tokens = rate_limiter.estimate_tokens(messages)
+    output_tokens = rate_limiter.estimate_tokens(output)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class ScriptedChatModel:
+    def __init__(self, corpus: list, latency: float = 0.0):
+        self.scripts = {entry["prompt"]: entry for entry in corpus}
+        self.latency = latency # Seconds added to every call
+        self.calls = 0
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        return _StructuredOutput(self, schema, include_raw)
+
+    def invoke(self, messages, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+
+    # Script lookup --------------------------------------
+
+    def entry(self, messages) -> tuple:
+        """Returns (corpus entry, tool steps already taken this turn)."""
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+        if last_human is None:
+            return None, 0
+
+        prompt = str(messages[last_human].content)
+        entry = self.scripts.get(prompt)
+        if entry is None:
+            # Legacy classification prompts embed the user prompt in a template
+            entry = next((e for p, e in self.scripts.items() if f'"{p}"' in prompt), None)
+
+        steps = sum(1 for m in messages[last_human + 1:] if isinstance(m, AIMessage) and m.tool_calls)
+        return entry, steps
+
+    def respond(self, messages) -> AIMessage:
+        self.calls += 1
+        entry, step = self.entry(messages)
+        if entry is None:
+            return self._message(messages, "I can only answer prompts from the replay corpus.")
+
+        last = messages[-1]
+        is_system = isinstance(last, SystemMessage)
+
+        if is_system and last.content == intern_agent.PLAN_ANSWER_SYSTEM_PROMPT.content:
+            return self._message(messages, entry["answer"])
+
+        if is_system and last.content == intern_agent.TOOL_SYSTEM_PROMPT.content:
+            if step < len(entry["steps"]):
+                return self._message(messages, "", self._tool_calls(entry, step))
+            return self._message(messages, entry["answer"])
+
+        if is_system and "tool_intent" in last.content:
+            # Legacy intent node
+            return self._message(messages, '{"tool_intent": true}' if entry["steps"] else entry["answer"])
+
+        if isinstance(last, HumanMessage) and "classifying the following prompts" in last.content:
+            return self._message(messages, entry["classification"])
+
+        return self._message(messages, entry["answer"])
+
+    def _tool_calls(self, entry: dict, step: int) -> list:
+        calls = []
+        for i, call in enumerate(entry["steps"][step]):
+            digest = hashlib.sha1(f"{entry['prompt']}|{step}|{i}".encode("utf-8")).hexdigest()[:16]
+            calls.append({"name": call["name"], "args": dict(call["args"]), "id": f"call_{digest}", "type": "tool_call"})
+        return calls
+
+    def _message(self, messages, content: str, tool_calls: list = None) -> AIMessage:
+        output = content + json.dumps(tool_calls or [])
+        return AIMessage(content=content, tool_calls=tool_calls or [], usage_metadata=_usage(messages, output))
+
+
+def plan_steps(entry: dict) -> list:
+    # Entries record a plan when steps depend on each other, otherwise every recorded call is independent
+    if "plan" in entry:
+        return entry["plan"]
+    calls = [call for step in entry["steps"] for call in step]
+    return [{"id": f"s{i + 1}", "tool": call["name"], "args": call["args"]} for i, call in enumerate(calls)]
+
+
+class _StructuredOutput:
+    # with_structured_output(..., include_raw=True) as used by router_node
+    def __init__(self, model: ScriptedChatModel, schema, include_raw: bool):
+        self.model = model
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def _decide(self, messages):
+        self.model.calls += 1
+        entry, _ = self.model.entry(messages)
+        if self.schema is ToolPlan:
+            parsed = ToolPlan(steps=plan_steps(entry) if entry else [])
+        elif entry is None or not entry["steps"]:
+            reply = entry["answer"] if entry else "I can only answer prompts from the replay corpus."
+            parsed = self.schema(tool_intent=False, task_classification="Unknown", reply=reply)
+        else:
+            tools = sorted({call["name"] for step in entry["steps"] for call in step})
+            parsed = self.schema(tool_intent=True, task_classification=entry["classification"], reply="", allowed_tools=tools)
+
+        content = parsed.model_dump_json()
+        raw = AIMessage(content=content, usage_metadata=_usage(messages, content))
+        return {"raw": raw, "parsed": parsed, "parsing_error": None} if self.include_raw else parsed
+
+    def with_config(self, *args, **kwargs):
+        return self
+
+    def invoke(self, messages, *args, **kwargs):
+        if self.model.latency:
+            time.sleep(self.model.latency)
+        return self._decide(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        if self.model.latency:
+            await asyncio.sleep(self.model.latency)
+        return self._decide(messages)
+
+
+# Hashing embedder --------------------------------------
+#
+# Signed feature hashing of word tokens: deterministic across runs and processes,
+# and texts sharing words still land close together.
+
+class HashingEmbeddings:
+    def __init__(self, dim: int = EMBEDDING_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency # Seconds added to every call
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", str(text).lower()):
+            value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[value % self.dim] += 1.0 if (value >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+# SQLite stand-in for MySQL --------------------------------------
+#
+# Connections to a shared in-memory database, loaded from the CSV with the same
+# movie_id (row index) the Qdrant points use. The query builder's %s
+# placeholders are rewritten to ?, everything else is plain SQL both accept.
+
+class SQLiteCursor:
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query: str, params=None):
+        self._cursor.execute(query.replace("%s", "?"), list(params or []))
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, uri: str = SQLITE_URI):
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def cursor(self, prepared: bool = False):
+        return SQLiteCursor(self._conn)
+
+    def is_connected(self) -> bool:
+        return True
+
+    def close(self):
+        self._conn.close()
+
+
+def load_sql_backend(csv_path: str = qdrant_database.CSV_FILE_PATH, uri: str = SQLITE_URI):
+    """Creates the top_movies table and points the SQL tools' pool at it. Keep the returned connection open."""
+    keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def column_type(name):
+        if name not in NUMERIC_COLUMNS:
+            return "TEXT"
+        return "INTEGER" if NUMERIC_COLUMNS[name] else "REAL"
+
+    keeper.execute(f"CREATE TABLE top_movies ({', '.join(f'{name} {column_type(name)}' for name in COLUMNS)})")
+
+    def convert(name, value):
+        if name not in NUMERIC_COLUMNS:
+            return value if value != "" else None
+        number = _to_number(value)
+        if np.isnan(number):
+            return None
+        return int(number) if NUMERIC_COLUMNS[name] else number
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        headers = ["movie_id"] + next(reader)
+        rows = [dict(zip(headers, [index] + row)) for index, row in enumerate(reader)]
+
+    keeper.executemany(
+        f"INSERT INTO top_movies VALUES ({', '.join(['?'] * len(COLUMNS))})",
+        [[convert(name, row.get(name)) for name in COLUMNS] for row in rows]
+    )
+    keeper.commit()
+
+    sql_database._pool = ConnectionPool(lambda: SQLiteConnection(uri), max_size=sql_database.POOL_SIZE)
+    return keeper
+
+
+# Environment --------------------------------------
+
+def load_vector_backend(workdir: str, backend: str = "qdrant", embedding_latency: float = 0.0) -> dict:
+    """Ingests the CSV into an in-memory collection with the hashing embedder and builds the derived indexes."""
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name="top_movies",
+        vectors_config=qm.VectorParams(size=EMBEDDING_DIM, distance=qm.Distance.COSINE),
+    )
+
+    qdrant_database._client = client
+    qdrant_database._embeddings = CachedEmbeddings(HashingEmbeddings(latency=embedding_latency), model_name="replay-hashing")
+    qdrant_database.INGEST_CHECKPOINT_PATH = os.path.join(workdir, "ingest_checkpoint.sqlite")
+    qdrant_database.VECTOR_BACKEND = backend
+    vector_index.VECTOR_INDEX_PATH = os.path.join(workdir, "vector_index")
+    neighbor_table.NEIGHBOR_TABLE_PATH = os.path.join(workdir, "neighbor_table")
+
+    return qdrant_database.bootstrap()
+
+
+def lift_rate_limits():
+    # Nothing is sent to the API, so budget waits would only add noise
+    for limiter in (rate_limiter.llm_limiter, rate_limiter.embedding_limiter):
+        limiter.requests = rate_limiter.TokenBucket(1e12)
+        limiter.tokens = rate_limiter.TokenBucket(1e12)
+
+
+def prepare(
+    corpus: list,
+    workdir: str,
+    router_mode: str = "combined",
+    tool_mode: str = "react",
+    vector_backend: str = "qdrant",
+    local_sql: bool = True,
+    response_cache: bool = False,
+    llm_latency: float = 0.0,
+    embedding_latency: float = 0.0,
+    keep_rate_limits: bool = False
+) -> ScriptedChatModel:
+    tracing.TRACE_EXPORT_ENABLED = False
+    local_engine.LOCAL_ENGINE_ENABLED = local_sql
+    intern_agent.USE_RESPONSE_CACHE = response_cache
+    if not keep_rate_limits:
+        lift_rate_limits()
+
+    model = ScriptedChatModel(corpus, latency=llm_latency)
+    intern_agent.model = model
+
+    if router_mode != intern_agent.ROUTER_MODE or tool_mode != intern_agent.TOOL_MODE:
+        sync_node, async_node = (intern_agent.plan_node, intern_agent.aplan_node) if tool_mode == "plan" else (intern_agent.tool_node, intern_agent.atool_node)
+        intern_agent.app = intern_agent.build_graph(sync_node, router_mode).compile(checkpointer=intern_agent.checkpoint)
+        intern_agent.async_app = intern_agent.build_graph(async_node, router_mode).compile(checkpointer=intern_agent.checkpoint)
+
+    load_vector_backend(workdir, vector_backend, embedding_latency)
+    return model
+
+
+# Replay --------------------------------------
+
+def _is_llm_span(name: str) -> bool:
+    return name == LLM_SPAN_PREFIX or name.startswith(LLM_SPAN_PREFIX + ".")
+
+
+def _tool_errors(thread_id: str) -> list:
+    messages = intern_agent.app.get_state({"configurable": {"thread_id": thread_id}}).values.get("messages") or []
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    return [
+        str(m.content)[:200] for m in messages[last_human + 1:]
+        if isinstance(m, ToolMessage) and is_error_result(m.content)
+    ]
+
+
+def replay_turn(entry: dict, thread_id: str, use_async: bool = False) -> dict:
+    turn_id = uuid.uuid4().hex
+    if use_async:
+        answer = asyncio.run(intern_agent.ainteract(entry["prompt"], turn_id=turn_id, thread_id=thread_id))
+    else:
+        answer = intern_agent.interact(entry["prompt"], turn_id=turn_id, thread_id=thread_id)
+
+    spans = tracing.get_turn_spans(turn_id)
+    llm_spans = [s for s in spans if _is_llm_span(s["name"])]
+    turn_span = next((s for s in spans if s["name"] == "turn"), None)
+
+    return {
+        "prompt"        : entry["prompt"],
+        "classification": entry["classification"],
+        "turn_ms"       : turn_span["duration_ms"] if turn_span else None,
+        "llm_calls"     : len(llm_spans),
+        "tool_calls"    : sum(1 for s in spans if s["name"] == "tool"),
+        "prompt_tokens" : sum(s["attributes"].get("input_tokens") or 0 for s in llm_spans),
+        "answer_ok"     : answer == entry["answer"],
+        "tool_errors"   : _tool_errors(thread_id),
+        "spans"         : [{"name": s["name"], "duration_ms": s["duration_ms"]} for s in spans],
+    }
+
+
+def replay(corpus: list, repeat: int = 1, warmup: int = 1, use_async: bool = False, shared_thread: bool = False) -> list:
+    """Replays the corpus warmup + repeat times and returns the measured turns."""
+    turns = []
+    for run in range(warmup + repeat):
+        for i, entry in enumerate(corpus):
+            # A fresh thread per prompt keeps prompt sizes independent of corpus order
+            thread_id = f"replay-{run}" if shared_thread else f"replay-{run}-{i}"
+            turn = replay_turn(entry, thread_id, use_async)
+            if run >= warmup:
+                turns.append(turn)
+    return turns
+
+
+# Report --------------------------------------
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    return {
+        "count" : len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+    }
+
+
+def summarize(turns: list) -> dict:
+    durations = {}
+    for turn in turns:
+        for s in turn["spans"]:
+            durations.setdefault(s["name"], []).append(s["duration_ms"])
+
+    by_class = {}
+    for turn in turns:
+        by_class.setdefault(turn["classification"], []).append(turn)
+
+    def turn_summary(group: list) -> dict:
+        return {
+            **_percentiles([t["turn_ms"] for t in group if t["turn_ms"] is not None]),
+            "llm_calls_per_turn"    : round(float(np.mean([t["llm_calls"] for t in group])), 2),
+            "tool_calls_per_turn"   : round(float(np.mean([t["tool_calls"] for t in group])), 2),
+            "prompt_tokens_per_turn": round(float(np.mean([t["prompt_tokens"] for t in group])), 1),
+            "answers_ok"            : sum(t["answer_ok"] for t in group),
+            "tool_errors"           : sum(len(t["tool_errors"]) for t in group),
+        }
+
+    return {
+        "turns"         : turn_summary(turns) if turns else {},
+        "classification": {name: turn_summary(group) for name, group in sorted(by_class.items())},
+        "spans"         : {name: _percentiles(samples) for name, samples in sorted(durations.items())},
+        "limiters"      : rate_limiter.limiter_metrics(),
+    }
+
+
+def format_report(summary: dict) -> str:
+    lines = [f"{'span':<28}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}"]
+    for name, stats in summary["spans"].items():
+        lines.append(f"{name:<28}{stats['count']:>7}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}")
+
+    lines.append("")
+    lines.append(f"{'turns':<12}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'llm/turn':>10}{'tools/turn':>12}{'prompt tok':>12}{'ok':>5}{'errors':>8}")
+    rows = list(summary["classification"].items()) + [("all", summary["turns"])]
+    for name, stats in rows:
+        if not stats:
+            continue
+        lines.append(
+            f"{name:<12}{stats['count']:>7}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}"
+            f"{stats['llm_calls_per_turn']:>10.2f}{stats['tool_calls_per_turn']:>12.2f}"
+            f"{stats['prompt_tokens_per_turn']:>12.1f}{stats['answers_ok']:>5}{stats['tool_errors']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def run(
+    corpus_path: str = CORPUS_PATH,
+    repeat: int = 3,
+    warmup: int = 1,
+    use_async: bool = False,
+    shared_thread: bool = False,
+    verbose: bool = False,
+    **options
+) -> dict:
+    corpus = load_corpus(corpus_path)
+
+    # Agent logs and Streamlit's bare-mode warnings would drown the report
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        keeper = load_sql_backend()
+        try:
+            with nullcontext() if verbose else redirect_stdout(io.StringIO()):
+                model = prepare(corpus, workdir, **options)
+                started = time.perf_counter()
+                turns = replay(corpus, repeat, warmup, use_async, shared_thread)
+                elapsed = time.perf_counter() - started
+        finally:
+            keeper.close()
+
+    summary = summarize(turns)
+    summary["model_calls"] = model.calls
+    summary["wall_seconds"] = round(elapsed, 3)
+    summary["failed_turns"] = [
+        {"prompt": t["prompt"], "answer_ok": t["answer_ok"], "tool_errors": t["tool_errors"]}
+        for t in turns if not t["answer_ok"] or t["tool_errors"]
+    ]
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded prompts through the agent graph offline and report latency.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1, help="Corpus passes run before measuring")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use ainteract, tool calls run concurrently")
+    parser.add_argument("--router", choices=["combined", "legacy"], default=intern_agent.ROUTER_MODE)
+    parser.add_argument("--tool-mode", choices=["react", "plan"], default=intern_agent.TOOL_MODE)
+    parser.add_argument("--vector-backend", choices=["qdrant", "local"], default="qdrant")
+    parser.add_argument("--no-local-sql", action="store_true", help="Send every SQL tool to the database instead of the local engine")
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument("--shared-thread", action="store_true", help="Replay each pass as one conversation")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated milliseconds per model call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Simulated milliseconds per embedding call")
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show agent logs")
+    args = parser.parse_args()
+
+    summary = run(
+        args.corpus, args.repeat, args.warmup, args.use_async, args.shared_thread, args.verbose,
+        router_mode = args.router,
+        tool_mode = args.tool_mode,
+        vector_backend = args.vector_backend,
+        local_sql = not args.no_local_sql,
+        response_cache = args.response_cache,
+        llm_latency = args.llm_latency / 1000,
+        embedding_latency = args.embedding_latency / 1000,
+        keep_rate_limits = args.keep_rate_limits
+    )
+
+    print(format_report(summary))
+    print(f"\n{summary['model_calls']} model calls, {summary['wall_seconds']} s")
+    for failed in summary["failed_turns"]:
+        print(f"Check: {failed['prompt']!r} answer_ok={failed['answer_ok']} tool_errors={failed['tool_errors']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
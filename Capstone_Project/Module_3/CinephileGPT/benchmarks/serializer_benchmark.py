@@ -0,0 +1,117 @@
+import json
+import time
+import argparse
+from decimal import Decimal
+from datetime import datetime, date
+
+from mysql.connector import FieldType
+
+import db.row_serializer as row_serializer
+
+
+# Row serializer benchmark --------------------------------------
+#
+# Compares the previous jsonify_mysql (fetchall, list of dicts, json.dumps with a
+# default callback) with the streaming serializer, with and without orjson, on
+# a synthetic result shaped like SELECT * FROM top_movies.
+#
+#   python -m benchmarks.serializer_benchmark --rows 20000
+
+
+DESCRIPTION = [
+    ("movie_id", FieldType.LONG), ("Poster_Link", FieldType.VAR_STRING), ("Series_Title", FieldType.VAR_STRING),
+    ("Released_Year", FieldType.LONG), ("Certificate", FieldType.VAR_STRING), ("Runtime", FieldType.VAR_STRING),
+    ("Genre", FieldType.VAR_STRING), ("IMDB_Rating", FieldType.NEWDECIMAL), ("Overview", FieldType.BLOB),
+    ("Meta_score", FieldType.LONG), ("Director", FieldType.VAR_STRING), ("Star1", FieldType.VAR_STRING),
+    ("Star2", FieldType.VAR_STRING), ("Star3", FieldType.VAR_STRING), ("Star4", FieldType.VAR_STRING),
+    ("No_of_Votes", FieldType.LONG), ("Gross", FieldType.NEWDECIMAL), ("Updated_At", FieldType.DATETIME),
+]
+
+
+def make_row(i: int) -> tuple:
+    return (
+        i, f"https://m.media-amazon.com/images/M/{i}._V1_UX67_CR0,0,67,98_AL_.jpg", f"Movie {i}",
+        1950 + i % 70, "UA", f"{90 + i % 90} min", "Crime, Drama", Decimal("8.1"),
+        ("An overview of the plot of movie %d. " % i * 4).encode("utf-8"),
+        60 + i % 40, "Some Director", "Star One", "Star Two", "Star Three", "Star Four",
+        100000 + i, Decimal(f"{1000000 + i}.00"), datetime(2024, 1, 1, 12, 0, i % 60),
+    )
+
+
+class FakeCursor:
+    def __init__(self, rows: list):
+        self.description = [(name, type_code) + (None,) * 5 for name, type_code in DESCRIPTION]
+        self._rows = iter(rows)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size):
+        batch = []
+        for row in self._rows:
+            batch.append(row)
+            if len(batch) == size:
+                break
+        return batch
+
+
+def legacy_jsonify_mysql(cursor):
+    columns = [col[0] for col in cursor.description]
+    results = []
+    for row in cursor.fetchall():
+        results.append(dict(zip(columns, row)))
+
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        if isinstance(o, bytes):
+            return o.decode("utf-8", errors="ignore")
+        return str(o)
+
+    return json.dumps(results, ensure_ascii=False, default=default)
+
+
+def timed(serialize, rows: list, repeats: int) -> tuple:
+    # Rows are generated up front so only fetching and encoding are timed
+    best, output = float("inf"), None
+    for _ in range(repeats):
+        cursor = FakeCursor(rows)
+        start = time.perf_counter()
+        output = serialize(cursor)
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def run(rows: int = 20000, repeats: int = 3) -> dict:
+    def streaming(use_orjson):
+        def serialize(cursor):
+            row_serializer.USE_ORJSON = use_orjson
+            return row_serializer.jsonify_rows(cursor, max_rows=None)
+        return serialize
+
+    candidates = {"legacy jsonify_mysql": legacy_jsonify_mysql, "streaming (json)": streaming(False)}
+    if row_serializer.orjson is not None:
+        candidates["streaming (orjson)"] = streaming(True)
+
+    print(f"{rows} rows, best of {repeats}")
+    rows = [make_row(i) for i in range(rows)]
+    results, reference = {}, None
+    for name, serialize in candidates.items():
+        seconds, output = timed(serialize, rows, repeats)
+        parsed = json.loads(output)
+        reference = reference or parsed
+        results[name] = seconds
+        print(f"{name:<24}{seconds * 1000:>10.1f} ms   same rows: {parsed == reference}")
+
+    row_serializer.USE_ORJSON = True
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MySQL row serializer.")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeats)
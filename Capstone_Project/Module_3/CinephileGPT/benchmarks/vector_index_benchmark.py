@@ -0,0 +1,79 @@
+import time
+import argparse
+
+import numpy as np
+
+from db.vector_index import LocalVectorIndex, VECTOR_INDEX_PATH, get_vector_index, _normalize
+
+
+# Recall / latency benchmark for the local vector index --------------------------------------
+#
+# Compares int8 and binary quantization (with exact rescoring) against exact
+# float32 search. Uses the persisted index when it exists, otherwise synthetic
+# clustered vectors of the same shape as the collection.
+#
+#   python -m benchmarks.vector_index_benchmark --queries 200 --limit 10
+
+
+def synthetic_vectors(count: int = 1000, dim: int = 1536, clusters: int = 40, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim))
+    return _normalize(vectors.astype(np.float32))
+
+
+def percentile_ms(samples: list, q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(queries: int = 200, limit: int = 10, seed: int = 1) -> list:
+    base = get_vector_index()
+    if base is not None:
+        ids, vectors, payloads, source = base.ids, np.asarray(base.vectors), base.payloads, VECTOR_INDEX_PATH
+    else:
+        vectors = synthetic_vectors()
+        ids, payloads, source = np.arange(len(vectors)), [{} for _ in range(len(vectors))], "synthetic"
+
+    # Queries are perturbed catalog vectors, like a phrase close to some movies
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    query_vectors = _normalize(picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32))
+
+    exact = LocalVectorIndex(ids, vectors, payloads, quantization=None)
+    truth = [set(exact.exact_search(q, limit)[0].tolist()) for q in query_vectors]
+
+    print(f"Source: {source} ({len(ids)} vectors, dim {vectors.shape[1]}), {queries} queries, top {limit}")
+    print(f"{'quantization':<14}{'memory':>12}{'p50 ms':>10}{'p95 ms':>10}{'recall':>9}")
+
+    results = []
+    for quantization in (None, "int8", "binary"):
+        index = LocalVectorIndex(ids, vectors, payloads, quantization=quantization)
+        latencies, hits = [], 0
+        for query, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            positions, _ = index.search_positions(query, limit)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & set(positions.tolist()))
+
+        row = {
+            "quantization": quantization or "float32",
+            "memory_bytes": index.memory_bytes(),
+            "p50_ms"      : percentile_ms(latencies, 50),
+            "p95_ms"      : percentile_ms(latencies, 95),
+            "recall"      : hits / (limit * len(truth)),
+        }
+        results.append(row)
+        print(
+            f"{row['quantization']:<14}{row['memory_bytes'] / 1024:>10.0f}KB"
+            f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['recall']:>9.3f}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local quantized vector index.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    run(args.queries, args.limit)
@@ -0,0 +1,142 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Bounded, thread-safe connection pool --------------------------------------
+#
+# Connections are created through a factory (e.g. mysql.connector.connect with the
+# project config) and handed back to the pool after each query instead of being
+# closed. Idle connections are health-checked before reuse and recycled once they
+# are older than max_age.
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect,
+        max_size: int = 5,
+        max_age: float = 1800,
+        health_check_after: float = 30,
+        acquire_timeout: float = 10
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_age = max_age
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque() # (connection, created_at, last_used)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "created"     : 0,
+            "reused"      : 0,
+            "recycled"    : 0,
+            "discarded"   : 0,
+            "timeouts"    : 0,
+            "in_use"      : 0,
+        }
+
+
+    # Acquire and release --------------------------------------
+
+    def _is_alive(self, conn) -> bool:
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"No database connection available after {self.acquire_timeout} seconds.")
+
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+
+            if entry is None:
+                break
+
+            conn, created_at, last_used = entry
+
+            if now - created_at > self.max_age:
+                self._close(conn)
+                with self._lock:
+                    self._stats["recycled"] += 1
+                continue
+
+            if now - last_used > self.health_check_after and not self._is_alive(conn):
+                self._close(conn)
+                with self._lock:
+                    self._stats["discarded"] += 1
+                continue
+
+            with self._lock:
+                self._stats["reused"] += 1
+                self._stats["in_use"] += 1
+            return conn, created_at
+
+        try:
+            conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["created"] += 1
+            self._stats["in_use"] += 1
+        return conn, time.monotonic()
+
+    def _release(self, conn, created_at, broken: bool):
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if broken:
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+
+        if broken:
+            self._close(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn, created_at = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            # Connection-level failures are raised out of the block, never reuse that connection
+            self._release(conn, created_at, broken=True)
+            raise
+        else:
+            self._release(conn, created_at, broken=False)
+
+
+    # Maintenance --------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle), "max_size": self.max_size}
+
+    def close_all(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            self._close(conn)
@@ -0,0 +1,184 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from utils.tracing import span
+from utils.rate_limiter import estimate_tokens
+
+
+# Content-addressed embedding cache --------------------------------------
+#
+# Wraps an embeddings instance (e.g. OpenAIEmbeddings) and exposes the same
+# embed_query / embed_documents interface. Vectors are keyed by a hash of the
+# model name plus the normalized text and are looked up in two tiers:
+#   1. An in-process LRU dictionary
+#   2. An on-disk SQLite table storing float32 blobs
+# Only texts missing from both tiers are sent to the embedding API.
+
+
+def normalize_text(text: str) -> str:
+    # Collapse whitespace so "heist  thriller " and "heist thriller" share a key
+    return " ".join(str(text).split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings:
+    def __init__(self, embeddings, model_name: str, db_path: str = None, max_memory_items: int = 2048, limiter=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.limiter = limiter # Optional RateLimiter for the calls that reach the API
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+            )
+            self._conn.commit()
+
+
+    # Tier lookups --------------------------------------
+
+    def _get_memory(self, key):
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+        return vector
+
+    def _put_memory(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, keys):
+        if self._conn is None or not keys:
+            return {}
+        placeholders = ", ".join("?" for _ in keys)
+        rows = self._conn.execute(
+            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", list(keys)
+        ).fetchall()
+        found = {}
+        for key, blob in rows:
+            found[key] = array("f", blob).tolist()
+        return found
+
+    def _put_disk(self, items):
+        if self._conn is None or not items:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+            [(key, self.model_name, array("f", vector).tobytes()) for key, vector in items],
+        )
+        self._conn.commit()
+
+
+    # Embeddings interface --------------------------------------
+
+    def _call(self, fn, texts: list):
+        if self.limiter is None:
+            return fn()
+        return self.limiter.call(fn, estimate_tokens(texts))
+
+    def embed_documents(self, texts):
+        with span("embed_documents", texts=len(texts)) as record:
+            vectors, misses = self._embed_documents(texts)
+            record["attributes"]["misses"] = misses
+            return vectors
+
+    def _embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._get_memory(key)
+            memory_found = sum(v is not None for v in vectors)
+
+            missing_keys = {keys[i] for i, v in enumerate(vectors) if v is None}
+            disk_found = self._get_disk(missing_keys)
+            for i, key in enumerate(keys):
+                if vectors[i] is None and key in disk_found:
+                    vectors[i] = disk_found[key]
+                    self._put_memory(key, disk_found[key])
+
+            self.memory_hits += memory_found
+            self.disk_hits += sum(1 for i, key in enumerate(keys) if key in disk_found)
+
+        # Embed each distinct missing text once, outside the lock
+        pending = OrderedDict()
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                pending.setdefault(keys[i], []).append(i)
+
+        if pending:
+            to_embed = [texts[indices[0]] for indices in pending.values()]
+            embedded = self._call(lambda: self.embeddings.embed_documents(to_embed), to_embed)
+
+            with self._lock:
+                self.misses += len(to_embed)
+                for (key, indices), vector in zip(pending.items(), embedded):
+                    for i in indices:
+                        vectors[i] = vector
+                    self._put_memory(key, vector)
+                self._put_disk(zip(pending.keys(), embedded))
+
+        return vectors, len(pending)
+
+    def embed_query(self, text):
+        with span("embed_query", chars=len(text)) as record:
+            vector, tier = self._embed_query(text)
+            record["attributes"]["cache"] = tier
+            return vector
+
+    def _embed_query(self, text):
+        key = cache_key(self.model_name, text)
+
+        with self._lock:
+            vector = self._get_memory(key)
+            if vector is not None:
+                self.memory_hits += 1
+                return vector, "memory"
+
+            vector = self._get_disk([key]).get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._put_memory(key, vector)
+                return vector, "disk"
+
+        vector = self._call(lambda: self.embeddings.embed_query(text), [text])
+
+        with self._lock:
+            self.misses += 1
+            self._put_memory(key, vector)
+            self._put_disk([(key, vector)])
+
+        return vector, "miss"
+
+
+    # Stats --------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits"  : self.memory_hits,
+                "disk_hits"    : self.disk_hits,
+                "misses"       : self.misses,
+                "hit_rate"     : (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items" : len(self._memory),
+            }
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+# Rank fusion --------------------------------------
+#
+# Candidates from SQL and from vector search are typed arrays of movie ids in rank
+# order (best first), with optional scores. The candidate set is either their
+# intersection or their union, ranked by reciprocal rank fusion or by a weighted
+# sum of min-max normalized scores.
+
+
+def _lookup(all_ids: np.ndarray, ids: np.ndarray, values: np.ndarray) -> tuple:
+    # Vectorized dict lookup: values[i] for every all_ids entry found in ids
+    if len(ids) == 0:
+        return np.zeros(len(all_ids)), np.zeros(len(all_ids), dtype=bool)
+    order = np.argsort(ids, kind="stable")
+    positions = np.clip(np.searchsorted(ids[order], all_ids), 0, len(ids) - 1)
+    found = ids[order][positions] == all_ids
+    return np.where(found, values[order][positions], 0.0), found
+
+
+def _normalize(scores: np.ndarray) -> np.ndarray:
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def _dedupe(ids: np.ndarray, scores: np.ndarray) -> tuple:
+    # Keep the first (best ranked) occurrence of every id
+    _, first = np.unique(ids, return_index=True)
+    first = np.sort(first)
+    return ids[first], scores[first]
+
+
+def fuse_candidates(
+    sql_ids,
+    vector_ids,
+    sql_scores = None,
+    vector_scores = None,
+    candidates: str = "union",
+    ranking: str = "rrf",
+    vector_weight: float = 0.5,
+    k: int = 60,
+    limit: int = None
+) -> tuple:
+    """
+    Returns (ids, scores) as arrays sorted by fused score.
+    - candidates: "union" or "intersection"
+    - ranking: "rrf" (reciprocal rank fusion) or "weighted" (normalized score sum)
+    """
+    sql_ids = np.asarray(sql_ids, dtype=np.int64)
+    vector_ids = np.asarray(vector_ids, dtype=np.int64)
+
+    # Missing scores fall back to a linear rank score
+    sql_scores = np.asarray(sql_scores, dtype=np.float64) if sql_scores is not None else -np.arange(len(sql_ids), dtype=np.float64)
+    vector_scores = np.asarray(vector_scores, dtype=np.float64) if vector_scores is not None else -np.arange(len(vector_ids), dtype=np.float64)
+
+    sql_ids, sql_scores = _dedupe(sql_ids, sql_scores)
+    vector_ids, vector_scores = _dedupe(vector_ids, vector_scores)
+
+    if candidates == "intersection":
+        all_ids = np.intersect1d(sql_ids, vector_ids)
+    elif candidates == "union":
+        all_ids = np.union1d(sql_ids, vector_ids)
+    else:
+        raise ValueError(f"Unknown candidates mode '{candidates}', use 'union' or 'intersection'.")
+
+    if ranking == "rrf":
+        sql_part, _ = _lookup(all_ids, sql_ids, 1.0 / (k + np.arange(1, len(sql_ids) + 1)))
+        vector_part, _ = _lookup(all_ids, vector_ids, 1.0 / (k + np.arange(1, len(vector_ids) + 1)))
+        scores = sql_part + vector_part
+    elif ranking == "weighted":
+        sql_part, _ = _lookup(all_ids, sql_ids, _normalize(sql_scores))
+        vector_part, _ = _lookup(all_ids, vector_ids, _normalize(vector_scores))
+        scores = (1 - vector_weight) * sql_part + vector_weight * vector_part
+    else:
+        raise ValueError(f"Unknown ranking '{ranking}', use 'rrf' or 'weighted'.")
+
+    order = np.argsort(-scores, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    return all_ids[order], scores[order]
+
+
+def reciprocal_rank_fusion(ranked_id_lists: list, k: int = 60, limit: int = None) -> tuple:
+    """Fuses any number of ranked id lists; returns (ids, scores) sorted by RRF score."""
+    ranked = [np.asarray(ids, dtype=np.int64) for ids in ranked_id_lists]
+    ranked = [_dedupe(ids, np.zeros(len(ids)))[0] for ids in ranked]
+    if not ranked:
+        return np.array([], dtype=np.int64), np.array([])
+
+    all_ids = np.unique(np.concatenate(ranked))
+    scores = np.zeros(len(all_ids))
+    for ids in ranked:
+        part, _ = _lookup(all_ids, ids, 1.0 / (k + np.arange(1, len(ids) + 1)))
+        scores += part
+
+    order = np.argsort(-scores, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    return all_ids[order], scores[order]
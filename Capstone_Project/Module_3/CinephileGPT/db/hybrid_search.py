@@ -1,6 +1,26 @@
 from langchain.tools import tool
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
 
+import numpy as np
+
+from db.qdrant_database import vector_search_points
+from db.sql_database import fetch_rows
+from db.local_engine import get_local_engine, NUMERIC_COLUMNS
+from db.fusion import fuse_candidates
+from db.query_builder import select_query, not_null
+from db.result_projection import parse_rows
+
+
+def _row_id(row: dict):
+    # SQL rows use movie_id, Qdrant points use id; both are integers
+    value = row.get("movie_id", row.get("id"))
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 
 # ===================== TOOLS =====================
 
@@ -13,34 +33,103 @@ def hybrid_intersection_top_movies(sql_json: str, qdrant_json: str) -> str:
     - It reads from state["last_sql_result"] and state["last_qdrant_result"]
     - Both are expected to be JSON strings (lists of dicts)
     - Intersection is done by 'id' (Qdrant) vs 'movie_id' (SQL)
-    - Returns a JSON string of intersecting SQL entries
+    - Returns a JSON string of intersecting SQL entries, ranked by both results
 
     ONLY CALL THIS TOOL IF YOU'VE CALLED OTHER TOOLS.
     """
 
     try:
-        sql_json = sql_json
-        qdrant_json = qdrant_json
+        # Load json strings as actual dictionaries; capped SQL results keep their rows under "rows"
+        sql_data = [row for row in parse_rows(sql_json) if _row_id(row) is not None]        # List of dicts
+        qdrant_data = [item for item in parse_rows(qdrant_json) if _row_id(item) is not None]  # List of dicts
 
-        # Load json strings as actual dictionaries
-        sql_data = json.loads(sql_json)        # List of dicts
-        qdrant_data = json.loads(qdrant_json)  # List of dicts
+        ids, _ = fuse_candidates(
+            [_row_id(row) for row in sql_data],
+            [_row_id(item) for item in qdrant_data],
+            candidates="intersection"
+        )
 
-        # Extract IDs from Qdrant search results
-        qdrant_ids = {item["id"] for item in qdrant_data}
+        # Return JSON (empty [] if no overlap)
+        rows_by_id = {_row_id(row): row for row in reversed(sql_data)}
+        intersection = [rows_by_id[int(movie_id)] for movie_id in ids]
+        return json.dumps(intersection, ensure_ascii=False, default=str)
 
-        # Intersect with SQL
-        intersection = [
-            row for row in sql_data
-            if str(row.get("movie_id")) in qdrant_ids or str(row.get("id")) in qdrant_ids
-        ]
+    except Exception as e:
+        return json.dumps({"error": f"Hybrid tool failed: {str(e)}"}, ensure_ascii=False)
 
-        # Return JSON (empty [] if no overlap)
-        return json.dumps(intersection, ensure_ascii=False)
 
+@tool
+def hybrid_fused_search(
+    text_to_embed: str,
+    order_by: str = "IMDB_Rating",
+    desc: bool = True,
+    candidates: str = "union",
+    ranking: str = "rrf",
+    limit: int = 5,
+    pool_size: int = 50
+) -> str:
+    """
+    One-call hybrid retrieval: runs a semantic vector search and a SQL ranking by a numeric
+    column at the same time and fuses them into a single ranked list.
+    Use for requests like "the highest rated movies that feel like Inception".
+
+    - text_to_embed: the vibe, plot or theme to search for
+    - order_by: numeric column for the SQL ranking: "IMDB_Rating", "Meta_score", "Gross", "No_of_Votes", "Released_Year"
+    - desc: True ranks highest values first
+    - candidates: "union" (either source) or "intersection" (movies found by both)
+    - ranking: "rrf" (reciprocal rank fusion) or "weighted" (normalized score average)
+    - limit: number of movies to return
+    - pool_size: candidates taken from each source before fusion
+    """
+    local_engine = get_local_engine()
+    column = local_engine.column(order_by) if local_engine else order_by
+    if column not in NUMERIC_COLUMNS or column == "movie_id":
+        return json.dumps({"error": f"order_by must be one of {[c for c in NUMERIC_COLUMNS if c != 'movie_id']}"})
+
+    # Movies without a value can't be ranked by it; ascending, they would sort first and fill the pool
+    def sql_candidates():
+        if local_engine is not None:
+            return local_engine.select_highest(column, pool_size, desc, skip_nulls=True)
+        return fetch_rows(*select_query(["movie_id", "Series_Title", column], conditions=[not_null(column)], order_by=column, desc=desc, limit=pool_size))
+
+    try:
+        # Both backends are queried concurrently; each worker gets a copy of the caller's context
+        # so its spans join the turn trace and its waits respect the turn deadline
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sql_future = executor.submit(contextvars.copy_context().run, sql_candidates)
+            vector_future = executor.submit(contextvars.copy_context().run, vector_search_points, text_to_embed, pool_size)
+            sql_rows, points = sql_future.result(), vector_future.result()
+
+        sql_scores = np.array([float(row[column]) for row in sql_rows])
+        sql_scores = sql_scores if desc else -sql_scores
+
+        ids, scores = fuse_candidates(
+            [_row_id(row) for row in sql_rows],
+            [point.id for point in points],
+            sql_scores = sql_scores,
+            vector_scores = [point.score for point in points],
+            candidates = candidates,
+            ranking = ranking,
+            limit = limit
+        )
     except Exception as e:
         return json.dumps({"error": f"Hybrid tool failed: {str(e)}"}, ensure_ascii=False)
 
+    sql_by_id = {_row_id(row): row for row in sql_rows}
+    points_by_id = {int(point.id): point for point in points}
+
+    results = []
+    for movie_id, score in zip(ids.tolist(), scores.tolist()):
+        point = points_by_id.get(movie_id)
+        row = {"movie_id": movie_id, "fused_score": round(score, 6)}
+        row["vector_score"] = point.score if point else None
+        if point:
+            row.update(point.payload)
+        row.update(sql_by_id.get(movie_id, {}))
+        results.append(row)
+
+    return json.dumps(results, ensure_ascii=False, default=str)
+
 
 # Tools for hybrid search
-hybrid_tools = [hybrid_intersection_top_movies]
\ No newline at end of file
+hybrid_tools = [hybrid_intersection_top_movies, hybrid_fused_search]
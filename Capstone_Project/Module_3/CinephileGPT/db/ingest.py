@@ -0,0 +1,241 @@
+import csv
+import json
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from qdrant_client.models import PointStruct
+from qdrant_client.http import models as qm
+
+
+# Streaming ingestion of imdb_top_1000.csv into Qdrant --------------------------------------
+#
+# Rows are read in chunks, embedded with bounded parallelism and each chunk is
+# upserted as soon as its embeddings are ready. A SQLite checkpoint stores the
+# payload hash of every point that made it into Qdrant, so a rerun resumes where
+# it stopped. Rows whose embedded text changed are re-embedded; rows where only
+# derived payload fields changed have their payload overwritten in place.
+
+
+# Payload helpers --------------------------------------
+
+# Keyword arrays derived from the CSV columns for indexed filtering; not part of the embedded text
+DERIVED_FIELDS = ("Genres", "Stars")
+
+# Keyword fields with a payload index, created by bootstrap()
+INDEXED_FIELDS = ("Genres", "Stars", "Certificate", "Director")
+
+
+def split_keywords(values: list) -> list:
+    # "Crime, Drama" -> ["Crime", "Drama"], dropping blanks
+    keywords = []
+    for value in values:
+        keywords.extend(part.strip() for part in str(value or "").split(","))
+    return [keyword for keyword in keywords if keyword]
+
+
+def build_payload(row: list) -> dict:
+    payload = {
+        "Series_Title" : row[1],
+        "Released_Year": row[2],
+        "Certificate"  : row[3],
+        "Genre"        : row[5],
+        "Overview"     : row[7],
+        "Director"     : row[9],
+        "Star1"        : row[10],
+        "Star2"        : row[11],
+        "Star3"        : row[12],
+        "Star4"        : row[13],
+    }
+    payload["Genres"] = split_keywords([payload["Genre"]])
+    payload["Stars"] = split_keywords([payload["Star1"], payload["Star2"], payload["Star3"], payload["Star4"]])
+    return payload
+
+
+def payload_to_text(payload: dict) -> str:
+    row_string = ""
+    for key, value in payload.items():
+        if key in DERIVED_FIELDS:
+            continue
+        row_string += f"{key}: {value}\n"
+    return row_string
+
+
+def payload_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def text_hash(payload: dict) -> str:
+    return hashlib.sha256(payload_to_text(payload).encode("utf-8")).hexdigest()
+
+
+def iter_batches(csv_path: str, batch_size: int):
+    # Yields lists of (point_id, payload) without loading the whole file
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+
+        batch = []
+        for index, row in enumerate(reader):
+            batch.append((index, build_payload(row)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+
+# Checkpoint store --------------------------------------
+
+class IngestCheckpoint:
+    def __init__(self, path: str, collection_name: str):
+        self.collection_name = collection_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingested (collection TEXT, point_id INTEGER, payload_hash TEXT, "
+            "text_hash TEXT, PRIMARY KEY (collection, point_id))"
+        )
+        # Checkpoints written before text hashes were tracked
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(ingested)")]
+        if "text_hash" not in columns:
+            self.conn.execute("ALTER TABLE ingested ADD COLUMN text_hash TEXT")
+        self.conn.commit()
+
+    def get_hashes(self, point_ids: list) -> dict:
+        # point_id -> (payload_hash, text_hash)
+        placeholders = ", ".join("?" for _ in point_ids)
+        rows = self.conn.execute(
+            f"SELECT point_id, payload_hash, text_hash FROM ingested WHERE collection = ? AND point_id IN ({placeholders})",
+            [self.collection_name, *point_ids],
+        ).fetchall()
+        return {point_id: (payload_digest, text_digest) for point_id, payload_digest, text_digest in rows}
+
+    def mark(self, batch: list):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ingested (collection, point_id, payload_hash, text_hash) VALUES (?, ?, ?, ?)",
+            [(self.collection_name, point_id, payload_hash(payload), text_hash(payload)) for point_id, payload in batch],
+        )
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM ingested WHERE collection = ?", [self.collection_name])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# Pipeline --------------------------------------
+
+def _embed_batch(embeddings, batch: list) -> list:
+    return embeddings.embed_documents([payload_to_text(payload) for _, payload in batch])
+
+
+def _upsert_batch(client, collection_name: str, batch: list, vectors: list):
+    client.upsert(
+        collection_name = collection_name,
+        points = [
+            PointStruct(id=point_id, vector=vector, payload=payload)
+            for (point_id, payload), vector in zip(batch, vectors)
+        ],
+        wait = True
+    )
+
+
+def _overwrite_payloads(client, collection_name: str, batch: list):
+    # One request for the whole batch, vectors are left untouched
+    client.batch_update_points(
+        collection_name = collection_name,
+        update_operations = [
+            qm.OverwritePayloadOperation(overwrite_payload=qm.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in batch
+        ],
+        wait = True
+    )
+
+
+def ingest_top_movies(
+    client,
+    embeddings,
+    csv_path: str,
+    checkpoint_path: str,
+    collection_name: str = "top_movies",
+    batch_size: int = 64,
+    max_workers: int = 4
+) -> dict:
+    """
+    Upsert every new or changed CSV row into the collection and return a report
+    with the number of rows upserted, payload-only updates, skipped and failed.
+    changed_ids lists the points whose vectors were (re)written.
+    """
+    checkpoint = IngestCheckpoint(checkpoint_path, collection_name)
+    report = {"upserted": 0, "payload_updated": 0, "skipped": 0, "failed": 0, "changed_ids": []}
+
+    # An empty collection means any previous checkpoint is stale
+    if client.count(collection_name).count == 0:
+        checkpoint.clear()
+
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            batch = in_flight.pop(future)
+            try:
+                # Upserts stay on this thread; only the embedding calls run in parallel
+                _upsert_batch(client, collection_name, batch, future.result())
+            except Exception as e:
+                print(f"Error during ingestion of ids {batch[0][0]}-{batch[-1][0]}: {e}")
+                report["failed"] += len(batch)
+                continue
+
+            checkpoint.mark(batch)
+            report["upserted"] += len(batch)
+            report["changed_ids"].extend(point_id for point_id, _ in batch)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch in iter_batches(csv_path, batch_size):
+                known = checkpoint.get_hashes([point_id for point_id, _ in batch])
+                changed, payload_only = [], []
+                for point_id, payload in batch:
+                    known_payload, known_text = known.get(point_id, (None, None))
+                    if known_payload == payload_hash(payload):
+                        continue
+                    if known_text == text_hash(payload):
+                        payload_only.append((point_id, payload))
+                    else:
+                        changed.append((point_id, payload))
+                report["skipped"] += len(batch) - len(changed) - len(payload_only)
+
+                if payload_only:
+                    try:
+                        _overwrite_payloads(client, collection_name, payload_only)
+                        checkpoint.mark(payload_only)
+                        report["payload_updated"] += len(payload_only)
+                    except Exception as e:
+                        print(f"Error during payload update of ids {payload_only[0][0]}-{payload_only[-1][0]}: {e}")
+                        report["failed"] += len(payload_only)
+
+                if not changed:
+                    continue
+
+                # Bounded parallelism: wait for a slot before reading further
+                if len(in_flight) >= max_workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                future = executor.submit(_embed_batch, embeddings, changed)
+                in_flight[future] = changed
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        checkpoint.close()
+
+    print(
+        f"Ingestion finished: {report['upserted']} upserted, {report['payload_updated']} payload updates, "
+        f"{report['skipped']} unchanged, {report['failed']} failed."
+    )
+    return report
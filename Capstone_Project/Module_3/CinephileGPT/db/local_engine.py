@@ -0,0 +1,334 @@
+import os
+import re
+import csv
+import json
+import time
+import threading
+
+import numpy as np
+
+
+# Local in-memory movie analytics engine --------------------------------------
+#
+# The top_movies table is small enough to keep in memory as typed NumPy columns.
+# The engine answers the top-N, aggregate, distinct and filter tools without a
+# network round trip, using precomputed sort orders for every numeric column and
+# group-by indexes on Director and Genre. Anything it cannot answer returns None
+# so the caller falls back to MySQL.
+#
+# Rows loaded from the CSV use the row index as movie_id, the same id the Qdrant
+# points use. A snapshot of the SQL table can be loaded instead with from_rows().
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+CSV_FILE_PATH = os.path.join(PROJECT_ROOT, "data", "imdb_top_1000.csv")
+
+LOCAL_ENGINE_ENABLED = True
+MAX_ENGINE_AGE = 3600 # Seconds before the engine is reloaded from its source
+
+COLUMNS = [
+    "movie_id", "Poster_Link", "Series_Title", "Released_Year", "Certificate", "Runtime", "Genre",
+    "IMDB_Rating", "Overview", "Meta_score", "Director", "Star1", "Star2", "Star3", "Star4",
+    "No_of_Votes", "Gross",
+]
+
+# Numeric columns and whether their values are integers
+NUMERIC_COLUMNS = {
+    "movie_id"     : True,
+    "Released_Year": True,
+    "IMDB_Rating"  : False,
+    "Meta_score"   : True,
+    "No_of_Votes"  : True,
+    "Gross"        : True,
+}
+
+INDEXED_GROUP_COLUMNS = ["Director", "Genre"]
+AGGREGATES = {"AVG", "SUM", "COUNT", "MAX", "MIN"}
+
+FILTER_PATTERN = re.compile(r"^\s*(>=|<=|<>|!=|>|<|=)\s*(.+?)\s*$")
+
+
+def _to_number(value):
+    if value is None:
+        return np.nan
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return np.nan
+
+
+def _to_string(value):
+    if value is None:
+        return None
+    value = value.decode("utf-8", errors="ignore") if isinstance(value, (bytes, bytearray)) else str(value)
+    return value if value != "" else None
+
+
+class LocalMovieEngine:
+    def __init__(self, columns: dict, source: str):
+        self.columns = columns
+        self.source = source
+        self.loaded_at = time.monotonic()
+        self.size = len(columns["movie_id"])
+
+        # Canonical column names, MySQL column names are case-insensitive
+        self._names = {name.lower(): name for name in columns}
+
+        # Ascending / descending orders; MySQL sorts NULLs first ascending and last descending
+        self._orders = {}
+        for name in NUMERIC_COLUMNS:
+            values = columns[name]
+            ascending = np.argsort(values, kind="stable")
+            nulls = np.isnan(values[ascending])
+            self._orders[name] = (
+                np.concatenate([ascending[nulls], ascending[~nulls]]),
+                np.argsort(-values, kind="stable")
+            )
+
+        # Row position of every movie id, for lookups by id
+        self._positions = {int(movie_id): i for i, movie_id in enumerate(columns["movie_id"]) if not np.isnan(movie_id)}
+
+        self._groups = {}
+        for name in INDEXED_GROUP_COLUMNS:
+            self._group_index(name)
+
+
+    # Loaders --------------------------------------
+
+    @classmethod
+    def from_rows(cls, column_names: list, rows, source: str = "sql"):
+        raw = {name: [] for name in column_names}
+        for row in rows:
+            for name, value in zip(column_names, row):
+                raw[name].append(value)
+
+        canonical = {name.lower(): name for name in column_names}
+        columns = {}
+        for name in COLUMNS:
+            values = raw.get(canonical.get(name.lower()), [])
+            if name in NUMERIC_COLUMNS:
+                columns[name] = np.array([_to_number(v) for v in values], dtype=np.float64)
+            else:
+                columns[name] = np.array([_to_string(v) for v in values], dtype=object)
+
+        return cls(columns, source)
+
+    @classmethod
+    def from_csv(cls, path: str = CSV_FILE_PATH):
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            headers = next(reader)
+            rows = [[index] + row for index, row in enumerate(reader)]
+
+        return cls.from_rows(["movie_id"] + headers, rows, source=path)
+
+
+    # Helpers --------------------------------------
+
+    def column(self, name: str):
+        return self._names.get(str(name).strip().lower())
+
+    def _value(self, name: str, index: int):
+        value = self.columns[name][index]
+        if name in NUMERIC_COLUMNS:
+            if np.isnan(value):
+                return None
+            return int(value) if NUMERIC_COLUMNS[name] else float(value)
+        return value
+
+    def records(self, indices) -> list:
+        return [{name: self._value(name, i) for name in COLUMNS} for i in indices]
+
+    def _group_index(self, name: str) -> dict:
+        if name not in self._groups:
+            groups = {}
+            for i in range(self.size):
+                groups.setdefault(self._value(name, i), []).append(i)
+            self._groups[name] = {key: np.array(indices) for key, indices in groups.items()}
+        return self._groups[name]
+
+
+    # Queries --------------------------------------
+
+    def select_highest(self, column: str, limit: int, desc: bool = True, skip_nulls: bool = False):
+        name = self.column(column)
+        if name not in NUMERIC_COLUMNS:
+            return None
+        ascending, descending = self._orders[name]
+        order = descending if desc else ascending
+        if skip_nulls:
+            order = order[~np.isnan(self.columns[name][order])]
+        return self.records(order[:int(limit)])
+
+    def by_ids(self, movie_ids: list, columns: list = None):
+        # Rows of the ids that exist, in the order asked for
+        names = [self.column(c) for c in columns] if columns else COLUMNS
+        if None in names:
+            return None
+        positions = [self._positions.get(int(movie_id)) for movie_id in movie_ids]
+        return [{name: self._value(name, i) for name in names} for i in positions if i is not None]
+
+    def unique_values(self, column: str):
+        name = self.column(column)
+        if name is None:
+            return None
+        # First-seen order, like a table scan
+        seen = {}
+        for i in range(self.size):
+            seen.setdefault(self._value(name, i), None)
+        return [{name: value} for value in seen]
+
+    def aggregate(self, column: str, group_by: str, limit: int, operation: str = "AVG", order: str = "DESC"):
+        name = self.column(column)
+        group_name = self.column(group_by)
+        operation = str(operation).strip().upper()
+        order = str(order).strip().upper()
+
+        if name is None or group_name is None or operation not in AGGREGATES or order not in ("ASC", "DESC"):
+            return None
+        if operation != "COUNT" and name not in NUMERIC_COLUMNS:
+            return None
+
+        results = []
+        for key, indices in self._group_index(group_name).items():
+            if name in NUMERIC_COLUMNS:
+                values = self.columns[name][indices]
+                values = values[~np.isnan(values)]
+            else:
+                values = [v for v in self.columns[name][indices] if v is not None]
+
+            if operation == "COUNT":
+                result = len(values)
+            elif len(values) == 0:
+                result = None
+            elif operation == "AVG":
+                result = float(np.mean(values))
+            elif operation == "SUM":
+                result = float(np.sum(values))
+            elif operation == "MAX":
+                result = float(np.max(values))
+            else:
+                result = float(np.min(values))
+
+            results.append({group_name: key, "result": result})
+
+        # NULL results sort first ascending and last descending, like MySQL
+        present = [r for r in results if r["result"] is not None]
+        present.sort(key=lambda r: r["result"], reverse=(order == "DESC"))
+        missing = [r for r in results if r["result"] is None]
+        ordered = present + missing if order == "DESC" else missing + present
+        return ordered[:int(limit)]
+
+    def filter(self, filter_map: dict, limit: int = 5):
+        mask = np.ones(self.size, dtype=bool)
+
+        for key, value in filter_map.items():
+            name = self.column(key)
+            if name is None:
+                return None
+
+            value = str(value)
+            match = FILTER_PATTERN.match(value) if any(op in value for op in "<>=") else None
+
+            if match:
+                operator, operand = match.groups()
+                operand = operand.strip("'\"")
+                if name in NUMERIC_COLUMNS:
+                    number = _to_number(operand)
+                    if np.isnan(number):
+                        return None
+                    values = self.columns[name]
+                    with np.errstate(invalid="ignore"):
+                        condition = {
+                            ">" : values > number,
+                            "<" : values < number,
+                            ">=": values >= number,
+                            "<=": values <= number,
+                            "=" : values == number,
+                            "<>": values != number,
+                            "!=": values != number,
+                        }[operator]
+                    condition &= ~np.isnan(values)
+                elif operator in ("=", "<>", "!="):
+                    equal = np.array([v is not None and v.lower() == operand.lower() for v in self.columns[name]])
+                    condition = equal if operator == "=" else ~equal
+                else:
+                    return None
+            else:
+                if name in NUMERIC_COLUMNS:
+                    return None
+                # LIKE '%value%' with the case-insensitive default collation
+                needle = value.lower()
+                condition = np.array([v is not None and needle in v.lower() for v in self.columns[name]])
+
+            mask &= condition
+
+        return self.records(np.flatnonzero(mask)[:int(limit)])
+
+
+# Engine lifecycle --------------------------------------
+
+_engine = None
+_loader = LocalMovieEngine.from_csv
+_engine_lock = threading.Lock()
+
+
+def _csv_backed(engine) -> bool:
+    # Engines loaded from the SQL table have the source "sql", not a file path
+    return engine.source != "sql" and os.path.isfile(engine.source)
+
+
+def _is_stale(engine) -> bool:
+    if time.monotonic() - engine.loaded_at > MAX_ENGINE_AGE:
+        return True
+    # CSV-backed engines also reload when the file changes
+    if _csv_backed(engine):
+        return os.path.getmtime(engine.source) > engine.source_mtime
+    return False
+
+
+def get_local_engine():
+    """Returns the current engine, reloading it when stale, or None when disabled or unavailable."""
+    global _engine
+    if not LOCAL_ENGINE_ENABLED:
+        return None
+
+    with _engine_lock:
+        if _engine is None or _is_stale(_engine):
+            try:
+                engine = _loader()
+                engine.source_mtime = os.path.getmtime(engine.source) if _csv_backed(engine) else 0
+                _engine = engine
+            except Exception as e:
+                print(f"Local engine unavailable: {e}")
+                return _engine
+        return _engine
+
+
+def set_local_engine_loader(loader):
+    """Replaces the engine source, e.g. with a snapshot of the SQL table, and forces a reload."""
+    global _engine, _loader
+    with _engine_lock:
+        _loader = loader
+        _engine = None
+
+
+def query_locally(method: str, *args):
+    """Runs a query on the local engine and returns its rows, or None so the caller uses MySQL."""
+    engine = get_local_engine()
+    if engine is None:
+        return None
+    try:
+        return getattr(engine, method)(*args)
+    except Exception as e:
+        print(f"Local engine error, falling back to MySQL: {e}")
+        return None
+
+
+def answer_locally(method: str, *args):
+    """Like query_locally, but returns the rows as JSON."""
+    result = query_locally(method, *args)
+    if result is None:
+        return None
+    return json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from db.vector_index import LocalVectorIndex
+
+
+# Precomputed nearest-neighbour table --------------------------------------
+#
+# The catalog is fixed and small, so the top-K neighbours of every movie are
+# computed once with a single matrix multiply of the normalized vectors and saved
+# next to the other data files. "Movies like X" becomes a row lookup. Self matches
+# are excluded by id, not by assuming the first hit is the movie itself.
+#
+# When ingestion changes some points only the affected rows are recomputed: the
+# changed movies, and the movies that had a changed movie among their neighbours.
+# Every other row merges the new scores of the changed movies into its list.
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+NEIGHBOR_TABLE_PATH = os.path.join(PROJECT_ROOT, "data", "neighbor_table")
+
+NEIGHBOR_K = 20 # Neighbours kept per movie, larger limits fall back to Qdrant
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple:
+    # Row-wise top k (positions, scores), best first
+    k = min(k, scores.shape[1])
+    positions = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, positions, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(positions, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class NeighborTable:
+    def __init__(self, ids, neighbor_ids, neighbor_scores, payloads: list):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.neighbor_ids = np.asarray(neighbor_ids, dtype=np.int64)
+        self.neighbor_scores = np.asarray(neighbor_scores, dtype=np.float32)
+        self.payloads = payloads
+        self.k = self.neighbor_ids.shape[1] if self.neighbor_ids.ndim == 2 else 0
+        self._positions = {movie_id: i for i, movie_id in enumerate(self.ids.tolist())}
+
+
+    # Construction --------------------------------------
+
+    @classmethod
+    def build(cls, ids, vectors: np.ndarray, payloads: list, k: int = NEIGHBOR_K):
+        """vectors must be L2 normalized, one row per id."""
+        ids = np.asarray(ids, dtype=np.int64)
+        scores = vectors @ vectors.T
+        np.fill_diagonal(scores, -np.inf)
+        positions, top_scores = _top_k(scores, k)
+        return cls(ids, ids[positions], top_scores, payloads)
+
+    def update(self, ids, vectors: np.ndarray, payloads: list, changed_ids: list):
+        """Returns a new table for the given vectors, recomputing only the rows affected by changed_ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        k = self.k
+
+        # Rows keep their neighbour lists only if the movie existed before
+        old_rows = np.array([self._positions.get(movie_id, -1) for movie_id in ids.tolist()])
+        changed = np.isin(ids, np.asarray(list(changed_ids), dtype=np.int64)) | (old_rows < 0)
+        if not changed.any():
+            return NeighborTable(ids, self.neighbor_ids[old_rows], self.neighbor_scores[old_rows], payloads)
+
+        neighbor_ids = np.zeros((len(ids), k), dtype=np.int64)
+        neighbor_scores = np.zeros((len(ids), k), dtype=np.float32)
+        neighbor_ids[~changed] = self.neighbor_ids[old_rows[~changed]]
+        neighbor_scores[~changed] = self.neighbor_scores[old_rows[~changed]]
+
+        # A row whose list contains a changed movie may need a neighbour it dropped
+        full = changed | (~changed & np.isin(neighbor_ids, ids[changed]).any(axis=1))
+
+        scores = vectors[full] @ vectors.T
+        scores[np.arange(full.sum()), np.flatnonzero(full)] = -np.inf
+        positions, top_scores = _top_k(scores, k)
+        neighbor_ids[full], neighbor_scores[full] = ids[positions], top_scores
+
+        # Other rows merge the changed movies into their existing lists
+        merge = ~full
+        if merge.any():
+            changed_scores = vectors[merge] @ vectors[changed].T
+            all_ids = np.concatenate([neighbor_ids[merge], np.broadcast_to(ids[changed], changed_scores.shape)], axis=1)
+            all_scores = np.concatenate([neighbor_scores[merge], changed_scores], axis=1)
+            positions, top_scores = _top_k(all_scores, k)
+            neighbor_ids[merge], neighbor_scores[merge] = np.take_along_axis(all_ids, positions, axis=1), top_scores
+
+        return NeighborTable(ids, neighbor_ids, neighbor_scores, payloads)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "neighbors.npz"), ids=self.ids, neighbor_ids=self.neighbor_ids, neighbor_scores=self.neighbor_scores)
+        with open(os.path.join(path, "payloads.json"), "w", encoding="utf-8") as f:
+            json.dump(self.payloads, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(os.path.join(path, "neighbors.npz"))
+        with open(os.path.join(path, "payloads.json"), encoding="utf-8") as f:
+            payloads = json.load(f)
+        return cls(data["ids"], data["neighbor_ids"], data["neighbor_scores"], payloads)
+
+
+    # Lookup --------------------------------------
+
+    def neighbors(self, movie_id: int, limit: int = 5):
+        """Returns the nearest movies as Qdrant ScoredPoints, or None if the table cannot answer."""
+        position = self._positions.get(int(movie_id))
+        if position is None or limit > self.k:
+            return None
+
+        return [
+            qm.ScoredPoint(id=neighbor_id, version=0, score=score, payload=self.payloads[self._positions[neighbor_id]])
+            for neighbor_id, score in zip(self.neighbor_ids[position, :limit].tolist(), self.neighbor_scores[position, :limit].tolist())
+        ]
+
+
+# Shared instance --------------------------------------
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_neighbor_table(path: str = None):
+    """Returns the persisted table, or None when it has not been built yet."""
+    global _table
+    path = path or NEIGHBOR_TABLE_PATH
+    if _table is None:
+        with _table_lock:
+            if _table is None and os.path.isfile(os.path.join(path, "neighbors.npz")):
+                _table = NeighborTable.load(path)
+    return _table
+
+
+def refresh_neighbor_table(client, changed_ids: list, path: str = None, collection_name: str = "top_movies"):
+    """Builds the table, or updates the rows affected by changed_ids, from the collection and persists it."""
+    global _table
+    path = path or NEIGHBOR_TABLE_PATH
+    snapshot = LocalVectorIndex.from_collection(client, collection_name, quantization=None)
+
+    current = get_neighbor_table(path)
+    if current is None:
+        table = NeighborTable.build(snapshot.ids, snapshot.vectors, snapshot.payloads)
+    else:
+        table = current.update(snapshot.ids, snapshot.vectors, snapshot.payloads, changed_ids)
+
+    table.save(path)
+    with _table_lock:
+        _table = table
+    return table
@@ -1,6 +1,6 @@
 # Core Qdrant imports
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny
 from qdrant_client.http import models as qm
 
 # Other imports
@@ -8,15 +8,30 @@ from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings
 from langchain.tools import tool
 import os  
-import csv 
 import json
-from db.sql_database import qdrant_get_poster, qdrant_reranker
-from utils.api_keys import QDRANT_API_KEY, QDRANT_URL, OPENAI_API_KEY
+import threading
+from db.sql_database import qdrant_get_poster, qdrant_get_posters, qdrant_reranker
+from db.embedding_cache import CachedEmbeddings
+from db.ingest import ingest_top_movies, INDEXED_FIELDS
+from db.fusion import reciprocal_rank_fusion
+from db.vector_index import get_vector_index, rebuild_vector_index, supports_filter
+from db.neighbor_table import get_neighbor_table, refresh_neighbor_table
+from db.title_index import get_title_index
+from utils import api_keys
+from utils.tracing import span
+from utils.rate_limiter import embedding_limiter
 
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
 CSV_FILE_PATH = os.path.join(PROJECT_ROOT, "data", "imdb_top_1000.csv")
+EMBEDDING_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "embedding_cache.sqlite")
+INGEST_CHECKPOINT_PATH = os.path.join(PROJECT_ROOT, "data", "ingest_checkpoint.sqlite")
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# "qdrant" searches the remote collection, "local" the quantized file-backed copy
+# in db/vector_index.py, which bootstrap() keeps in sync with the collection
+VECTOR_BACKEND = "qdrant"
 
 
 # # Load environment variables from .env file
@@ -24,98 +39,97 @@ CSV_FILE_PATH = os.path.join(PROJECT_ROOT, "data", "imdb_top_1000.csv")
 # QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 # QDRANT_URL = os.getenv("QDRANT_URL")
 
-# Create OpenAI embeddings instance
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=OPENAI_API_KEY)
-
-# Initialize Qdrant client
-client = QdrantClient(
-    url = QDRANT_URL,
-    api_key = QDRANT_API_KEY,
-    timeout = 30
-)
-
-
-# Create collection if it doesn't exist
-if not client.collection_exists("top_movies"):
-    print("Creating 'top_movies' collection...")
-
-
-    client.create_collection(
-        collection_name="top_movies",
-        vectors_config=qm.VectorParams(size=1536, distance=qm.Distance.COSINE),
-    )
-
-
-# Check if the collection is empty before inserting data
-if client.count("top_movies").count == 0:
-    print("Collection is empty. Inserting data...")
-
-
-    # Load data from CSV file and insert into Qdrant
-    with open(CSV_FILE_PATH, newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        headers = next(reader)
-
-        ids = []
-        strings = []
-        payloads = []
-
-
-        # Construct payload and vector for each row
-        for index, row in enumerate(reader):
-            
-            payload = {
-                "Series_Title" : row[1],
-                "Released_Year": row[2],
-                "Certificate"  : row[3],
-                "Genre"        : row[5],
-                "Overview"     : row[7],
-                "Director"     : row[9],
-                "Star1"        : row[10],
-                "Star2"        : row[11],
-                "Star3"        : row[12],
-                "Star4"        : row[13],
-            }
-
-            row_string = ""
-
-            for key, value in payload.items():
-                row_string += f"{key}: {value}\n"
-            
-            ids.append(index)
-            strings.append(row_string)
-            payloads.append(payload)
-
-        # Generate embeddings for all rows
-        try:
-            embedded_vectors = embeddings.embed_documents(strings)
-        except Exception as e:
-            print(f"Error during embedding: {e}")
-
-
-        # Create PointStruct objects
-        points = [
-            PointStruct(id=ids[i], vector=embedded_vectors[i], payload=payloads[i])
-            for i in range(len(ids))
-        ]
-
-
-        # Upsload points to Qdrant
-        try:
-            client.upload_points(
-                collection_name = "top_movies",
-                points = points,
-                batch_size = 100,
-                parallel = 1
-            )
+# Client and embeddings are created on first use so importing the tools touches no network
+_client = None
+_embeddings = None
+_init_lock = threading.Lock()
 
-        except Exception as e:
-            print(f"Error during upsert: {e}")
+# Callbacks run with the ingest report whenever bootstrap() changes the catalog
+_catalog_listeners = []
 
 
 # Get qdrant client
 def get_qdrant_client():
-    return client
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                _client = QdrantClient(
+                    url = api_keys.QDRANT_URL,
+                    api_key = api_keys.QDRANT_API_KEY,
+                    timeout = 30
+                )
+    return _client
+
+
+# Get OpenAI embeddings instance, cached in memory and on disk so repeated phrases skip the API
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _init_lock:
+            if _embeddings is None:
+                # Retries are left to the shared rate limiter
+                _embeddings = CachedEmbeddings(
+                    OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=api_keys.OPENAI_API_KEY, max_retries=0),
+                    model_name = EMBEDDING_MODEL,
+                    db_path = EMBEDDING_CACHE_PATH,
+                    limiter = embedding_limiter
+                )
+    return _embeddings
+
+
+# Create the collection and its payload indexes if needed and stream new or changed rows into it
+def bootstrap() -> dict:
+    client = get_qdrant_client()
+
+    if not client.collection_exists("top_movies"):
+        print("Creating 'top_movies' collection...")
+
+        client.create_collection(
+            collection_name="top_movies",
+            vectors_config=qm.VectorParams(size=1536, distance=qm.Distance.COSINE),
+        )
+
+    # Keyword indexes keep filtered searches from scanning every payload
+    indexed = client.get_collection("top_movies").payload_schema
+    for field in INDEXED_FIELDS:
+        if field not in indexed:
+            client.create_payload_index(
+                collection_name="top_movies",
+                field_name=field,
+                field_schema=qm.PayloadSchemaType.KEYWORD
+            )
+
+    report = ingest_top_movies(client, get_embeddings(), CSV_FILE_PATH, INGEST_CHECKPOINT_PATH)
+
+    changed = report["upserted"] or report["payload_updated"]
+
+    if changed:
+        for listener in _catalog_listeners:
+            listener(report)
+
+    if changed or get_neighbor_table() is None:
+        print("Refreshing nearest-neighbour table...")
+        refresh_neighbor_table(client, report["changed_ids"])
+
+    if VECTOR_BACKEND == "local" and (changed or get_vector_index() is None):
+        print("Rebuilding local vector index...")
+        rebuild_vector_index(client)
+
+    return report
+
+
+# Register a callback for catalog changes, e.g. to drop cached answers
+def on_catalog_change(listener):
+    _catalog_listeners.append(listener)
+    return listener
+
+
+# Local index when enabled and able to evaluate the filter, otherwise None
+def _local_index(query_filter: Filter = None):
+    if VECTOR_BACKEND != "local" or not supports_filter(query_filter):
+        return None
+    return get_vector_index()
 
 
 # jsonify_qdrant
@@ -130,7 +144,46 @@ def jsonify_qdrant(search_result) -> str:
 
     return json.dumps(results, ensure_ascii=False)
 
-    
+
+# Embed a phrase and return the scored points, shared by the search tools
+def vector_search_points(text_to_embed: str, limit: int = 5, query_filter: Filter = None) -> list:
+    query_vector = get_embeddings().embed_query(text_to_embed)
+
+    index = _local_index(query_filter)
+    if index is not None:
+        with span("local_index.search", limit=limit, filtered=query_filter is not None):
+            return index.search(query_vector, limit, query_filter)
+
+    with span("qdrant.search", limit=limit, filtered=query_filter is not None):
+        return get_qdrant_client().search(
+            collection_name="top_movies",
+            query_vector=query_vector,
+            limit=limit,
+            with_payload=True,
+            with_vectors=False,
+            query_filter=query_filter
+        )
+
+
+
+# Embed several phrases in one call and run all searches in one request
+def multi_vector_search_points(queries: list, limit: int = 5) -> list:
+    query_vectors = get_embeddings().embed_documents(queries)
+
+    index = _local_index()
+    if index is not None:
+        with span("local_index.search_batch", queries=len(queries), limit=limit):
+            return [index.search(vector, limit) for vector in query_vectors]
+
+    with span("qdrant.search_batch", queries=len(queries), limit=limit):
+        return get_qdrant_client().search_batch(
+            collection_name="top_movies",
+            requests=[
+                qm.SearchRequest(vector=vector, limit=limit, with_payload=True, with_vector=False)
+                for vector in query_vectors
+            ]
+        )
+
 
 # ======================================= TOOLS =======================================
 
@@ -140,13 +193,7 @@ def qdrant_vector_search(text_to_embed: str, limit: int = 5) -> str:
     Perform a semantic "vibe-based" movie search using vector similarity.
     Use when the user asks for movies similar to a feeling, plot, theme, or example movie.
     """
-    search_result = client.search(
-        collection_name="top_movies",
-        query_vector=embeddings.embed_query(text_to_embed),
-        limit=limit,
-        with_payload=True,
-        with_vectors=False
-    )
+    search_result = vector_search_points(text_to_embed, limit)
 
     return jsonify_qdrant(search_result)
 
@@ -165,10 +212,10 @@ def qdrant_vector_search_with_filter(
     Vector similarity search with optional metadata filters from Qdrant payload.
 
     Can only filter by:
-    - Genre (string containment, exact match)
+    - Genre (a single genre such as "Crime" or "Sci-Fi", matches multi-genre movies too)
     - Certificate (e.g. PG-13, R, etc.)
     - Director name
-    - Actor (matches Star1, Star2, Star3, or Star4) (can only match to one actor)
+    - Actor (matches any of the four stars; several names can be comma-separated, any of them matches)
 
     Example use-cases:
     - "Find sci-fi movies like Inception but only PG-13"
@@ -179,7 +226,8 @@ def qdrant_vector_search_with_filter(
     conditions = []
 
     if genre:
-        conditions.append(FieldCondition(key="Genre", match=MatchValue(value=genre)))
+        # Genres are stored title-cased, e.g. "Film-Noir"
+        conditions.append(FieldCondition(key="Genres", match=MatchValue(value=genre.strip().title())))
 
     if certificate:
         conditions.append(FieldCondition(key="Certificate", match=MatchValue(value=certificate)))
@@ -188,40 +236,14 @@ def qdrant_vector_search_with_filter(
         conditions.append(FieldCondition(key="Director", match=MatchValue(value=director)))
 
     if actor:
-        # Matches any one of the 4 actor fields
-        conditions.append(
-            Filter(
-                should=[
-                    FieldCondition(key="Star1", match=MatchValue(value=actor)),
-                    FieldCondition(key="Star2", match=MatchValue(value=actor)),
-                    FieldCondition(key="Star3", match=MatchValue(value=actor)),
-                    FieldCondition(key="Star4", match=MatchValue(value=actor))
-                ]
-            )
-        )
+        # Stars holds all four actor fields, one indexed condition covers them
+        actors = [name.strip() for name in actor.split(",") if name.strip()]
+        conditions.append(FieldCondition(key="Stars", match=MatchAny(any=actors)))
 
     # Final filter object
-    final_filter = None
-    if conditions:
-        must_conditions = [c for c in conditions if isinstance(c, FieldCondition)]
-        should_filters = [c for c in conditions if isinstance(c, Filter)]
-
-        if should_filters:
-            final_filter = Filter(
-                must=must_conditions,
-                should=should_filters
-            )
-        else:
-            final_filter = Filter(must=must_conditions)
-
-    search_result = client.search(
-        collection_name="top_movies",
-        query_vector=embeddings.embed_query(text_to_embed),
-        limit=limit,
-        with_payload=True,
-        with_vectors=False,
-        filter=final_filter
-    )
+    final_filter = Filter(must=conditions) if conditions else None
+
+    search_result = vector_search_points(text_to_embed, limit, final_filter)
 
     return jsonify_qdrant(search_result)
 
@@ -237,45 +259,59 @@ def qdrant_similarity_by_id(movie_id: int, limit: int = 5) -> str:
     Only works if that movie ID already exists in Qdrant or if you know the movie id.
     If movie id is unknown, use qdrant_get_id_by_title() to get the id before using this.
     """
-    # Retrieve vector given id
-    point = client.retrieve(
-        collection_name="top_movies",
-        ids=[movie_id],
-        with_payload=False,
-        with_vectors=True
-    )
-
-    vector = point[0].vector
-
-    search_result = client.search(
-        collection_name="top_movies",
-        query_vector=vector,
-        limit=limit+1,
-        with_payload=True,
-        with_vectors=False
-    )
+    # Precomputed neighbours answer without touching Qdrant
+    table = get_neighbor_table()
+    if table is not None:
+        with span("neighbor_table.lookup", limit=limit) as record:
+            search_result = table.neighbors(movie_id, limit)
+            record["attributes"]["hit"] = search_result is not None
+        if search_result is not None:
+            return jsonify_qdrant(search_result)
+
+    # Recommend by id keeps the vector on the server and never returns the movie itself
+    with span("qdrant.recommend", limit=limit):
+        search_result = get_qdrant_client().recommend(
+            collection_name="top_movies",
+            positive=[movie_id],
+            limit=limit,
+            with_payload=True,
+            with_vectors=False
+        )
 
-    return jsonify_qdrant(search_result[1:])
+    return jsonify_qdrant(search_result)
 
 
 @tool
 def qdrant_get_id_by_title(title: str) -> str:
     """
-    Retrieve the Qdrant movie ID based on exact title match in payload.
-    Useful for chaining with similarity_by_id(). The movie title must be exact.
+    Retrieve the Qdrant movie ID for a title. Useful for chaining with similarity_by_id().
+    The title does not need to be exact: case, punctuation, accents, leading articles,
+    subtitles and small typos are tolerated ("godfather 2", "amelie", "inceptoin").
+    Returns candidates ranked by match_score; 1.0 is an exact title match, so pick the
+    first candidate unless the year or another candidate fits the user's request better.
     """
-    points, _ = client.scroll(
-        collection_name="top_movies",
-        scroll_filter=Filter(
-            must=[
-                FieldCondition(
-                    key="Series_Title",
-                    match=MatchValue(value=title)
-                )
-            ]
-        ),
-        limit=5 # If movie has sequels the model can take that into account
-    )
+    index = get_title_index()
+    if index is not None:
+        with span("title_index.search") as record:
+            candidates = index.search(title)
+            record["attributes"]["candidates"] = len(candidates)
+        if not candidates:
+            return f"No movie found with title '{title}'"
+        return json.dumps(candidates, ensure_ascii=False)
+
+    with span("qdrant.scroll"):
+        points, _ = get_qdrant_client().scroll(
+            collection_name="top_movies",
+            scroll_filter=Filter(
+                must=[
+                    FieldCondition(
+                        key="Series_Title",
+                        match=MatchValue(value=title)
+                    )
+                ]
+            ),
+            limit=5 # If movie has sequels the model can take that into account
+        )
 
     if not points:
         return f"No movie found with title '{title}'"
@@ -283,12 +319,59 @@ def qdrant_get_id_by_title(title: str) -> str:
     return json.dumps({"id": points[0].id, "payload": points[0].payload}, ensure_ascii=False)
 
 
+@tool
+def qdrant_multi_vector_search(queries: list[str], limit: int = 5, merge: bool = True) -> str:
+    """
+    Run several semantic searches at once, e.g. one per theme, mood or example movie.
+    Use instead of calling qdrant_vector_search repeatedly in the same turn.
+    - queries: list of phrases to search for
+    - limit: results per phrase
+    - merge: True returns one list ranked by reciprocal rank fusion across all phrases,
+      with the rank each phrase gave the movie; False returns every phrase's results
+    """
+    queries = [str(query) for query in queries if str(query).strip()]
+    if not queries:
+        return "No queries given."
+
+    search_results = multi_vector_search_points(queries, limit)
+
+    if not merge:
+        results = []
+        for query, points in zip(queries, search_results):
+            for rank, point in enumerate(points, start=1):
+                results.append({"query": query, "rank": rank, "id": point.id, "score": point.score, "payload": point.payload})
+        return json.dumps(results, ensure_ascii=False)
+
+    ids, scores = reciprocal_rank_fusion([[point.id for point in points] for points in search_results])
+
+    points_by_id = {}
+    ranks_by_id = {}
+    for query, points in zip(queries, search_results):
+        for rank, point in enumerate(points, start=1):
+            points_by_id.setdefault(int(point.id), point)
+            ranks_by_id.setdefault(int(point.id), {}).setdefault(query, rank)
+
+    results = []
+    for movie_id, score in zip(ids.tolist(), scores.tolist()):
+        results.append({
+            "id": movie_id,
+            "fused_score": round(score, 6),
+            "query_ranks": ranks_by_id[movie_id],
+            "payload": points_by_id[movie_id].payload
+        })
+
+    return json.dumps(results, ensure_ascii=False)
+
+
 # Tools for Qdrant connection
-qdrant_tools = [qdrant_vector_search, qdrant_vector_search_with_filter, qdrant_similarity_by_id, qdrant_get_id_by_title, qdrant_get_poster, qdrant_reranker]
+qdrant_tools = [qdrant_vector_search, qdrant_multi_vector_search, qdrant_vector_search_with_filter, qdrant_similarity_by_id, qdrant_get_id_by_title, qdrant_get_poster, qdrant_get_posters, qdrant_reranker]
 
 # TESTING THE CONNECTION:
 if __name__ == "__main__":
+    bootstrap()
+    client = get_qdrant_client()
     print(client.get_collections())
     print(client.count("top_movies"))
+    print(get_embeddings().stats())
     # print(client.retrieve("top_movies", ids=[0], with_payload=True, with_vectors=True))
     print(qdrant_similarity_by_id(40))
\ No newline at end of file
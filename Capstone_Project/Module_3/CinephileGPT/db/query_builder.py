@@ -0,0 +1,194 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+from db.local_engine import COLUMNS, AGGREGATES, FILTER_PATTERN
+
+
+# Parameterized query builder --------------------------------------
+#
+# The SQL tools build their statements here instead of with f-strings. Column
+# names, operators, aggregates and sort orders are checked against whitelists, so
+# identifiers never come from free text, and every value is a bound %s parameter.
+# IN lists expand to one placeholder per element, so a single id works too, and
+# are padded to a few fixed lengths by repeating their last value, so lists of
+# similar length share one prepared statement.
+#
+# Builders return (sql, params). The statement text only depends on the shape of
+# the query, which lets each pooled connection keep the statement prepared and
+# reuse it across calls with different values.
+
+
+TABLE = "top_movies"
+OPERATORS = {">", ">=", "<", "<=", "=", "!=", "<>", "LIKE", "IN"}
+ORDERS = {"ASC", "DESC"}
+MAX_PREPARED_PER_CONNECTION = 32
+IN_LIST_SIZES = (1, 2, 4, 8, 16, 32, 64) # Longer lists are padded to a multiple of the largest
+
+
+class QueryBuildError(ValueError):
+    """Raised when a tool argument does not map to a whitelisted column, operator or value."""
+
+
+_COLUMN_NAMES = {name.lower(): name for name in COLUMNS}
+
+
+def column(name: str) -> str:
+    # MySQL column names are case-insensitive, return the canonical spelling
+    canonical = _COLUMN_NAMES.get(str(name).strip().strip("`").lower())
+    if canonical is None:
+        raise QueryBuildError(f"Unknown column '{name}'. Allowed columns: {', '.join(COLUMNS)}")
+    return canonical
+
+
+def sort_order(desc) -> str:
+    if isinstance(desc, bool):
+        return "DESC" if desc else "ASC"
+    order = str(desc).strip().upper()
+    if order not in ORDERS:
+        raise QueryBuildError(f"Unknown sort order '{desc}', use ASC or DESC")
+    return order
+
+
+def limit_value(limit) -> int:
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise QueryBuildError(f"Limit must be an integer, got '{limit}'")
+    if limit < 0:
+        raise QueryBuildError("Limit must not be negative")
+    return limit
+
+
+# Conditions --------------------------------------
+
+def condition(name: str, operator: str, value) -> tuple:
+    """Returns (sql, params) for one WHERE condition."""
+    name = column(name)
+    operator = str(operator).strip().upper()
+    if operator not in OPERATORS:
+        raise QueryBuildError(f"Unknown operator '{operator}'. Allowed operators: {', '.join(sorted(OPERATORS))}")
+
+    if operator == "IN":
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            return "1 = 0", []
+        values = padded_values(values)
+        return f"{name} IN ({', '.join(['%s'] * len(values))})", values
+
+    return f"{name} {operator} %s", [value]
+
+
+def not_null(name: str) -> tuple:
+    return f"{column(name)} IS NOT NULL", []
+
+
+def padded_values(values: list) -> list:
+    # Repeating a value doesn't change what IN matches
+    size = next((size for size in IN_LIST_SIZES if size >= len(values)), None)
+    if size is None:
+        largest = IN_LIST_SIZES[-1]
+        size = -(-len(values) // largest) * largest
+    return values + values[-1:] * (size - len(values))
+
+
+def parse_filter(name: str, value) -> tuple:
+    """
+    Turns a filter_map entry into a condition: "> 8.0" compares, anything else
+    is a substring match, the same rules the local engine applies.
+    """
+    value = str(value)
+    match = FILTER_PATTERN.match(value) if any(op in value for op in "<>=") else None
+    if match:
+        operator, operand = match.groups()
+        return condition(name, operator, operand.strip("'\""))
+    return condition(name, "LIKE", f"%{value}%")
+
+
+def where_clause(conditions: list) -> tuple:
+    if not conditions:
+        return "", []
+    clauses, params = [], []
+    for sql, values in conditions:
+        clauses.append(sql)
+        params.extend(values)
+    return " WHERE " + " AND ".join(clauses), params
+
+
+# Statements --------------------------------------
+
+def select_query(columns: list = None, conditions: list = None, order_by: str = None, desc=True, limit=None) -> tuple:
+    selected = ", ".join(column(c) for c in columns) if columns else "*"
+    where, params = where_clause(conditions or [])
+
+    sql = f"SELECT {selected} FROM {TABLE}{where}"
+    if order_by is not None:
+        sql += f" ORDER BY {column(order_by)} {sort_order(desc)}"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit_value(limit))
+    return sql, params
+
+
+def aggregate_query(name: str, group_by: str, operation: str = "AVG", order: str = "DESC", limit=None) -> tuple:
+    operation = str(operation).strip().upper()
+    if operation not in AGGREGATES:
+        raise QueryBuildError(f"Unknown operation '{operation}'. Allowed operations: {', '.join(sorted(AGGREGATES))}")
+    group_by = column(group_by)
+
+    sql = f"SELECT {group_by}, {operation}({column(name)}) AS result FROM {TABLE} GROUP BY {group_by} ORDER BY result {sort_order(order)}"
+    params = []
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit_value(limit))
+    return sql, params
+
+
+def distinct_query(name: str) -> tuple:
+    return f"SELECT DISTINCT {column(name)} FROM {TABLE}", []
+
+
+# Prepared statement cache --------------------------------------
+#
+# mysql.connector re-prepares a prepared cursor whenever it is given a different
+# statement object, so each connection keeps one cursor per statement text and
+# always passes back the same string. Cursors go away with their connection.
+
+_prepared = weakref.WeakKeyDictionary() # connection -> OrderedDict(sql -> (sql, cursor))
+_prepared_lock = threading.Lock()
+
+
+def prepared_cursor(conn, sql: str):
+    """Returns (statement, cursor) to execute on this connection, preparing the statement once."""
+    with _prepared_lock:
+        statements = _prepared.setdefault(conn, OrderedDict())
+        cached = statements.get(sql)
+        if cached is not None:
+            statements.move_to_end(sql)
+            return cached
+
+        cached = (sql, conn.cursor(prepared=True))
+        statements[sql] = cached
+        while len(statements) > MAX_PREPARED_PER_CONNECTION:
+            _, (_, cursor) = statements.popitem(last=False)
+            _close_quietly(cursor)
+        return cached
+
+
+def forget_prepared(conn, sql: str = None):
+    # Drop one statement after an error, or all of them when the connection is discarded
+    with _prepared_lock:
+        statements = _prepared.get(conn)
+        if statements is None:
+            return
+        for key in ([sql] if sql is not None else list(statements)):
+            cached = statements.pop(key, None)
+            if cached is not None:
+                _close_quietly(cached[1])
+
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
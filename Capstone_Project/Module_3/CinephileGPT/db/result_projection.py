@@ -0,0 +1,192 @@
+import json
+import uuid
+import threading
+from collections import OrderedDict
+
+from langchain.tools import tool
+
+
+# Compact tool-result representation --------------------------------------
+#
+# Tool results are JSON lists of full rows (SELECT *) or Qdrant points with full
+# payloads. Before they are shown to the model they are projected to the useful
+# columns, long text is truncated and rows are encoded as a compact table. The
+# full result is kept in a side store and referenced by a handle, which the
+# result_lookup tool and the hybrid tools resolve when they need every field.
+#
+# A result can carry notes about its rows next to the list instead of inside it,
+# e.g. {"rows": [...], "rows_total": 1200} when a SQL result hit the row cap.
+# parse_rows() only ever returns the rows; the notes go in the compact header.
+
+
+RESULT_FORMAT = "table"   # "table" or "json"
+MAX_TEXT_CHARS = 160      # Longer strings (e.g. Overview) are truncated
+MAX_ROWS = 25             # Rows shown to the model, the rest stay in the store
+NARROW_RESULT_COLUMNS = 3 # Results this narrow were asked for explicitly and are never projected
+
+# Wide columns the model rarely needs, and keyword arrays duplicating Genre / Star1..4;
+# still available through result_lookup
+DROPPED_COLUMNS = {"poster_link", "runtime", "star3", "star4", "genres", "stars"}
+
+
+# Side store --------------------------------------
+
+class ResultStore:
+    def __init__(self, max_items: int = 512):
+        self.max_items = max_items
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result: str) -> str:
+        handle = f"res_{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._results[handle] = result
+            while len(self._results) > self.max_items:
+                self._results.popitem(last=False)
+        return handle
+
+    def get(self, handle: str):
+        with self._lock:
+            result = self._results.get(handle)
+            if result is not None:
+                self._results.move_to_end(handle)
+            return result
+
+result_store = ResultStore()
+
+
+def resolve_result(value):
+    """Returns the full result behind a handle, or the value itself if it is not a handle."""
+    if isinstance(value, str):
+        return result_store.get(value) or value
+    return value
+
+
+# Projection --------------------------------------
+
+def with_notes(rows_json: str, **notes) -> str:
+    """Wraps a JSON list of rows with notes about it, e.g. rows_total=1200. Without notes the list is returned as is."""
+    if not notes:
+        return rows_json
+    return '{"rows": ' + rows_json + ", " + json.dumps(notes, ensure_ascii=False, default=str)[1:]
+
+
+def parse_result(result: str) -> tuple:
+    # Returns (list of flat dicts, notes), or (None, {}) if the result is not a list of rows
+    try:
+        data = json.loads(result)
+    except (TypeError, ValueError):
+        return None, {}
+
+    notes = {}
+    if isinstance(data, dict) and isinstance(data.get("rows"), list):
+        notes = {key: value for key, value in data.items() if key != "rows"}
+        data = data["rows"]
+
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        return None, {}
+
+    rows = []
+    for row in data:
+        payload = row.get("payload")
+        if isinstance(payload, dict):
+            row = {key: value for key, value in row.items() if key != "payload"}
+            row.update(payload)
+        rows.append(row)
+    return rows, notes
+
+
+def parse_rows(result: str):
+    # Returns a list of flat dicts, or None if the result is not a list of rows
+    return parse_result(result)[0]
+
+
+def project_rows(rows: list, columns: list = None, max_text: int = MAX_TEXT_CHARS, keep: list = None) -> tuple:
+    # Columns in keep are never dropped or truncated, e.g. Poster_Link for the poster tools
+    keep = {str(c).lower() for c in keep or []}
+    all_columns = []
+    for row in rows:
+        for key in row:
+            if key not in all_columns:
+                all_columns.append(key)
+
+    if columns:
+        wanted = {str(c).lower() for c in columns}
+        kept = [c for c in all_columns if c.lower() in wanted]
+    elif len(all_columns) <= NARROW_RESULT_COLUMNS:
+        kept = all_columns
+    else:
+        kept = [c for c in all_columns if c.lower() not in DROPPED_COLUMNS or c.lower() in keep]
+
+    projected = []
+    for row in rows:
+        values = []
+        for column in kept:
+            value = row.get(column)
+            if isinstance(value, str) and max_text and len(value) > max_text and column.lower() not in keep:
+                value = value[:max_text] + "..."
+            values.append(value)
+        projected.append(values)
+
+    return kept, projected
+
+
+def encode_table(columns: list, rows: list) -> str:
+    def cell(value):
+        return "" if value is None else str(value).replace("|", "/").replace("\n", " ")
+
+    lines = [" | ".join(columns)]
+    lines.extend(" | ".join(cell(v) for v in row) for row in rows)
+    return "\n".join(lines)
+
+
+def compact_tool_result(result, keep_columns: list = None) -> tuple:
+    """
+    Returns (content for the model, value to keep in state). Results that are not
+    lists of rows, such as error messages, are passed through unchanged.
+    keep_columns are always shown in full, see project_rows.
+    """
+    rows, notes = parse_result(result)
+    if rows is None:
+        return str(result), result
+
+    handle = result_store.put(result)
+    columns, projected = project_rows(rows[:MAX_ROWS], keep=keep_columns)
+
+    header = f"[{handle}: {len(rows)} rows"
+    if "rows_total" in notes:
+        header += f" of {notes.pop('rows_total')} matching, the rest were not returned"
+    if len(rows) > MAX_ROWS:
+        header += f", showing first {MAX_ROWS}"
+    for key, value in notes.items():
+        header += f", {key.replace('_', ' ')}: {value}"
+    header += ", long text truncated, full rows via result_lookup]"
+
+    if RESULT_FORMAT == "json":
+        body = json.dumps([dict(zip(columns, row)) for row in projected], ensure_ascii=False)
+    else:
+        body = encode_table(columns, projected)
+
+    return f"{header}\n{body}", handle
+
+
+# ======================================= TOOLS =======================================
+
+@tool
+def result_lookup(handle: str, columns: list = None, offset: int = 0, limit: int = 10) -> str:
+    """
+    Fetch full, untruncated rows from an earlier tool result by its handle (e.g. "res_1a2b3c4d").
+    Use when a compacted result is missing a column you need, such as Poster_Link or the full Overview.
+    - columns: optional list of column names to return
+    - offset / limit: which rows to return
+    """
+    result = result_store.get(handle)
+    if result is None:
+        return f"No stored result with handle '{handle}'. Re-run the original tool."
+
+    rows = parse_rows(result)[offset:offset + limit]
+    if columns:
+        wanted = {str(c).lower() for c in columns}
+        rows = [{k: v for k, v in row.items() if k.lower() in wanted} for row in rows]
+
+    return json.dumps(rows, ensure_ascii=False)
@@ -0,0 +1,147 @@
+import json
+from decimal import Decimal
+
+from mysql.connector import FieldType
+
+from db.result_projection import with_notes
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Streaming row serializer --------------------------------------
+#
+# Turns a cursor's result set into a JSON list of row objects without holding the
+# whole result in memory twice. Rows are fetched in batches with fetchmany(), each
+# column gets a converter picked once from the cursor description (Decimal to
+# float, dates to ISO strings, bytes to text), and every batch is encoded as soon
+# as it is fetched. Results longer than the row cap are wrapped with the row counts
+# next to the list (see result_projection.with_notes), so the list itself only
+# holds rows; the remaining rows are still read so the connection is left clean.
+#
+# orjson is used for encoding when it is installed, the json module otherwise.
+
+
+FETCH_BATCH_SIZE = 200
+MAX_RESULT_ROWS = 500   # None disables the cap
+USE_ORJSON = True
+
+DECIMAL_TYPES = {FieldType.DECIMAL, FieldType.NEWDECIMAL}
+TEMPORAL_TYPES = {FieldType.DATE, FieldType.NEWDATE, FieldType.DATETIME, FieldType.TIMESTAMP}
+TEXT_TYPES = {
+    FieldType.VARCHAR, FieldType.VAR_STRING, FieldType.STRING, FieldType.ENUM, FieldType.SET,
+    FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB, FieldType.BLOB, FieldType.JSON,
+}
+NATIVE_TYPES = {
+    FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.LONGLONG, FieldType.INT24,
+    FieldType.YEAR, FieldType.FLOAT, FieldType.DOUBLE, FieldType.NULL,
+}
+
+
+# Converters --------------------------------------
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _to_iso(value):
+    return None if value is None else value.isoformat()
+
+
+def _to_text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="ignore")
+    return value
+
+
+def _to_json_safe(value):
+    # Unknown column types, e.g. TIME (timedelta) or BIT
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="ignore")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def json_value(value):
+    """Converts one driver value, for rows fetched without a cursor description at hand."""
+    if isinstance(value, Decimal):
+        return float(value)
+    return _to_json_safe(value)
+
+
+def column_converters(description) -> list:
+    """One converter per column, or None where the driver already returns JSON-safe values."""
+    converters = []
+    for column in description:
+        type_code = column[1]
+        if type_code in NATIVE_TYPES:
+            converters.append(None)
+        elif type_code in DECIMAL_TYPES:
+            converters.append(_to_float)
+        elif type_code in TEMPORAL_TYPES:
+            converters.append(_to_iso)
+        elif type_code in TEXT_TYPES:
+            converters.append(_to_text)
+        else:
+            converters.append(_to_json_safe)
+    return converters
+
+
+# Encoding --------------------------------------
+
+def _encode_batch(rows: list) -> str:
+    # Comma-separated objects without the surrounding brackets
+    if USE_ORJSON and orjson is not None:
+        return orjson.dumps(rows).decode("utf-8")[1:-1]
+    return json.dumps(rows, ensure_ascii=False)[1:-1]
+
+
+def iter_json_rows(cursor, max_rows: int = MAX_RESULT_ROWS, batch_size: int = FETCH_BATCH_SIZE, counts: dict = None):
+    """
+    Yields the pieces of a JSON list of row objects, fetching batch_size rows at a time.
+    When given, counts receives "rows_returned" and "rows_total" once the list is complete.
+    """
+    columns = [column[0] for column in cursor.description]
+    converters = list(enumerate(column_converters(cursor.description)))
+    converted = [(i, convert) for i, convert in converters if convert is not None]
+
+    yield "["
+    emitted, total = 0, 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        total += len(batch)
+
+        if max_rows is not None:
+            batch = batch[:max(0, max_rows - emitted)]
+        if not batch:
+            continue # Past the cap, only counting what is left
+
+        rows = []
+        for row in batch:
+            if converted:
+                row = list(row)
+                for i, convert in converted:
+                    row[i] = convert(row[i])
+            rows.append(dict(zip(columns, row)))
+
+        yield ("," if emitted else "") + _encode_batch(rows)
+        emitted += len(rows)
+
+    if counts is not None:
+        counts.update(rows_returned=emitted, rows_total=total)
+    yield "]"
+
+
+def jsonify_rows(cursor, max_rows: int = MAX_RESULT_ROWS) -> str:
+    counts = {}
+    result = "".join(iter_json_rows(cursor, max_rows, counts=counts))
+    if counts["rows_total"] > counts["rows_returned"]:
+        return with_notes(result, rows_total=counts["rows_total"])
+    return result
@@ -1,11 +1,19 @@
 import mysql.connector
 # import os
 import json
-from decimal import Decimal
-from datetime import datetime, date
+import threading
 # from dotenv import load_dotenv
 from langchain.tools import tool
 from utils.api_keys import AVN_PASSWORD, CERTIFICATE_PATH
+from db.connection_pool import ConnectionPool, PoolTimeout
+from db.row_serializer import jsonify_rows, json_value
+from db.result_projection import with_notes
+from utils.tracing import span
+from db.local_engine import LocalMovieEngine, answer_locally, query_locally, set_local_engine_loader
+from db.query_builder import (
+    QueryBuildError, prepared_cursor, forget_prepared,
+    select_query, aggregate_query, distinct_query, condition, parse_filter
+)
 
 
 # # Load environment variables from .env file
@@ -34,23 +42,154 @@ def create_connection():
         print(f"Error: {err}")
         return None
 
-# Helper function to turn query results into a JSON serializable format
-def jsonify_mysql(cursor):
-    columns = [col[0] for col in cursor.description]
-    results = []
-    for row in cursor.fetchall():
-        results.append(dict(zip(columns, row)))
 
-    def default(o):
-        if isinstance(o, Decimal):
-            return float(o)
-        if isinstance(o, (datetime, date)):
-            return o.isoformat()
-        if isinstance(o, bytes):
-            return o.decode("utf-8", errors="ignore")
-        return str(o)
+# Connection pool shared by every tool, so the TLS handshake is paid once per worker
+POOL_SIZE = 5
+POOL_MAX_AGE = 1800 # Seconds before a connection is recycled
 
-    return json.dumps(results, ensure_ascii=False, default=default)
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Autocommit so pooled connections never read from a stale transaction snapshot
+                _pool = ConnectionPool(
+                    lambda: mysql.connector.connect(**config, autocommit=True),
+                    max_size = POOL_SIZE,
+                    max_age = POOL_MAX_AGE
+                )
+    return _pool
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+# Cursor for a statement: queries with bound params reuse a prepared statement cached on the connection
+def _cursor(conn, query: str, params: list = None) -> tuple:
+    if params is None:
+        return query, conn.cursor()
+    return prepared_cursor(conn, query)
+
+
+def _release(conn, query: str, params: list, cursor, failed: bool = False):
+    if params is None:
+        cursor.close()
+    elif failed:
+        forget_prepared(conn, query)
+
+
+# Run a query and return rows as dicts, for internal callers that don't need JSON
+def fetch_rows(query: str, params: list = None) -> list:
+    with span("mysql_query", query_chars=len(query), prepared=params is not None) as record, get_pool().connection() as conn:
+        query, cursor = _cursor(conn, query, params)
+        failed = True
+        try:
+            cursor.execute(query, params)
+            columns = [col[0] for col in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            record["attributes"]["rows"] = len(rows)
+            failed = False
+            return rows
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            forget_prepared(conn)
+            raise # Connection-level failure, let the pool discard this connection
+        finally:
+            _release(conn, query, params, cursor, failed)
+
+
+# Load the local analytics engine from the SQL table instead of the CSV
+def snapshot_local_engine():
+    def load():
+        with get_pool().connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT * FROM top_movies;")
+                columns = [col[0] for col in cursor.description]
+                return LocalMovieEngine.from_rows(columns, cursor.fetchall())
+            finally:
+                cursor.close()
+
+    set_local_engine_loader(load)
+
+
+# Message for a failed query: only pool and connection failures read as "Failed to connect"
+def database_error(err, connected: bool = True) -> str:
+    print(f"Error: {err}")
+    if not connected or isinstance(err, (PoolTimeout, mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+        return "Failed to connect to the database."
+    return f"Error executing query: {err}"
+
+
+# Run a query on a pooled connection and return its JSON, shared by the tools
+def run_query(query: str, params: list = None) -> str:
+    connected = False
+    try:
+        with span("mysql_query", query_chars=len(query), prepared=params is not None) as record, get_pool().connection() as conn:
+            connected = True
+            query, cursor = _cursor(conn, query, params)
+            failed = True
+            try:
+                cursor.execute(query, params)
+                result = jsonify_rows(cursor)
+                record["attributes"]["result_chars"] = len(result)
+                failed = False
+                return result
+            except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+                forget_prepared(conn)
+                raise # Connection-level failure, let the pool discard this connection
+            except mysql.connector.Error as err:
+                return f"Error executing query: {err}"
+            finally:
+                _release(conn, query, params, cursor, failed)
+    except (mysql.connector.Error, PoolTimeout) as err:
+        # Errors raised before a connection was handed out are connection failures, whatever their type
+        return database_error(err, connected)
+
+
+# Build a statement with the query builder and run it; bad arguments are reported without a round trip
+def run_built_query(builder, *args, **kwargs) -> str:
+    try:
+        query, params = builder(*args, **kwargs)
+    except (QueryBuildError, ValueError, TypeError) as err:
+        return f"Invalid tool arguments: {err}"
+    return run_query(query, params)
+
+
+# Bulk lookups by id --------------------------------------
+
+MAX_BULK_IDS = 50
+POSTER_COLUMNS = ["movie_id", "Series_Title", "Poster_Link"]
+
+
+def movie_id_list(movie_ids) -> list:
+    # A single id works too; duplicates are dropped, the order is kept
+    ids = movie_ids if isinstance(movie_ids, (list, tuple, set)) else [movie_ids]
+    ids = list(dict.fromkeys(int(movie_id) for movie_id in ids))
+    if len(ids) > MAX_BULK_IDS:
+        raise QueryBuildError(f"At most {MAX_BULK_IDS} ids per call, got {len(ids)}")
+    return ids
+
+
+# Rows in the order of the requested ids; ids that don't exist are noted next to the rows, not among them
+def jsonify_by_id(ids: list, rows_by_id: dict) -> str:
+    results = [rows_by_id[movie_id] for movie_id in ids if movie_id in rows_by_id]
+    missing = [movie_id for movie_id in ids if movie_id not in rows_by_id]
+    notes = {"missing_ids": missing} if missing else {}
+    return with_notes(json.dumps(results, ensure_ascii=False), **notes)
+
+
+def fetch_by_id(ids: list, columns: list = None) -> dict:
+    """Returns {movie_id: row} with JSON-safe values, from the local engine when it is enabled, otherwise with one IN query."""
+    if not ids:
+        return {}
+    rows = query_locally("by_ids", ids, columns)
+    if rows is None:
+        rows = fetch_rows(*select_query(columns, conditions=[condition("movie_id", "IN", ids)]))
+        rows = [{key: json_value(value) for key, value in row.items()} for row in rows]
+    return {int(row["movie_id"]): row for row in rows}
 
 
 # ======================================= Tools ======================================
@@ -63,19 +202,7 @@ def mysql_query_tool(query: str) -> str:
     Only use this tool for executing niche read-only queries (SELECT statements).
     Only use this tool when necessary and no other tool can fulfill the request.
     """
-    conn = create_connection()
-    if conn is None:
-        return "Failed to connect to the database."
-
-    cursor = conn.cursor()
-    try:
-        cursor.execute(query)
-        return jsonify_mysql(cursor)
-    except mysql.connector.Error as err:
-        return f"Error executing query: {err}"
-    finally:
-        cursor.close()
-        conn.close()
+    return run_query(query)
 
 
 @tool
@@ -88,10 +215,11 @@ def mysql_select_highest_blank(blank: str, limit: int, desc: bool = True) -> str
     - desc: If True (Default), sort by highest grossing first; if False, sort by lowest grossing first.
     """
 
-    order = "DESC" if desc else "ASC"
+    local_result = answer_locally("select_highest", blank, limit, desc)
+    if local_result is not None:
+        return local_result
 
-    query = f"SELECT * FROM top_movies ORDER BY {blank} {order} LIMIT {limit};"
-    return mysql_query_tool(query)
+    return run_built_query(select_query, order_by=blank, desc=desc, limit=limit)
 
 
 @tool
@@ -102,8 +230,7 @@ def mysql_search_blank(blank: str, column: str, limit: int) -> str:
     - column: Specific column to search for
     """
 
-    query = f"SELECT * FROM top_movies WHERE {column} LIKE '%{blank}%' LIMIT {limit};"
-    return mysql_query_tool(query)
+    return run_built_query(lambda: select_query(conditions=[condition(column, "LIKE", f"%{blank}%")], limit=limit))
 
 
 @tool
@@ -126,17 +253,14 @@ def mysql_filter_blank(filter_map: dict = None, limit: int = 5) -> str:
         "error": "Missing filter_map. Example: {'Genre': 'Horror', 'IMDB_Rating': '> 8.0'}"
     })
 
-    
-    clauses = []
-    for key, value in filter_map.items():
-        if ">" in value or "<" in value or "=" in value:
-            clauses.append(f"{key} {value}")
-        else:
-            clauses.append(f"{key} LIKE '%{value}%'")
+    local_result = answer_locally("filter", filter_map, limit)
+    if local_result is not None:
+        return local_result
 
-    where_clause = "AND ".join(clauses) if clauses else "1"
-    query = f"SELECT * FROM top_movies WHERE {where_clause} LIMIT {limit};"
-    return mysql_query_tool(query)
+    return run_built_query(lambda: select_query(
+        conditions=[parse_filter(key, value) for key, value in filter_map.items()],
+        limit=limit
+    ))
 
 
 @tool
@@ -162,14 +286,11 @@ def mysql_aggregate_blank(column: str, group_by: str, limit: int, operation: str
     - "Count how many movies each director has in the database."
     """
 
-    query = f"""
-        SELECT {group_by}, {operation}({column}) AS result
-        FROM top_movies
-        GROUP BY {group_by}
-        ORDER BY result {order}
-        LIMIT {limit};
-    """
-    return mysql_query_tool(query)
+    local_result = answer_locally("aggregate", column, group_by, limit, operation, order)
+    if local_result is not None:
+        return local_result
+
+    return run_built_query(aggregate_query, column, group_by, operation, order, limit)
     
 
 @tool
@@ -179,22 +300,61 @@ def mysql_get_unique_values(column: str) -> str:
     Considering Horror != horror, this tool is prioritized to use before using tools that require a value as input.
     """
 
-    query = f"SELECT DISTINCT {column} FROM top_movies;"
-    return mysql_query_tool(query)
+    local_result = answer_locally("unique_values", column)
+    if local_result is not None:
+        return local_result
+
+    return run_built_query(distinct_query, column)
 
 
 @tool
 def mysql_get_movie_by_id(movie_id: int) -> str:
-    """Fetch a full movie record using its unique ID. Useful when pairing with QDrant as SQL searching is faster."""
-    query = f"SELECT * FROM top_movies WHERE movie_id = {movie_id};"
-    return mysql_query_tool(query)
+    """
+    Fetch a full movie record using its unique ID. Useful when pairing with QDrant as SQL searching is faster.
+    For several movies use mysql_get_movies_by_ids instead.
+    """
+    return run_built_query(lambda: select_query(conditions=[condition("movie_id", "=", int(movie_id))]))
+
+
+@tool
+def mysql_get_movies_by_ids(movie_ids: list[int]) -> str:
+    """
+    Fetch the full records of several movies in one call, e.g. every movie of a recommendation list.
+    Rows come back in the order of movie_ids; ids that don't exist are reported as missing ids.
+    - movie_ids: list of movie id integers (at most 50)
+    """
+    try:
+        ids = movie_id_list(movie_ids)
+        return jsonify_by_id(ids, fetch_by_id(ids))
+    except (QueryBuildError, ValueError, TypeError) as err:
+        return f"Invalid tool arguments: {err}"
+    except (mysql.connector.Error, PoolTimeout) as err:
+        return database_error(err)
 
 
 @tool
 def qdrant_get_poster(movie_id: int) -> str:
-    """Get the poster of a movie based on its given id. Meant to be used in tandem with QDrant."""
-    query = f"SELECT Poster_link FROM top_movies WHERE movie_id = {movie_id};"
-    return mysql_query_tool(query)
+    """
+    Get the poster of a movie based on its given id. Meant to be used in tandem with QDrant.
+    For several movies use qdrant_get_posters instead.
+    """
+    return run_built_query(lambda: select_query(["Poster_Link"], conditions=[condition("movie_id", "=", int(movie_id))]))
+
+
+@tool
+def qdrant_get_posters(movie_ids: list[int]) -> str:
+    """
+    Get the title and poster link of several movies in one call, e.g. to show posters
+    for a whole recommendation list. Rows come back in the order of movie_ids.
+    - movie_ids: list of movie id integers (at most 50)
+    """
+    try:
+        ids = movie_id_list(movie_ids)
+        return jsonify_by_id(ids, fetch_by_id(ids, POSTER_COLUMNS))
+    except (QueryBuildError, ValueError, TypeError) as err:
+        return f"Invalid tool arguments: {err}"
+    except (mysql.connector.Error, PoolTimeout) as err:
+        return database_error(err)
 
 
 @tool
@@ -203,19 +363,26 @@ def qdrant_reranker(movie_id_tuple: tuple, order_by: str, desc: bool = True) ->
     Provided a tuple of movie id's, rerank them by a specific/particular numeric metric such as rating or gross.
     Meant to be paired with semantic tools when users want "top" movies that match a semantic prerequisite (a vibe or feeling).
 
-    - movie_id_tuple: a tuple of movie id integers.
+    - movie_id_tuple: a tuple of movie id integers (a single id works too).
     - order_by: column name to order by
     - desc: boolean to order in ascending or descending.
     """
+    ids = movie_id_tuple if isinstance(movie_id_tuple, (list, tuple)) else [movie_id_tuple]
+
+    return run_built_query(lambda: select_query(
+        conditions=[condition("movie_id", "IN", [int(movie_id) for movie_id in ids])],
+        order_by=order_by,
+        desc=desc
+    ))
 
-    order = "DESC" if desc else "ASC"
 
-    query = f"SELECT * FROM top_movies WHERE movie_id IN {movie_id_tuple} ORDER BY {order_by} {order};"
-    return mysql_query_tool(query)
+# Poster links are what these tools are called for, the compact projection must not drop them
+mysql_get_movies_by_ids.metadata = {"keep_columns": ["Poster_Link"]}
+qdrant_get_posters.metadata = {"keep_columns": ["Poster_Link"]}
 
 
 # Tools for MySQL connection
-mysql_tools = [mysql_query_tool, mysql_select_highest_blank, mysql_search_blank, mysql_filter_blank, mysql_aggregate_blank, mysql_get_unique_values, mysql_get_movie_by_id]
+mysql_tools = [mysql_query_tool, mysql_select_highest_blank, mysql_search_blank, mysql_filter_blank, mysql_aggregate_blank, mysql_get_unique_values, mysql_get_movie_by_id, mysql_get_movies_by_ids]
 
 
 # TESTING THE CONNECTION:
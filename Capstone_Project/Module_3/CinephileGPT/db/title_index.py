@@ -0,0 +1,141 @@
+import os
+import re
+import csv
+import threading
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+
+# Fuzzy title index --------------------------------------
+#
+# Resolves loosely typed titles ("godfather 2", "Lord of the Rings Return of the
+# King", "amelie") to movie ids without a database round trip. Every title is
+# normalized (case, accents, punctuation, "&"), and registered under a few aliases
+# (without a leading article, without a subtitle). Exact title and alias matches
+# rank first, other titles by trigram overlap counted through an inverted index.
+#
+# Ids are CSV row indexes, the same ids the Qdrant points use.
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+CSV_FILE_PATH = os.path.join(PROJECT_ROOT, "data", "imdb_top_1000.csv")
+
+ARTICLES = ("the", "a", "an")
+ROMAN_NUMERALS = {"ii": "2", "iii": "3", "iv": "4", "v": "5", "vi": "6", "part": ""}
+MIN_MATCH_SCORE = 0.3 # Trigram similarity below this is not a candidate
+ALIAS_MATCH_SCORE = 0.95 # Matches on an alias rank just below exact title matches
+
+
+def normalize_title(title: str) -> str:
+    text = unicodedata.normalize("NFKD", str(title)).encode("ascii", "ignore").decode("ascii").lower()
+    text = text.replace("&", " and ")
+    text = re.sub(r"[^\w\s]", " ", text)
+    words = [ROMAN_NUMERALS.get(word, word) for word in text.split()]
+    return " ".join(word for word in words if word)
+
+
+def title_aliases(title: str) -> set:
+    aliases = {normalize_title(title)}
+
+    # "Lord of the Rings: The Return of the King" -> "lord of the rings"
+    main_title = re.split(r"\s*[:(]\s*|\s+-\s+", str(title))[0]
+    aliases.add(normalize_title(main_title))
+
+    for alias in list(aliases):
+        words = alias.split()
+        if len(words) > 1 and words[0] in ARTICLES:
+            aliases.add(" ".join(words[1:]))
+
+    aliases.discard("")
+    return aliases
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    def __init__(self, ids: list, titles: list, years: list, source: str = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.titles = titles
+        self.years = years
+        self.source = source
+
+        self._exact = defaultdict(list)      # normalized title -> title positions
+        self._aliases = defaultdict(list)    # alias -> title positions
+        postings = defaultdict(list)         # trigram -> title positions
+        self._sizes = np.zeros(len(titles))  # trigram count of each normalized title
+
+        for position, title in enumerate(titles):
+            self._exact[normalize_title(title)].append(position)
+            for alias in title_aliases(title):
+                self._aliases[alias].append(position)
+            grams = trigrams(normalize_title(title))
+            self._sizes[position] = len(grams)
+            for gram in grams:
+                postings[gram].append(position)
+
+        self._postings = {gram: np.asarray(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    @classmethod
+    def from_csv(cls, path: str = CSV_FILE_PATH):
+        ids, titles, years = [], [], []
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for index, row in enumerate(reader):
+                ids.append(index)
+                titles.append(row[1])
+                years.append(row[2])
+        return cls(ids, titles, years, source=path)
+
+    def _candidate(self, position: int, score: float) -> dict:
+        return {
+            "id"            : int(self.ids[position]),
+            "Series_Title"  : self.titles[position],
+            "Released_Year" : self.years[position],
+            "match_score"   : round(float(score), 3),
+        }
+
+    def search(self, title: str, limit: int = 5) -> list:
+        """Returns candidates ranked by match score; 1.0 means an exact (normalized) title match."""
+        # Dice coefficient over trigrams, counted through the postings lists
+        query = trigrams(normalize_title(title))
+        postings = [self._postings[gram] for gram in query if gram in self._postings]
+        if postings:
+            overlap = np.bincount(np.concatenate(postings), minlength=len(self.titles))
+            scores = 2 * overlap / (len(query) + self._sizes)
+        else:
+            scores = np.zeros(len(self.titles))
+
+        for alias in title_aliases(title):
+            positions = self._aliases.get(alias, [])
+            scores[positions] = np.maximum(scores[positions], ALIAS_MATCH_SCORE)
+        scores[self._exact.get(normalize_title(title), [])] = 1.0
+
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [self._candidate(p, scores[p]) for p in order.tolist() if scores[p] >= MIN_MATCH_SCORE]
+
+
+# Shared instance --------------------------------------
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_title_index():
+    """Returns the title index, rebuilding it when the CSV changes, or None if it cannot be built."""
+    global _index
+    with _index_lock:
+        try:
+            mtime = os.path.getmtime(CSV_FILE_PATH)
+            if _index is None or _index.source_mtime != mtime:
+                _index = TitleIndex.from_csv(CSV_FILE_PATH)
+                _index.source_mtime = mtime
+        except Exception as e:
+            print(f"Title index unavailable: {e}")
+        return _index
@@ -0,0 +1,205 @@
+import os
+import json
+import threading
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+
+# Local quantized vector index --------------------------------------
+#
+# A file-backed copy of the top_movies collection for searching without a network
+# hop. Full-precision vectors are L2 normalized and saved as a float32 .npy file
+# that is memory mapped, so only the rows being rescored are read from disk. The
+# in-memory search runs on a quantized copy:
+#   - "int8":   scalar quantization, 4x smaller than float32
+#   - "binary": one sign bit per dimension, 32x smaller, Hamming distance
+#   - None:     exact search on the float32 vectors
+# The quantized search oversamples candidates, which are then rescored exactly.
+#
+# Search results are Qdrant ScoredPoints so the tools can use either backend.
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+VECTOR_INDEX_PATH = os.path.join(PROJECT_ROOT, "data", "vector_index")
+
+QUANTIZATION = "int8"  # "int8", "binary" or None
+RESCORE_FACTOR = 4     # Quantized candidates per requested result
+INT8_QUANTILE = 0.99   # Values beyond this quantile are clipped before quantizing
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorIndex:
+    def __init__(self, ids, vectors, payloads: list, quantization: str = QUANTIZATION, scale: float = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors        # Normalized float32, possibly memory mapped
+        self.payloads = payloads
+        self.quantization = quantization
+        self.dim = vectors.shape[1] if len(vectors) else 0
+
+        if quantization == "int8":
+            # One symmetric scale for every dimension, like Qdrant's scalar quantization
+            self.scale = scale or float(np.quantile(np.abs(vectors), INT8_QUANTILE)) or 1.0
+            self.codes = np.clip(np.round(vectors / self.scale * 127), -127, 127).astype(np.int8)
+        elif quantization == "binary":
+            self.scale = None
+            self.codes = np.packbits(vectors > 0, axis=1)
+        elif quantization is None:
+            self.scale = None
+            self.codes = None
+        else:
+            raise ValueError(f"Unknown quantization '{quantization}', use 'int8', 'binary' or None.")
+
+
+    # Construction --------------------------------------
+
+    @classmethod
+    def from_points(cls, points: list, quantization: str = QUANTIZATION):
+        ids = [int(point.id) for point in points]
+        vectors = _normalize(np.asarray([point.vector for point in points], dtype=np.float32))
+        return cls(ids, vectors, [point.payload or {} for point in points], quantization)
+
+    @classmethod
+    def from_collection(cls, client, collection_name: str = "top_movies", quantization: str = QUANTIZATION, batch_size: int = 256):
+        points, offset = [], None
+        while True:
+            batch, offset = client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            points.extend(batch)
+            if offset is None:
+                break
+        return cls.from_points(points, quantization)
+
+    def save(self, path: str = VECTOR_INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(path, "payloads.json"), "w", encoding="utf-8") as f:
+            json.dump(self.payloads, f, ensure_ascii=False)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": len(self.ids), "quantization": self.quantization, "scale": self.scale}, f)
+
+    @classmethod
+    def load(cls, path: str = VECTOR_INDEX_PATH, quantization: str = QUANTIZATION):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "payloads.json"), encoding="utf-8") as f:
+            payloads = json.load(f)
+        ids = np.load(os.path.join(path, "ids.npy"))
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scale = meta["scale"] if meta["quantization"] == quantization else None
+        return cls(ids, vectors, payloads, quantization, scale)
+
+
+    # Search --------------------------------------
+
+    def _quantized_candidates(self, query: np.ndarray, count: int, mask: np.ndarray = None) -> np.ndarray:
+        if self.quantization == "int8":
+            scores = self.codes @ np.round(query / self.scale * 127).astype(np.float32)
+        else:
+            # Fewer differing sign bits means a closer vector
+            query_bits = np.packbits(query > 0)
+            scores = -np.bitwise_count(np.bitwise_xor(self.codes, query_bits)).sum(axis=1, dtype=np.int32)
+
+        positions = np.arange(len(scores)) if mask is None else np.flatnonzero(mask)
+        if count >= len(positions):
+            return positions
+        return positions[np.argpartition(-scores[positions], count)[:count]]
+
+    def search_positions(self, query_vector, limit: int = 5, rescore: bool = True, mask: np.ndarray = None) -> tuple:
+        """Returns (positions, cosine scores) of the best matches, best first."""
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        limit = min(limit, len(self.ids))
+
+        if self.codes is None or not rescore:
+            candidates = np.arange(len(self.ids)) if mask is None else np.flatnonzero(mask)
+        else:
+            candidates = self._quantized_candidates(query, limit * RESCORE_FACTOR, mask)
+
+        # Exact rescoring only touches the candidate rows of the memory mapped file
+        candidates = np.sort(candidates)
+        scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        best = np.argsort(-scores, kind="stable")[:limit]
+        return candidates[best], scores[best]
+
+    def search(self, query_vector, limit: int = 5, query_filter: qm.Filter = None) -> list:
+        mask = None
+        if query_filter is not None:
+            mask = np.array([matches_filter(payload, query_filter) for payload in self.payloads], dtype=bool)
+
+        positions, scores = self.search_positions(query_vector, limit, mask=mask)
+        return [
+            qm.ScoredPoint(id=int(self.ids[position]), version=0, score=float(score), payload=self.payloads[position])
+            for position, score in zip(positions.tolist(), scores.tolist())
+        ]
+
+    def exact_search(self, query_vector, limit: int = 5) -> tuple:
+        return self.search_positions(query_vector, limit, rescore=False)
+
+    def memory_bytes(self) -> int:
+        # Resident search structures; the float32 file stays on disk
+        return self.codes.nbytes if self.codes is not None else np.asarray(self.vectors).nbytes
+
+
+# Payload filters --------------------------------------
+#
+# Only the filters built by the search tools are supported: must lists of keyword
+# FieldConditions with MatchValue or MatchAny, on scalar or array fields.
+
+def supports_filter(query_filter) -> bool:
+    if query_filter is None:
+        return True
+    if query_filter.should or query_filter.must_not or query_filter.min_should:
+        return False
+    return all(
+        isinstance(c, qm.FieldCondition) and isinstance(c.match, (qm.MatchValue, qm.MatchAny))
+        for c in query_filter.must or []
+    )
+
+
+def matches_filter(payload: dict, query_filter: qm.Filter) -> bool:
+    for condition in query_filter.must or []:
+        value = payload.get(condition.key)
+        values = set(value) if isinstance(value, list) else {value}
+        wanted = set(condition.match.any) if isinstance(condition.match, qm.MatchAny) else {condition.match.value}
+        if not values & wanted:
+            return False
+    return True
+
+
+# Shared instance --------------------------------------
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index(path: str = None):
+    """Returns the persisted index, or None when it has not been built yet."""
+    global _index
+    path = path or VECTOR_INDEX_PATH
+    if _index is None:
+        with _index_lock:
+            if _index is None and os.path.isfile(os.path.join(path, "meta.json")):
+                _index = LocalVectorIndex.load(path)
+    return _index
+
+
+def rebuild_vector_index(client, path: str = None, collection_name: str = "top_movies"):
+    """Rebuilds the index from the collection, persists it and swaps it in."""
+    global _index
+    path = path or VECTOR_INDEX_PATH
+    index = LocalVectorIndex.from_collection(client, collection_name)
+    index.save(path)
+    with _index_lock:
+        _index = LocalVectorIndex.load(path)
+    return _index
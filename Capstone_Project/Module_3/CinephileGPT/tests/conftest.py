@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the project packages (agents, db, utils) the way app.py does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from db import hybrid_search
+from db.local_engine import LocalMovieEngine, COLUMNS
+
+
+# Gross is missing for movies 1 and 3; ascending, MySQL would sort them first
+ROWS = [
+    [0, "Heat", 67436818],
+    [1, "Stalker", None],
+    [2, "Memento", 25544867],
+    [3, "Ikiru", None],
+    [4, "Oldboy", 707481],
+]
+
+
+@pytest.fixture
+def no_vector_hits(monkeypatch):
+    monkeypatch.setattr(hybrid_search, "vector_search_points", lambda text, limit: [])
+
+
+def fused_ids(**kwargs):
+    result = hybrid_search.hybrid_fused_search.invoke({"text_to_embed": "crime", "order_by": "Gross", **kwargs})
+    return [row["movie_id"] for row in json.loads(result)]
+
+
+def test_ascending_candidates_skip_missing_values_locally(monkeypatch, no_vector_hits):
+    rows = [[{"movie_id": i, "Series_Title": title, "Gross": gross}.get(name) for name in COLUMNS] for i, title, gross in ROWS]
+    engine = LocalMovieEngine.from_rows(COLUMNS, rows)
+    monkeypatch.setattr(hybrid_search, "get_local_engine", lambda: engine)
+
+    assert fused_ids(desc=False, pool_size=2, limit=2) == [4, 2]
+    assert fused_ids(desc=True, pool_size=2, limit=2) == [0, 2]
+
+
+def test_ascending_candidates_skip_missing_values_in_sql(monkeypatch, no_vector_hits):
+    queries = []
+
+    def fetch_rows(sql, params):
+        queries.append(sql)
+        rows = sorted((row for row in ROWS if row[2] is not None), key=lambda row: row[2])
+        return [{"movie_id": i, "Series_Title": title, "Gross": gross} for i, title, gross in rows[:params[-1]]]
+
+    monkeypatch.setattr(hybrid_search, "get_local_engine", lambda: None)
+    monkeypatch.setattr(hybrid_search, "fetch_rows", fetch_rows)
+
+    assert fused_ids(desc=False, pool_size=2, limit=2) == [4, 2]
+    assert "WHERE Gross IS NOT NULL ORDER BY Gross ASC" in queries[0]
@@ -0,0 +1,152 @@
+import pytest
+
+from db.query_builder import (
+    QueryBuildError, column, sort_order, limit_value, condition, not_null, parse_filter,
+    select_query, aggregate_query, distinct_query, prepared_cursor, forget_prepared
+)
+
+
+# Identifiers --------------------------------------
+
+def test_column_returns_canonical_spelling():
+    assert column("imdb_rating") == "IMDB_Rating"
+    assert column(" `Gross` ") == "Gross"
+
+
+@pytest.mark.parametrize("name", ["Rating", "Gross; DROP TABLE top_movies", "movie_id`--", ""])
+def test_column_rejects_unknown_names(name):
+    with pytest.raises(QueryBuildError):
+        column(name)
+
+
+def test_sort_order_accepts_bools_and_keywords():
+    assert sort_order(True) == "DESC"
+    assert sort_order(False) == "ASC"
+    assert sort_order(" asc ") == "ASC"
+    with pytest.raises(QueryBuildError):
+        sort_order("DESC; DELETE")
+
+
+@pytest.mark.parametrize("limit", [-1, "ten", None])
+def test_limit_value_rejects_bad_limits(limit):
+    with pytest.raises(QueryBuildError):
+        limit_value(limit)
+
+
+# Conditions --------------------------------------
+
+def test_condition_binds_the_value():
+    assert condition("genre", "like", "%Drama%") == ("Genre LIKE %s", ["%Drama%"])
+
+
+@pytest.mark.parametrize("operator", ["==", "OR 1=1 --", "NOT IN", "REGEXP"])
+def test_condition_rejects_unknown_operators(operator):
+    with pytest.raises(QueryBuildError):
+        condition("Genre", operator, "Drama")
+
+
+def test_not_null_condition_has_no_params():
+    assert not_null("gross") == ("Gross IS NOT NULL", [])
+
+
+def test_in_condition_expands_placeholders():
+    sql, params = condition("movie_id", "IN", [3, 1, 2, 9])
+    assert sql == "movie_id IN (%s, %s, %s, %s)"
+    assert params == [3, 1, 2, 9]
+    assert condition("movie_id", "IN", 7) == ("movie_id IN (%s)", [7])
+    assert condition("movie_id", "IN", []) == ("1 = 0", [])
+
+
+def test_in_lists_are_padded_to_shared_lengths():
+    sql, params = condition("movie_id", "IN", [3, 1, 2])
+    assert sql == "movie_id IN (%s, %s, %s, %s)"
+    assert params == [3, 1, 2, 2]
+    # Lists of similar length share one statement
+    assert condition("movie_id", "IN", list(range(9)))[0] == condition("movie_id", "IN", list(range(16)))[0]
+    assert len(condition("movie_id", "IN", list(range(65)))[1]) == 128
+
+
+def test_parse_filter_compares_or_matches_substrings():
+    assert parse_filter("IMDB_Rating", "> 8.0") == ("IMDB_Rating > %s", ["8.0"])
+    assert parse_filter("Certificate", "= 'PG-13'") == ("Certificate = %s", ["PG-13"])
+    assert parse_filter("Genre", "Horror") == ("Genre LIKE %s", ["%Horror%"])
+
+
+def test_parse_filter_never_puts_the_value_in_the_sql():
+    sql, params = parse_filter("Director", "Nolan' OR '1'='1")
+    assert sql == "Director LIKE %s"
+    assert params == ["%Nolan' OR '1'='1%"]
+
+
+# Statements --------------------------------------
+
+def test_select_query():
+    sql, params = select_query(
+        ["series_title", "gross"],
+        conditions=[condition("genre", "LIKE", "%Crime%"), condition("released_year", "<", 1990)],
+        order_by="gross",
+        desc=False,
+        limit="5"
+    )
+    assert sql == "SELECT Series_Title, Gross FROM top_movies WHERE Genre LIKE %s AND Released_Year < %s ORDER BY Gross ASC LIMIT %s"
+    assert params == ["%Crime%", 1990, 5]
+
+
+def test_select_query_checks_order_and_columns():
+    with pytest.raises(QueryBuildError):
+        select_query(order_by="Gross DESC, (SELECT 1)")
+    with pytest.raises(QueryBuildError):
+        select_query(["*"])
+
+
+def test_aggregate_query_whitelists_the_operation():
+    sql, params = aggregate_query("imdb_rating", "director", "avg", "desc", 10)
+    assert sql == "SELECT Director, AVG(IMDB_Rating) AS result FROM top_movies GROUP BY Director ORDER BY result DESC LIMIT %s"
+    assert params == [10]
+    with pytest.raises(QueryBuildError):
+        aggregate_query("IMDB_Rating", "Director", "SLEEP")
+
+
+def test_distinct_query():
+    assert distinct_query("genre") == ("SELECT DISTINCT Genre FROM top_movies", [])
+
+
+# Prepared statement cache --------------------------------------
+
+class FakeCursor:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.prepared = 0
+
+    def cursor(self, prepared=False):
+        self.prepared += prepared
+        return FakeCursor()
+
+
+def test_prepared_cursor_is_reused_per_statement():
+    conn = FakeConnection()
+    sql, _ = select_query(conditions=[condition("movie_id", "=", 1)])
+
+    first = prepared_cursor(conn, sql)
+    assert prepared_cursor(conn, sql) is first
+    assert prepared_cursor(conn, sql + " LIMIT %s") is not first
+    assert conn.prepared == 2
+
+
+def test_forget_prepared_closes_cursors():
+    conn = FakeConnection()
+    (_, kept), (_, dropped) = prepared_cursor(conn, "SELECT 1"), prepared_cursor(conn, "SELECT 2")
+
+    forget_prepared(conn, "SELECT 2")
+    assert dropped.closed and not kept.closed
+
+    forget_prepared(conn)
+    assert kept.closed
+    assert prepared_cursor(conn, "SELECT 1")[1] is not kept
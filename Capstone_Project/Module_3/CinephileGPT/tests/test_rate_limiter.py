@@ -0,0 +1,152 @@
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from utils import rate_limiter
+from utils.rate_limiter import TokenBucket, RateLimiter, DeadlineExceeded, turn_deadline, extend_deadline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+# Token bucket --------------------------------------
+
+def test_reserve_is_free_within_capacity():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60, now=bucket.updated) == 0.0
+    assert bucket.level == 0
+
+
+def test_reserve_returns_the_wait_for_the_deficit():
+    bucket = TokenBucket(per_minute=60) # One per second
+    bucket.reserve(60, now=bucket.updated)
+    assert bucket.reserve(3, now=bucket.updated) == pytest.approx(3.0)
+    # Reservations queue up behind each other
+    assert bucket.reserve(1, now=bucket.updated) == pytest.approx(4.0)
+
+
+def test_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(per_minute=60, capacity=10)
+    start = bucket.updated
+    bucket.reserve(10, now=start)
+    assert bucket.reserve(0, now=start + 4) == 0.0
+    assert bucket.level == pytest.approx(4)
+    bucket.reserve(0, now=start + 3600)
+    assert bucket.level == 10
+
+
+def test_oversized_requests_wait_for_a_full_bucket_only():
+    bucket = TokenBucket(per_minute=60, capacity=10)
+    assert bucket.reserve(500, now=bucket.updated) == 0.0
+    assert bucket.reserve(1, now=bucket.updated) == pytest.approx(1.0)
+
+
+def test_refund_is_capped_at_capacity():
+    bucket = TokenBucket(per_minute=60, capacity=10)
+    bucket.reserve(4, now=bucket.updated)
+    bucket.refund(100)
+    assert bucket.level == 10
+
+
+# Limiter --------------------------------------
+
+def test_settle_corrects_the_token_estimate(clock):
+    limiter = RateLimiter("test", rpm=600, tpm=6000)
+    limiter._reserve(1000)
+    assert limiter.tokens.level == 5000
+
+    limiter.settle(estimated=1000, actual=400)
+    assert limiter.tokens.level == 5600
+    limiter.settle(estimated=400, actual=900)
+    assert limiter.tokens.level == 5100
+
+
+def test_call_waits_for_the_budget(clock):
+    limiter = RateLimiter("test", rpm=60, tpm=1_000_000)
+    limiter.requests.level = 0
+
+    assert limiter.call(lambda: "done") == "done"
+    assert clock.slept == [pytest.approx(1.0)]
+    assert limiter.stats()["waits"] == 1
+
+
+def test_reservation_past_the_deadline_is_refunded(clock):
+    limiter = RateLimiter("test", rpm=60, tpm=60)
+    limiter.tokens.level = 0
+
+    with turn_deadline(5):
+        with pytest.raises(DeadlineExceeded):
+            limiter.call(lambda: "never", tokens=30) # 30 s wait
+    assert limiter.requests.level == 60
+    assert limiter.tokens.level == 0
+    assert limiter.stats()["calls"] == 0
+    assert clock.slept == []
+
+
+def test_no_deadline_outside_a_turn(clock):
+    limiter = RateLimiter("test", rpm=60, tpm=60)
+    limiter.tokens.level = 0
+    assert limiter.call(lambda: "done", tokens=30) == "done"
+    assert clock.slept == [pytest.approx(30.0)]
+
+
+def test_extend_deadline_moves_the_turn_deadline(clock):
+    limiter = RateLimiter("test", rpm=60, tpm=60)
+    limiter.tokens.level = 0
+
+    with turn_deadline(5):
+        extend_deadline(60)
+        assert limiter.call(lambda: "done", tokens=30) == "done"
+    extend_deadline(60) # No turn, nothing to extend
+    assert rate_limiter._deadline.get() is None
+
+
+def test_call_retries_transient_errors(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    limiter = RateLimiter("test", rpm=600, tpm=6000)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise connection_error()
+        return "done"
+
+    assert limiter.call(flaky) == "done"
+    assert clock.slept == [rate_limiter.BASE_DELAY, rate_limiter.BASE_DELAY * 2]
+    assert limiter.stats()["retries"] == 2
+
+
+def test_backoff_respects_the_deadline(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    limiter = RateLimiter("test", rpm=600, tpm=6000)
+
+    def failing():
+        raise connection_error()
+
+    with turn_deadline(rate_limiter.BASE_DELAY * 2):
+        with pytest.raises(DeadlineExceeded):
+            limiter.call(failing)
+    assert clock.slept == [rate_limiter.BASE_DELAY]
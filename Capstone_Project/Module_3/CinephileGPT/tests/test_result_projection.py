@@ -0,0 +1,68 @@
+import json
+
+from db.result_projection import MAX_TEXT_CHARS, with_notes, parse_result, parse_rows, project_rows, compact_tool_result, result_store
+from db.sql_database import jsonify_by_id, mysql_get_movies_by_ids, qdrant_get_posters
+
+
+ROWS = [{"movie_id": 1, "Series_Title": "The Godfather"}, {"movie_id": 6, "Series_Title": "Pulp Fiction"}]
+
+
+# Notes --------------------------------------
+
+def test_results_without_notes_stay_plain_lists():
+    rows_json = json.dumps(ROWS)
+    assert with_notes(rows_json) == rows_json
+
+
+def test_notes_are_kept_next_to_the_rows():
+    result = with_notes(json.dumps(ROWS), rows_total=1200)
+    assert parse_result(result) == (ROWS, {"rows_total": 1200})
+    assert parse_rows(result) == ROWS
+
+
+def test_missing_ids_are_not_rows():
+    result = jsonify_by_id([1, 4, 6], {row["movie_id"]: row for row in ROWS})
+    assert parse_rows(result) == ROWS
+
+    content, handle = compact_tool_result(result)
+    assert content.splitlines()[0].startswith(f"[{handle}: 2 rows, missing ids: [4],")
+    assert result_store.get(handle) == result
+
+
+def test_capped_results_report_the_total_in_the_header():
+    content, _ = compact_tool_result(with_notes(json.dumps(ROWS), rows_total=1200))
+    assert "2 rows of 1200 matching" in content.splitlines()[0]
+    assert "rows_total" not in content
+
+
+def test_errors_pass_through():
+    assert compact_tool_result("Failed to connect to the database.") == ("Failed to connect to the database.", "Failed to connect to the database.")
+
+
+# Projection --------------------------------------
+
+POSTER = "https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_UX67_CR0,0,67,98_AL_.jpg"
+FULL_ROWS = [
+    {"movie_id": 1, "Poster_Link": POSTER, "Series_Title": "The Godfather", "Released_Year": 1972, "Runtime": "175 min", "Overview": "x" * 400},
+]
+
+
+def test_wide_results_drop_rarely_needed_columns():
+    columns, rows = project_rows(FULL_ROWS)
+    assert columns == ["movie_id", "Series_Title", "Released_Year", "Overview"]
+    assert rows[0][-1] == "x" * MAX_TEXT_CHARS + "..."
+
+
+def test_kept_columns_survive_projection_untruncated():
+    columns, rows = project_rows(FULL_ROWS, max_text=40, keep=["poster_link"])
+    assert columns == ["movie_id", "Poster_Link", "Series_Title", "Released_Year", "Overview"]
+    assert rows[0][1] == POSTER
+
+
+def test_bulk_movie_tools_show_poster_links():
+    assert qdrant_get_posters.metadata["keep_columns"] == ["Poster_Link"]
+    assert mysql_get_movies_by_ids.metadata["keep_columns"] == ["Poster_Link"]
+
+    result = jsonify_by_id([1], {1: FULL_ROWS[0]})
+    content, _ = compact_tool_result(result, qdrant_get_posters.metadata["keep_columns"])
+    assert POSTER in content
@@ -0,0 +1,66 @@
+import mysql.connector
+import pytest
+
+from db import sql_database, query_builder, local_engine
+from db.connection_pool import ConnectionPool
+
+
+class FailingCursor:
+    def __init__(self, error):
+        self.error = error
+
+    def execute(self, *args):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+class FailingConnection:
+    def __init__(self, error):
+        self.error = error
+
+    def cursor(self, prepared=False):
+        return FailingCursor(self.error)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def use_connection(monkeypatch):
+    def install(error):
+        conn = FailingConnection(error)
+        monkeypatch.setattr(sql_database, "_pool", ConnectionPool(lambda: conn, max_size=1))
+        return conn
+    return install
+
+
+def test_fetch_rows_forgets_prepared_statements_on_connection_errors(use_connection):
+    conn = use_connection(mysql.connector.errors.OperationalError(msg="MySQL server has gone away"))
+    query_builder.prepared_cursor(conn, "SELECT 1") # Prepared by an earlier call
+
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        sql_database.fetch_rows("SELECT * FROM top_movies WHERE movie_id = %s", [1])
+    assert conn not in query_builder._prepared or not query_builder._prepared[conn]
+
+
+def test_run_query_separates_query_errors_from_connection_errors(use_connection):
+    use_connection(mysql.connector.errors.ProgrammingError(msg="You have an error in your SQL syntax"))
+    assert sql_database.run_query("SELEC 1").startswith("Error executing query:")
+
+    use_connection(mysql.connector.errors.InterfaceError(msg="Lost connection"))
+    assert sql_database.run_query("SELECT 1") == "Failed to connect to the database."
+
+
+def test_bulk_tools_report_query_errors_as_query_errors(use_connection, monkeypatch):
+    monkeypatch.setattr(local_engine, "LOCAL_ENGINE_ENABLED", False)
+
+    use_connection(mysql.connector.errors.ProgrammingError(msg="Unknown column"))
+    assert sql_database.mysql_get_movies_by_ids.invoke({"movie_ids": [1, 2]}).startswith("Error executing query:")
+
+    use_connection(mysql.connector.errors.OperationalError(msg="MySQL server has gone away"))
+    assert sql_database.qdrant_get_posters.invoke({"movie_ids": [1, 2]}) == "Failed to connect to the database."
@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from agents.tool_plan import ToolPlan, PlanStep, PlanError, MAX_PLAN_STEPS, plan_levels, references, resolve_reference, resolve_args
+from db.result_projection import with_notes
+
+
+TOOL_NAMES = {"qdrant_vector_search", "qdrant_get_id_by_title", "qdrant_similarity_by_id", "mysql_select_highest_blank", "hybrid_intersection_top_movies", "qdrant_get_posters"}
+
+
+def plan(*steps) -> ToolPlan:
+    return ToolPlan(steps=[PlanStep(id=step_id, tool=tool, args=args) for step_id, tool, args in steps])
+
+
+def level_ids(levels) -> list:
+    return [[step.id for step in level] for level in levels]
+
+
+# Validation --------------------------------------
+
+def test_independent_steps_share_a_level():
+    levels = plan_levels(plan(
+        ("s1", "qdrant_vector_search", {"text_to_embed": "mafia"}),
+        ("s2", "mysql_select_highest_blank", {"blank": "IMDB_Rating", "limit": 100}),
+        ("s3", "hybrid_intersection_top_movies", {"sql_json": "$s2", "qdrant_json": "$s1"}),
+        ("s4", "qdrant_get_posters", {"movie_ids": "$s3.movie_id"}),
+    ), TOOL_NAMES)
+    assert level_ids(levels) == [["s1", "s2"], ["s3"], ["s4"]]
+
+
+def test_steps_may_be_listed_out_of_order():
+    levels = plan_levels(plan(
+        ("s2", "qdrant_similarity_by_id", {"movie_id": "$s1.id[0]"}),
+        ("s1", "qdrant_get_id_by_title", {"title": "Inception"}),
+    ), TOOL_NAMES)
+    assert level_ids(levels) == [["s1"], ["s2"]]
+
+
+def test_empty_plan_has_no_levels():
+    assert plan_levels(ToolPlan(steps=[]), TOOL_NAMES) == []
+
+
+def test_unknown_tool_is_rejected():
+    with pytest.raises(PlanError, match="unknown tool"):
+        plan_levels(plan(("s1", "mysql_drop_table", {})), TOOL_NAMES)
+
+
+def test_duplicate_step_ids_are_rejected():
+    with pytest.raises(PlanError, match="unique"):
+        plan_levels(plan(("s1", "qdrant_vector_search", {}), ("s1", "qdrant_vector_search", {})), TOOL_NAMES)
+
+
+def test_too_many_steps_are_rejected():
+    steps = [(f"s{i}", "qdrant_vector_search", {}) for i in range(MAX_PLAN_STEPS + 1)]
+    with pytest.raises(PlanError, match="at most"):
+        plan_levels(plan(*steps), TOOL_NAMES)
+
+
+@pytest.mark.parametrize("reference", ["$s9", "$s1.id[0]"])
+def test_unknown_and_self_references_are_rejected(reference):
+    with pytest.raises(PlanError, match="unknown steps"):
+        plan_levels(plan(("s1", "qdrant_similarity_by_id", {"movie_id": reference})), TOOL_NAMES)
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(PlanError, match="cycle"):
+        plan_levels(plan(
+            ("s1", "qdrant_similarity_by_id", {"movie_id": "$s2.id[0]"}),
+            ("s2", "qdrant_similarity_by_id", {"movie_id": "$s3.id[0]"}),
+            ("s3", "qdrant_similarity_by_id", {"movie_id": "$s1.id[0]"}),
+        ), TOOL_NAMES)
+
+
+def test_references_are_found_in_nested_arguments():
+    args = {"movie_ids": ["$s1.id[0]", "$s2.movie_id[1]", 7], "filter": {"sql": "$s3"}, "text": "costs $5"}
+    assert references(args) == {"s1", "s2", "s3"}
+
+
+# Resolution --------------------------------------
+
+SQL_RESULT = json.dumps([
+    {"movie_id": 1, "Series_Title": "The Godfather", "IMDB_Rating": 9.2},
+    {"movie_id": 6, "Series_Title": "Pulp Fiction", "IMDB_Rating": 8.9},
+    {"movie_id": 8, "Series_Title": "Inception", "IMDB_Rating": None},
+])
+QDRANT_RESULT = json.dumps([
+    {"id": 8, "score": 0.91, "payload": {"Series_Title": "Inception"}},
+    {"id": 21, "score": 0.88, "payload": {"Series_Title": "Interstellar"}},
+])
+
+
+def test_whole_result_reference():
+    assert resolve_reference("$s1", {"s1": SQL_RESULT}) == SQL_RESULT
+
+
+def test_field_reference_lists_every_row_and_skips_missing_values():
+    assert resolve_reference("$s1.movie_id", {"s1": SQL_RESULT}) == [1, 6, 8]
+    assert resolve_reference("$s1.IMDB_Rating", {"s1": SQL_RESULT}) == [9.2, 8.9]
+
+
+def test_indexed_field_reference():
+    results = {"s1": SQL_RESULT}
+    assert resolve_reference("$s1.Series_Title[1]", results) == "Pulp Fiction"
+    assert resolve_reference("$s1.movie_id[-1]", results) == 8
+
+
+def test_id_fields_are_interchangeable():
+    results = {"s1": SQL_RESULT, "s2": QDRANT_RESULT}
+    assert resolve_reference("$s2.movie_id", results) == [8, 21]
+    assert resolve_reference("$s1.id[0]", results) == 1
+    # Qdrant payload fields are flattened
+    assert resolve_reference("$s2.Series_Title[1]", results) == "Interstellar"
+
+
+def test_capped_results_resolve_to_their_rows():
+    capped = with_notes(SQL_RESULT, rows_total=1200)
+    assert resolve_reference("$s1.movie_id", {"s1": capped}) == [1, 6, 8]
+
+
+def test_index_out_of_range():
+    with pytest.raises(PlanError, match=r"there is no \[5\]"):
+        resolve_reference("$s1.movie_id[5]", {"s1": SQL_RESULT})
+
+
+def test_field_of_a_failed_step():
+    with pytest.raises(PlanError, match="did not return rows"):
+        resolve_reference("$s1.movie_id[0]", {"s1": "Failed to connect to the database."})
+
+
+def test_resolve_args_replaces_references_only():
+    results = {"s1": SQL_RESULT, "s2": QDRANT_RESULT}
+    args = {"movie_ids": ["$s1.movie_id[0]", "$s2.id[1]"], "sql_json": "$s1", "title": "$5 movies", "limit": 5}
+    assert resolve_args(args, results) == {"movie_ids": [1, 21], "sql_json": SQL_RESULT, "title": "$5 movies", "limit": 5}
+
+
+# Structured output schema --------------------------------------
+
+def _objects(schema):
+    if isinstance(schema, dict):
+        if schema.get("type") == "object":
+            yield schema
+        for value in schema.values():
+            yield from _objects(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            yield from _objects(value)
+
+
+def test_plan_schema_is_accepted_by_strict_structured_outputs():
+    # Strict mode requires every object to be closed, free-form dicts are rejected with a 400
+    from openai.lib._pydantic import to_strict_json_schema
+
+    schema = to_strict_json_schema(ToolPlan)
+    for obj in _objects(schema):
+        assert obj.get("additionalProperties") is False
+        assert set(obj.get("required", [])) == set(obj.get("properties", {}))
+
+
+def test_step_arguments_arrive_as_json():
+    step = PlanStep(id="s2", tool="qdrant_similarity_by_id", args_json='{"movie_id": "$s1.id[0]", "limit": 5}')
+    assert step.args == {"movie_id": "$s1.id[0]", "limit": 5}
+    assert PlanStep(id="s1", tool="qdrant_vector_search", args={"limit": 5}).args == {"limit": 5}
+
+
+@pytest.mark.parametrize("args_json", ['{"movie_id": ', '["$s1"]'])
+def test_invalid_step_arguments_reject_the_plan(args_json):
+    with pytest.raises(PlanError, match="s1"):
+        plan_levels(ToolPlan(steps=[PlanStep(id="s1", tool="qdrant_vector_search", args_json=args_json)]), TOOL_NAMES)
@@ -0,0 +1,183 @@
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+from utils.logger import log
+from utils.tracing import span
+
+
+# Client-side rate limiting --------------------------------------
+#
+# Every LLM and embedding call takes a request and an estimated number of tokens
+# from a shared token bucket sized from the requests-per-minute and
+# tokens-per-minute budgets, so concurrent Streamlit sessions queue up smoothly
+# instead of all hitting the API's limit at once. Calls that still fail with a
+# rate limit or a transient error are retried with exponential backoff and full
+# jitter, and no call waits past the deadline of the current turn.
+#
+# Time spent waiting is recorded on a "rate_limiter.wait" span and in stats().
+
+
+LLM_RPM = 500
+LLM_TPM = 30_000
+EMBEDDING_RPM = 3_000
+EMBEDDING_TPM = 1_000_000
+
+MAX_RETRIES = 6
+BASE_DELAY = 1.0   # Seconds, doubled on every retry
+MAX_DELAY = 30.0
+TURN_DEADLINE = 120 # Seconds a whole agent turn may spend, waits included
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_deadline = contextvars.ContextVar("turn_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when waiting for the limiter or a retry would run past the turn deadline."""
+
+
+@contextmanager
+def turn_deadline(seconds: float = TURN_DEADLINE):
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def extend_deadline(seconds: float):
+    # Time the turn spent waiting on its caller, e.g. between streamed events, isn't turn time
+    deadline = _deadline.get()
+    if deadline is not None:
+        _deadline.set(deadline + seconds)
+
+
+def _check_deadline(wait: float, what: str):
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() + wait > deadline:
+        raise DeadlineExceeded(f"{what} would exceed the turn deadline")
+
+
+def estimate_tokens(value) -> int:
+    # About four characters per token, good enough for budgeting
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(item) for item in value)
+    return len(str(getattr(value, "content", value))) // 4 + 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        # Takes the amount now, possibly going negative, and returns how long to wait
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.retries = 0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            try:
+                _check_deadline(wait, f"Waiting {wait:.1f}s for the {self.name} rate limit")
+            except DeadlineExceeded:
+                self.requests.refund(1)
+                self.tokens.refund(tokens)
+                raise
+            self.calls += 1
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def settle(self, estimated: int, actual: int):
+        # Corrects the token bucket once the real usage is known
+        with self._lock:
+            self.tokens.refund(estimated - actual)
+
+
+    # Calls --------------------------------------
+
+    def _backoff(self, attempt: int, error) -> float:
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        _check_deadline(delay, f"Retrying {self.name} after {type(error).__name__}")
+        with self._lock:
+            self.retries += 1
+        log(f"{self.name} call failed ({type(error).__name__}), retrying in {delay:.1f} seconds...")
+        return delay
+
+    def call(self, fn, tokens: int = 1):
+        """Runs fn() once the budget allows it, retrying transient errors with backoff."""
+        for attempt in range(MAX_RETRIES + 1):
+            wait = self._reserve(tokens)
+            if wait > 0:
+                with span("rate_limiter.wait", limiter=self.name, wait_ms=round(wait * 1000, 1)):
+                    time.sleep(wait)
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def acall(self, fn, tokens: int = 1):
+        """Async version of call(); fn() returns an awaitable."""
+        for attempt in range(MAX_RETRIES + 1):
+            wait = self._reserve(tokens)
+            if wait > 0:
+                with span("rate_limiter.wait", limiter=self.name, wait_ms=round(wait * 1000, 1)):
+                    await asyncio.sleep(wait)
+            try:
+                return await fn()
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls"           : self.calls,
+                "waits"           : self.waits,
+                "wait_seconds"    : round(self.wait_seconds, 3),
+                "max_wait_seconds": round(self.max_wait, 3),
+                "retries"         : self.retries,
+            }
+
+
+# Shared limiters for the OpenAI chat and embedding endpoints
+llm_limiter = RateLimiter("llm", LLM_RPM, LLM_TPM)
+embedding_limiter = RateLimiter("embeddings", EMBEDDING_RPM, EMBEDDING_TPM)
+
+
+def limiter_metrics() -> dict:
+    return {limiter.name: limiter.stats() for limiter in (llm_limiter, embedding_limiter)}
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Turn-level latency tracing --------------------------------------
+#
+# Spans are opened around graph nodes, LLM calls, embeddings, Qdrant searches and
+# MySQL queries. Each span records its duration, parent and attributes such as
+# token counts or payload sizes. Finished spans are appended to a local JSONL file
+# and kept in memory per turn so the Streamlit sidebar can draw a waterfall.
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+TRACE_FILE_PATH = os.path.join(PROJECT_ROOT, "logs", "traces.jsonl")
+
+TRACE_EXPORT_ENABLED = True
+MAX_TURNS_IN_MEMORY = 50
+
+_current_turn = contextvars.ContextVar("trace_turn", default=None)
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+_turns = OrderedDict() # turn_id -> list of finished spans
+_lock = threading.Lock()
+
+
+# Exporters --------------------------------------
+
+def _export(record: dict):
+    if not TRACE_EXPORT_ENABLED:
+        return
+    try:
+        os.makedirs(os.path.dirname(TRACE_FILE_PATH), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with _lock:
+            with open(TRACE_FILE_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        print(f"Trace export failed: {e}")
+
+
+def _store(record: dict):
+    turn_id = record["turn_id"]
+    if turn_id is None:
+        return
+    with _lock:
+        _turns.setdefault(turn_id, []).append(record)
+        _turns.move_to_end(turn_id)
+        while len(_turns) > MAX_TURNS_IN_MEMORY:
+            _turns.popitem(last=False)
+
+
+# Spans --------------------------------------
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block. The yielded dict's "attributes" can be updated
+    inside the block, e.g. with token counts once a response arrives.
+    """
+    parent = _current_span.get()
+    record = {
+        "span_id"   : uuid.uuid4().hex[:16],
+        "parent_id" : parent["span_id"] if parent else None,
+        "turn_id"   : _current_turn.get(),
+        "name"      : name,
+        "start"     : time.time(),
+        "attributes": dict(attributes),
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["attributes"]["error"] = repr(e)
+        raise
+    finally:
+        record["duration_ms"] = (time.perf_counter() - started) * 1000 - record.get("paused_ms", 0.0)
+        _current_span.reset(token)
+        _store(record)
+        _export(record)
+
+
+@contextmanager
+def start_turn(turn_id: str = None, **attributes):
+    """Opens the root span of an agent turn; every span inside it shares the turn id."""
+    turn_id = turn_id or uuid.uuid4().hex
+    token = _current_turn.set(turn_id)
+    try:
+        with span("turn", **attributes):
+            yield turn_id
+    finally:
+        _current_turn.reset(token)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def exclude_from_span(record: dict, seconds: float):
+    """Leaves time spent outside the traced work, e.g. a caller rendering streamed output, out of the span's duration."""
+    record["paused_ms"] = record.get("paused_ms", 0.0) + seconds * 1000
+
+
+def traced(name: str):
+    """Decorator that wraps a sync or async function in a span."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(record: dict, messages, response):
+    # Token counts come from the provider usage metadata when available
+    usage = getattr(response, "usage_metadata", None) or {}
+    record["attributes"].update({
+        "input_messages": len(messages),
+        "input_chars"   : sum(len(str(getattr(m, "content", ""))) for m in messages),
+        "input_tokens"  : usage.get("input_tokens"),
+        "output_tokens" : usage.get("output_tokens"),
+        "tool_calls"    : len(getattr(response, "tool_calls", None) or []),
+    })
+
+
+# Reading traces --------------------------------------
+
+def get_turn_spans(turn_id: str) -> list:
+    with _lock:
+        return sorted(_turns.get(turn_id, []), key=lambda r: r["start"])
+
+
+def format_waterfall(spans: list, width: int = 20) -> str:
+    """Renders a turn's spans as a text waterfall: name, offset bar and duration."""
+    if not spans:
+        return "No spans recorded."
+
+    turn_start = min(r["start"] for r in spans)
+    total_ms = max((r["start"] - turn_start) * 1000 + r["duration_ms"] for r in spans) or 1
+
+    depth = {}
+    by_id = {r["span_id"]: r for r in spans}
+    def get_depth(record):
+        if record["span_id"] not in depth:
+            parent = by_id.get(record["parent_id"])
+            depth[record["span_id"]] = get_depth(parent) + 1 if parent else 0
+        return depth[record["span_id"]]
+
+    lines = []
+    for record in spans:
+        offset = int((record["start"] - turn_start) * 1000 / total_ms * width)
+        length = max(1, int(record["duration_ms"] / total_ms * width))
+        bar = (" " * offset + "█" * length)[:width].ljust(width)
+        label = ("  " * get_depth(record) + record["name"])[:22].ljust(22)
+        lines.append(f"{label} |{bar}| {record['duration_ms']:8.1f} ms")
+
+    return "\n".join(lines)